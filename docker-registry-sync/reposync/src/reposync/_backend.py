@@ -0,0 +1,322 @@
+from enum import Enum
+from typing import Awaitable, Protocol, TypeVar
+
+from pydantic import SecretStr
+
+from . import _crane, _registry, _tracing
+from ._blob_store import BlobStats
+from ._cache import CacheStats, get_digests_concurrently, get_registry_url
+from ._models import DockerTag, RegistryImage
+from ._rate_limit import RegistryLimiter, RegistryRateLimitedError, run_limited
+
+_T = TypeVar("_T")
+
+
+class Backend(str, Enum):
+    CRANE = "crane"
+    NATIVE = "native"
+
+
+class RegistryBackend(Protocol):
+    """operations required to sync images, implemented by ``_crane`` and ``_registry``"""
+
+    async def login(
+        self, registry_url: str, username: str, password: SecretStr
+    ) -> None: ...
+
+    async def get_digest(
+        self, image: RegistryImage, *, skip_tls_verify: bool
+    ) -> str | None: ...
+
+    async def get_digests(
+        self, repository: RegistryImage, tags: list[DockerTag], *, skip_tls_verify: bool
+    ) -> dict[RegistryImage, str | None]: ...
+
+    async def get_image_tags(
+        self, image: RegistryImage, *, skip_tls_verify: bool
+    ) -> list[str]: ...
+
+    async def get_image_size(
+        self, image: RegistryImage, *, skip_tls_verify: bool
+    ) -> int | None: ...
+
+    async def copy(
+        self,
+        source: RegistryImage,
+        destination: RegistryImage,
+        *,
+        src_skip_tls_verify: bool,
+        dst_skip_tls_verify: bool,
+    ) -> None: ...
+
+    async def copy_to_many(
+        self,
+        source: RegistryImage,
+        destinations: dict[RegistryImage, bool],
+        *,
+        src_skip_tls_verify: bool,
+    ) -> dict[RegistryImage, BaseException]: ...
+
+    async def clear_cache(self) -> None: ...
+
+    async def invalidate(self, image: RegistryImage) -> None: ...
+
+    def get_cache_stats(self) -> CacheStats: ...
+
+    def get_blob_stats(self) -> BlobStats | None: ...
+
+    async def close(self) -> None: ...
+
+
+_BACKENDS: dict[Backend, RegistryBackend] = {
+    Backend.CRANE: _crane,
+    Backend.NATIVE: _registry,
+}
+
+
+def get_backend(backend: Backend) -> RegistryBackend:
+    return _BACKENDS[backend]
+
+
+class RateLimitedBackend:
+    """Wraps a ``RegistryBackend`` applying the ``RegistryLimiter`` of every
+    registry an operation talks to (keyed by registry url).
+
+    Operations on registries without a limiter are not bounded. Digests of
+    many tags are looked up one by one on registries with a limiter.
+    """
+
+    def __init__(self, backend: RegistryBackend, limiters: dict[str, RegistryLimiter]):
+        self._backend = backend
+        self._limiters = limiters
+
+    def _get_limiters(self, *images: RegistryImage) -> list[RegistryLimiter]:
+        # NOTE: sorted, slots of several registries are always taken in the same order
+        registry_urls = sorted({get_registry_url(image) for image in images})
+        return [self._limiters[u] for u in registry_urls if u in self._limiters]
+
+    async def login(
+        self, registry_url: str, username: str, password: SecretStr
+    ) -> None:
+        await self._backend.login(registry_url, username, password)
+
+    async def get_digest(
+        self, image: RegistryImage, *, skip_tls_verify: bool
+    ) -> str | None:
+        return await run_limited(
+            self._get_limiters(image),
+            lambda: self._backend.get_digest(image, skip_tls_verify=skip_tls_verify),
+        )
+
+    async def get_digests(
+        self, repository: RegistryImage, tags: list[DockerTag], *, skip_tls_verify: bool
+    ) -> dict[RegistryImage, str | None]:
+        if not self._get_limiters(repository):
+            return await self._backend.get_digests(
+                repository, tags, skip_tls_verify=skip_tls_verify
+            )
+        # NOTE: every lookup takes its own slots, one slot held by the bulk
+        # lookup of the backend would let all of its requests run at once
+        return await get_digests_concurrently(
+            self.get_digest,
+            repository,
+            tags,
+            skip_tls_verify=skip_tls_verify,
+            limit=None,
+        )
+
+    async def get_image_tags(
+        self, image: RegistryImage, *, skip_tls_verify: bool
+    ) -> list[str]:
+        return await run_limited(
+            self._get_limiters(image),
+            lambda: self._backend.get_image_tags(
+                image, skip_tls_verify=skip_tls_verify
+            ),
+        )
+
+    async def get_image_size(
+        self, image: RegistryImage, *, skip_tls_verify: bool
+    ) -> int | None:
+        return await run_limited(
+            self._get_limiters(image),
+            lambda: self._backend.get_image_size(
+                image, skip_tls_verify=skip_tls_verify
+            ),
+        )
+
+    async def copy(
+        self,
+        source: RegistryImage,
+        destination: RegistryImage,
+        *,
+        src_skip_tls_verify: bool,
+        dst_skip_tls_verify: bool,
+    ) -> None:
+        await run_limited(
+            self._get_limiters(source, destination),
+            lambda: self._backend.copy(
+                source,
+                destination,
+                src_skip_tls_verify=src_skip_tls_verify,
+                dst_skip_tls_verify=dst_skip_tls_verify,
+            ),
+        )
+
+    async def copy_to_many(
+        self,
+        source: RegistryImage,
+        destinations: dict[RegistryImage, bool],
+        *,
+        src_skip_tls_verify: bool,
+    ) -> dict[RegistryImage, BaseException]:
+        remaining = dict(destinations)
+        failures: dict[RegistryImage, BaseException] = {}
+
+        async def _copy_to_remaining() -> None:
+            result = await self._backend.copy_to_many(
+                source, remaining, src_skip_tls_verify=src_skip_tls_verify
+            )
+            for destination in list(remaining):
+                failures.pop(destination, None)
+                if (error := result.get(destination)) is not None:
+                    failures[destination] = error
+                if not isinstance(error, RegistryRateLimitedError):
+                    del remaining[destination]
+            if remaining:
+                # only the throttled destinations are copied again
+                raise failures[next(iter(remaining))]
+
+        try:
+            await run_limited(
+                self._get_limiters(source, *destinations), _copy_to_remaining
+            )
+        except RegistryRateLimitedError as e:
+            if not any(failures.get(d) is e for d in remaining):
+                # the source was throttled
+                raise
+        return failures
+
+    async def clear_cache(self) -> None:
+        await self._backend.clear_cache()
+
+    async def invalidate(self, image: RegistryImage) -> None:
+        await self._backend.invalidate(image)
+
+    def get_cache_stats(self) -> CacheStats:
+        return self._backend.get_cache_stats()
+
+    def get_blob_stats(self) -> BlobStats | None:
+        return self._backend.get_blob_stats()
+
+    async def close(self) -> None:
+        await self._backend.close()
+
+
+class TracingBackend:
+    """Wraps a ``RegistryBackend`` recording a span for each registry operation."""
+
+    def __init__(self, backend: RegistryBackend):
+        self._backend = backend
+
+    async def _traced(self, name: str, call: Awaitable[_T], **attributes: str) -> _T:
+        with _tracing.span(name, **attributes):
+            return await call
+
+    async def login(
+        self, registry_url: str, username: str, password: SecretStr
+    ) -> None:
+        await self._traced(
+            "registry login",
+            self._backend.login(registry_url, username, password),
+            registry=registry_url,
+        )
+
+    async def get_digest(
+        self, image: RegistryImage, *, skip_tls_verify: bool
+    ) -> str | None:
+        return await self._traced(
+            "registry get_digest",
+            self._backend.get_digest(image, skip_tls_verify=skip_tls_verify),
+            image=image,
+        )
+
+    async def get_digests(
+        self, repository: RegistryImage, tags: list[DockerTag], *, skip_tls_verify: bool
+    ) -> dict[RegistryImage, str | None]:
+        return await self._traced(
+            "registry get_digests",
+            self._backend.get_digests(
+                repository, tags, skip_tls_verify=skip_tls_verify
+            ),
+            repository=repository,
+        )
+
+    async def get_image_tags(
+        self, image: RegistryImage, *, skip_tls_verify: bool
+    ) -> list[str]:
+        return await self._traced(
+            "registry get_image_tags",
+            self._backend.get_image_tags(image, skip_tls_verify=skip_tls_verify),
+            image=image,
+        )
+
+    async def get_image_size(
+        self, image: RegistryImage, *, skip_tls_verify: bool
+    ) -> int | None:
+        return await self._traced(
+            "registry get_image_size",
+            self._backend.get_image_size(image, skip_tls_verify=skip_tls_verify),
+            image=image,
+        )
+
+    async def copy(
+        self,
+        source: RegistryImage,
+        destination: RegistryImage,
+        *,
+        src_skip_tls_verify: bool,
+        dst_skip_tls_verify: bool,
+    ) -> None:
+        await self._traced(
+            "registry copy",
+            self._backend.copy(
+                source,
+                destination,
+                src_skip_tls_verify=src_skip_tls_verify,
+                dst_skip_tls_verify=dst_skip_tls_verify,
+            ),
+            source=source,
+            destination=destination,
+        )
+
+    async def copy_to_many(
+        self,
+        source: RegistryImage,
+        destinations: dict[RegistryImage, bool],
+        *,
+        src_skip_tls_verify: bool,
+    ) -> dict[RegistryImage, BaseException]:
+        return await self._traced(
+            "registry copy_to_many",
+            self._backend.copy_to_many(
+                source, destinations, src_skip_tls_verify=src_skip_tls_verify
+            ),
+            source=source,
+            destinations=", ".join(sorted(destinations)),
+        )
+
+    async def clear_cache(self) -> None:
+        await self._backend.clear_cache()
+
+    async def invalidate(self, image: RegistryImage) -> None:
+        await self._backend.invalidate(image)
+
+    def get_cache_stats(self) -> CacheStats:
+        return self._backend.get_cache_stats()
+
+    def get_blob_stats(self) -> BlobStats | None:
+        return self._backend.get_blob_stats()
+
+    async def close(self) -> None:
+        await self._backend.close()
@@ -0,0 +1,146 @@
+"""Local content-addressed store for image blobs, shared between runs."""
+
+import asyncio
+import contextlib
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Callable, Final
+
+from pydantic import NonNegativeInt
+
+_BLOBS_DIR_NAME: Final[str] = "blobs"
+_PARTIAL_SUFFIX: Final[str] = ".partial"
+
+_logger = logging.getLogger(__name__)
+
+
+class BlobDigestMismatchError(RuntimeError):
+    def __init__(self, expected: str, received: str):
+        super().__init__(f"Blob content has digest '{received}', expected '{expected}'")
+
+
+@dataclass
+class BlobStats:
+    from_cache: int = 0
+    from_network: int = 0
+    evicted: int = 0
+
+    def since(self, previous: "BlobStats") -> "BlobStats":
+        """bytes counted after ``previous`` was taken"""
+        return BlobStats(
+            from_cache=self.from_cache - previous.from_cache,
+            from_network=self.from_network - previous.from_network,
+            evicted=self.evicted - previous.evicted,
+        )
+
+
+def _get_file_name(digest: str) -> str:
+    return digest.replace(":", "-")
+
+
+class BlobStore:
+    """Blobs stored by digest inside ``directory``, capped to ``max_bytes``.
+
+    The least recently used blobs are removed once the cap is exceeded. Usage
+    is tracked via the file modification time, so the order survives restarts.
+    Blobs currently in use are never removed.
+    """
+
+    def __init__(self, directory: Path, *, max_bytes: NonNegativeInt):
+        self.directory = directory / _BLOBS_DIR_NAME
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.stats = BlobStats()
+
+        self._sizes: OrderedDict[str, int] = OrderedDict()
+        self._in_use: dict[str, int] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+
+        for path in self.directory.glob(f"*{_PARTIAL_SUFFIX}"):
+            # left behind by an interrupted download
+            path.unlink(missing_ok=True)
+        files = sorted(
+            (entry.stat().st_mtime, entry.name, entry.stat().st_size)
+            for entry in os.scandir(self.directory)
+        )
+        for _, file_name, size in files:
+            self._sizes[file_name] = size
+
+    @property
+    def size(self) -> int:
+        return sum(self._sizes.values())
+
+    def _get_path(self, digest: str) -> Path:
+        return self.directory / _get_file_name(digest)
+
+    def _touch(self, file_name: str) -> None:
+        self._sizes.move_to_end(file_name)
+        os.utime(self.directory / file_name)
+
+    async def _download(
+        self, digest: str, chunks: AsyncIterator[bytes], path: Path
+    ) -> int:
+        algorithm, _, expected = digest.partition(":")
+        hasher = hashlib.new(algorithm)
+        partial_path = path.with_name(f"{path.name}{_PARTIAL_SUFFIX}")
+        size = 0
+        try:
+            with partial_path.open("wb") as file:
+                async for chunk in chunks:
+                    hasher.update(chunk)
+                    file.write(chunk)
+                    size += len(chunk)
+            if hasher.hexdigest() != expected:
+                raise BlobDigestMismatchError(
+                    digest, f"{algorithm}:{hasher.hexdigest()}"
+                )
+            partial_path.replace(path)
+        finally:
+            partial_path.unlink(missing_ok=True)
+        return size
+
+    def _evict(self) -> None:
+        total = self.size
+        for file_name in list(self._sizes):
+            if total <= self.max_bytes:
+                break
+            if file_name in self._in_use:
+                continue
+            size = self._sizes.pop(file_name)
+            (self.directory / file_name).unlink(missing_ok=True)
+            self.stats.evicted += size
+            total -= size
+            _logger.debug("evicted blob '%s' (%s bytes)", file_name, size)
+
+    @contextlib.asynccontextmanager
+    async def blob(
+        self, digest: str, fetch: Callable[[], AsyncIterator[bytes]]
+    ) -> AsyncIterator[Path]:
+        """Provides the path to the content of ``digest``.
+
+        When it is not stored yet, ``fetch()`` is called once (also when
+        requested concurrently) and its verified content is stored.
+        The path stays valid until the context is left.
+        """
+        file_name = _get_file_name(digest)
+        self._in_use[file_name] = self._in_use.get(file_name, 0) + 1
+        try:
+            async with self._locks.setdefault(file_name, asyncio.Lock()):
+                if file_name in self._sizes:
+                    self._touch(file_name)
+                    self.stats.from_cache += self._sizes[file_name]
+                else:
+                    size = await self._download(digest, fetch(), self._get_path(digest))
+                    self._sizes[file_name] = size
+                    self.stats.from_network += size
+            yield self._get_path(digest)
+        finally:
+            self._in_use[file_name] -= 1
+            if self._in_use[file_name] == 0:
+                del self._in_use[file_name]
+                self._locks.pop(file_name, None)
+            self._evict()
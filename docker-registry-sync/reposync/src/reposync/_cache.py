@@ -0,0 +1,141 @@
+"""Helpers shared by the (``@cached()``) registry calls of all backends."""
+
+import asyncio
+import contextlib
+import functools
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, TypeVar
+
+from aiocache.plugins import BasePlugin
+
+from ._models import DockerTag, RegistryImage
+from ._rate_limit import RegistryRateLimitedError
+
+_logger = logging.getLogger(__name__)
+
+_F = TypeVar("_F", bound=Callable[..., Awaitable[Any]])
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    # misses which waited for the same call already running
+    coalesced: int = 0
+
+    def since(self, previous: "CacheStats") -> "CacheStats":
+        """counts which happened after ``previous`` was taken"""
+        return CacheStats(
+            hits=self.hits - previous.hits,
+            misses=self.misses - previous.misses,
+            evictions=self.evictions - previous.evictions,
+            coalesced=self.coalesced - previous.coalesced,
+        )
+
+
+class StatsPlugin(BasePlugin):
+    """counts cache hits and misses into ``stats``"""
+
+    def __init__(self, stats: CacheStats):
+        self.stats = stats
+
+    async def post_get(self, client, key, ret=None, **kwargs) -> None:
+        if ret is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+
+
+def image_key(func: Callable, image: RegistryImage, **kwargs: Any) -> str:
+    """entries are only keyed by image so they can be evicted per image"""
+    return f"{func.__name__}:{image}"
+
+
+def coalesce(stats: CacheStats) -> Callable[[_F], _F]:
+    """Concurrent calls for the same image (see ``image_key``) share one call
+    of the decorated function, placed below ``@cached()`` the misses of many
+    tasks needing the same digest only run one lookup.
+
+    The shared call keeps running when a caller is cancelled.
+    """
+
+    def _decorator(func: _F) -> _F:
+        in_flight: dict[str, asyncio.Future] = {}
+
+        @functools.wraps(func)
+        async def _wrapper(image: RegistryImage, **kwargs: Any) -> Any:
+            key = image_key(func, image)
+            if (future := in_flight.get(key)) is not None:
+                stats.coalesced += 1
+            else:
+                future = in_flight[key] = asyncio.ensure_future(func(image, **kwargs))
+                future.add_done_callback(lambda _: in_flight.pop(key, None))
+                # NOTE: retrieved here, callers which were cancelled never do
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            return await asyncio.shield(future)
+
+        return _wrapper  # type: ignore[return-value]
+
+    return _decorator
+
+
+def get_registry_url(image: RegistryImage) -> str:
+    """``host:port/some/repo:tag`` -> ``host:port``"""
+    return image.split("/", 1)[0]
+
+
+def is_foreign(descriptor: dict[str, Any]) -> bool:
+    """foreign (non-distributable) layers are only referenced, never copied"""
+    media_type: str = descriptor.get("mediaType", "")
+    return "foreign" in media_type or "nondistributable" in media_type
+
+
+def get_repository(image: RegistryImage) -> RegistryImage:
+    """``host:port/some/repo:tag`` -> ``host:port/some/repo``"""
+    repository, separator, tag = image.rpartition(":")
+    return repository if separator and "/" not in tag else image
+
+
+async def evict(cached_function: Any, image: RegistryImage, stats: CacheStats) -> None:
+    """removes the entry of ``image`` from the cache of a ``@cached()`` function"""
+    stats.evictions += await cached_function.cache.delete(
+        image_key(cached_function, image)
+    )
+
+
+async def get_digests_concurrently(
+    get_digest: Callable[..., Awaitable[str | None]],
+    repository: RegistryImage,
+    tags: list[DockerTag],
+    *,
+    skip_tls_verify: bool,
+    limit: int | None,
+) -> dict[RegistryImage, str | None]:
+    """Calls ``get_digest`` for each tag of ``repository``, ``limit`` at a time
+    (all at once for ``None``, e.g. when ``get_digest`` is limited itself).
+
+    Tags which could not be resolved are left out, their errors are raised
+    again once they are requested on their own. Throttling is raised right
+    away so that callers back off (see ``run_limited``).
+    """
+    semaphore = contextlib.nullcontext() if limit is None else asyncio.Semaphore(limit)
+    digests: dict[RegistryImage, str | None] = {}
+    throttled: list[RegistryRateLimitedError] = []
+
+    async def _resolve(image: RegistryImage) -> None:
+        async with semaphore:
+            try:
+                digests[image] = await get_digest(
+                    image, skip_tls_verify=skip_tls_verify
+                )
+            except RegistryRateLimitedError as exc:
+                throttled.append(exc)
+            except Exception as exc:  # pylint: disable=broad-except  # noqa: BLE001
+                _logger.debug("could not resolve digest of '%s': %s", image, exc)
+
+    await asyncio.gather(*(_resolve(f"{repository}:{tag}") for tag in tags))
+    if throttled:
+        raise throttled[0]
+    return digests
@@ -1,23 +1,50 @@
 import asyncio
+import json
 import logging
-from aiocache import cached, Cache
-from typing import Final
+import re
+from aiocache import cached
+from typing import Any, Final
 
 from pydantic import SecretStr, NonNegativeFloat
 
-from ._models import RegistryImage
+from ._blob_store import BlobStats
+from ._cache import (
+    CacheStats,
+    StatsPlugin,
+    coalesce,
+    evict,
+    get_digests_concurrently,
+    get_repository,
+    image_key,
+    is_foreign,
+)
+from ._models import DockerTag, RegistryImage
+from ._rate_limit import RegistryRateLimitedError
 
 _DIGEST_TIMEOUT: Final[NonNegativeFloat] = 30
 _TAGS_TIMEOUT: Final[NonNegativeFloat] = 60
+_MANIFESTS_TIMEOUT: Final[NonNegativeFloat] = 60
+_PARALLEL_DIGEST_COMMANDS: Final[int] = 10
+
+_RATE_LIMITED: Final[re.Pattern] = re.compile(
+    r"status code (429|503)\b|TOOMANYREQUESTS", re.IGNORECASE
+)
 
 _logger = logging.getLogger(__name__)
 
+_cache_stats = CacheStats()
+
 
 class CraneCommandError(RuntimeError):
     def __init__(self, command: list[str | SecretStr], result: str):
         super().__init__(f"Command {command=} finished with error:\n{result}")
 
 
+class CraneCommandRateLimitedError(CraneCommandError, RegistryRateLimitedError):
+    # crane does not report the `Retry-After` header
+    pass
+
+
 class CraneCommandTimeoutError(RuntimeError):
     def __init__(self, command: list[str | SecretStr], timeout: NonNegativeFloat):
         rendered = [_resolve_secret(c) for c in command]
@@ -42,6 +69,8 @@ async def _execute_command(command: list[str | SecretStr]) -> str:
     result = stdout.decode()
 
     if process.returncode != 0:
+        if _RATE_LIMITED.search(result):
+            raise CraneCommandRateLimitedError(command, result)
         raise CraneCommandError(command, result)
 
     _logger.debug("'%s' finishe with:\n%s", command, result)
@@ -64,7 +93,8 @@ async def login(registry_url: str, username: str, password: SecretStr) -> None:
     )
 
 
-@cached()
+@cached(key_builder=image_key, plugins=[StatsPlugin(_cache_stats)])
+@coalesce(_cache_stats)
 async def get_digest(image: RegistryImage, *, skip_tls_verify: bool) -> str | None:
     """computes the digest of an image, results are cahced for efficnecy"""
     command = ["crane", "digest", image]
@@ -82,6 +112,61 @@ async def get_digest(image: RegistryImage, *, skip_tls_verify: bool) -> str | No
         raise
 
 
+async def get_digests(
+    repository: RegistryImage, tags: list[DockerTag], *, skip_tls_verify: bool
+) -> dict[RegistryImage, str | None]:
+    # crane has no bulk lookup, `crane digest` runs for several tags at once
+    return await get_digests_concurrently(
+        get_digest,
+        repository,
+        tags,
+        skip_tls_verify=skip_tls_verify,
+        limit=_PARALLEL_DIGEST_COMMANDS,
+    )
+
+
+async def _get_manifest(image: str, *, skip_tls_verify: bool) -> dict[str, Any]:
+    command = ["crane", "manifest", image]
+    if skip_tls_verify:
+        command.append("--insecure")
+    return json.loads(await _execute_command(command))
+
+
+async def get_image_size(image: RegistryImage, *, skip_tls_verify: bool) -> int | None:
+    """bytes of the distinct blobs of all architectures, ``None`` if it does not exist"""
+    try:
+        async with asyncio.timeout(delay=_MANIFESTS_TIMEOUT):
+            manifests = [await _get_manifest(image, skip_tls_verify=skip_tls_verify)]
+            if "manifests" in manifests[0]:
+                # an index, its children are referenced by digest
+                repository = get_repository(image)
+                manifests = await asyncio.gather(
+                    *(
+                        _get_manifest(
+                            f"{repository}@{c['digest']}",
+                            skip_tls_verify=skip_tls_verify,
+                        )
+                        for c in manifests[0]["manifests"]
+                    )
+                )
+    except TimeoutError as e:
+        raise CraneCommandTimeoutError(
+            ["crane", "manifest", image], _MANIFESTS_TIMEOUT
+        ) from e
+    except CraneCommandError as e:
+        if "unexpected status code 404" in f"{e}":
+            return None
+        raise
+
+    blobs = {
+        blob["digest"]: blob["size"]
+        for manifest in manifests
+        for blob in [manifest["config"], *manifest.get("layers", [])]
+        if not is_foreign(blob)
+    }
+    return sum(blobs.values())
+
+
 async def copy(
     source: RegistryImage,
     destination: RegistryImage,
@@ -95,9 +180,64 @@ async def copy(
     await _execute_command(command)
 
 
-@cached()
-async def get_image_tags(image: RegistryImage) -> list[str]:
+async def copy_to_many(
+    source: RegistryImage,
+    destinations: dict[RegistryImage, bool],
+    *,
+    src_skip_tls_verify: bool,
+) -> dict[RegistryImage, BaseException]:
+    """Copies ``source`` to all ``destinations`` (mapped to their ``skip_tls_verify``).
+
+    ``crane`` cannot push to many destinations at once: the source is copied
+    to the first destination and all other destinations are copied from
+    there, so the source is only pulled once. Failures are returned per
+    destination.
+    """
+    failures: dict[RegistryImage, BaseException] = {}
+    pending = list(destinations.items())
+
+    origin: tuple[RegistryImage, bool] | None = None
+    while pending and origin is None:
+        destination, dst_skip_tls_verify = pending.pop(0)
+        try:
+            await copy(
+                source,
+                destination,
+                src_skip_tls_verify=src_skip_tls_verify,
+                dst_skip_tls_verify=dst_skip_tls_verify,
+            )
+            origin = (destination, dst_skip_tls_verify)
+        except Exception as exc:  # pylint: disable=broad-except  # noqa: BLE001
+            failures[destination] = exc
+
+    if origin is None:
+        return failures
+
+    origin_image, origin_skip_tls_verify = origin
+    results = await asyncio.gather(
+        *(
+            copy(
+                origin_image,
+                destination,
+                src_skip_tls_verify=origin_skip_tls_verify,
+                dst_skip_tls_verify=dst_skip_tls_verify,
+            )
+            for destination, dst_skip_tls_verify in pending
+        ),
+        return_exceptions=True,
+    )
+    for (destination, _), result in zip(pending, results):
+        if isinstance(result, BaseException):
+            failures[destination] = result
+    return failures
+
+
+@cached(key_builder=image_key, plugins=[StatsPlugin(_cache_stats)])
+@coalesce(_cache_stats)
+async def get_image_tags(image: RegistryImage, *, skip_tls_verify: bool) -> list[str]:
     command = ["crane", "ls", image, "--omit-digest-tags"]
+    if skip_tls_verify:
+        command.append("--insecure")
     try:
         async with asyncio.timeout(delay=_TAGS_TIMEOUT):
             response = await _execute_command(command)
@@ -107,5 +247,25 @@ async def get_image_tags(image: RegistryImage) -> list[str]:
 
 
 async def clear_cache() -> None:
-    cache = Cache()
-    await cache.clear()
+    await get_digest.cache.clear()
+    await get_image_tags.cache.clear()
+
+
+async def invalidate(image: RegistryImage) -> None:
+    """drops the cached digest of ``image`` and the tags of its repository"""
+    await evict(get_digest, image, _cache_stats)
+    await evict(get_image_tags, get_repository(image), _cache_stats)
+
+
+def get_cache_stats() -> CacheStats:
+    return _cache_stats
+
+
+def get_blob_stats() -> BlobStats | None:
+    # `crane copy` transfers blobs itself, no local blob store is used
+    return None
+
+
+async def close() -> None:
+    # every call runs in its own `crane` process, nothing is kept open
+    return None
@@ -0,0 +1,196 @@
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Final
+
+from pydantic import NonNegativeFloat, SecretStr
+
+from ._backend import RegistryBackend
+from ._blob_store import BlobStats
+from ._cache import CacheStats, get_registry_url
+from ._models import DockerTag, RegistryImage
+
+_DIGESTS_FILE_NAME: Final[str] = "digests.sqlite"
+
+_logger = logging.getLogger(__name__)
+
+
+class DigestCache:
+    """SQLite backed digest cache which survives between runs.
+
+    Entries are keyed by registry image and expire after ``ttl`` seconds.
+    Missing images (``None`` digests) are never stored.
+    """
+
+    def __init__(self, state_dir: Path, *, ttl: NonNegativeFloat):
+        state_dir.mkdir(parents=True, exist_ok=True)
+        self.path = state_dir / _DIGESTS_FILE_NAME
+        self.ttl = ttl
+
+        # NOTE: autocommit + WAL, every write is persisted right away
+        # without paying for an fsync each time
+        self._connection = sqlite3.connect(self.path, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS digests ("
+            " image TEXT PRIMARY KEY,"
+            " registry TEXT NOT NULL,"
+            " digest TEXT NOT NULL,"
+            " stored_at REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS digests_registry ON digests (registry)"
+        )
+
+    def get(self, image: RegistryImage) -> str | None:
+        row = self._connection.execute(
+            "SELECT digest FROM digests WHERE image = ? AND stored_at >= ?",
+            (image, time.time() - self.ttl),
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def set(self, image: RegistryImage, digest: str) -> None:
+        self._connection.execute(
+            "INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)",
+            (image, get_registry_url(image), digest, time.time()),
+        )
+
+    def invalidate(self, image: RegistryImage) -> None:
+        self._connection.execute("DELETE FROM digests WHERE image = ?", (image,))
+
+    def invalidate_registry(self, registry_url: str) -> int:
+        """drops all entries of a registry, returns how many were removed"""
+        cursor = self._connection.execute(
+            "DELETE FROM digests WHERE registry = ?", (registry_url,)
+        )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class PersistentDigestBackend:
+    """Wraps a ``RegistryBackend`` answering ``get_digest`` from a ``DigestCache``.
+
+    After a copy the destination is known to have the source digest, the
+    entry is updated accordingly (or dropped if the source was not cached).
+    Invalidated images are looked up again, except for the invalidation which
+    follows the copy updating their entry.
+    """
+
+    def __init__(self, backend: RegistryBackend, digest_cache: DigestCache):
+        self._backend = backend
+        self._digest_cache = digest_cache
+        # destinations whose entry was updated by a copy
+        self._copied: set[RegistryImage] = set()
+
+    async def login(
+        self, registry_url: str, username: str, password: SecretStr
+    ) -> None:
+        await self._backend.login(registry_url, username, password)
+
+    async def get_digest(
+        self, image: RegistryImage, *, skip_tls_verify: bool
+    ) -> str | None:
+        if (digest := self._digest_cache.get(image)) is not None:
+            return digest
+
+        digest = await self._backend.get_digest(image, skip_tls_verify=skip_tls_verify)
+        if digest is not None:
+            self._digest_cache.set(image, digest)
+        return digest
+
+    async def get_digests(
+        self, repository: RegistryImage, tags: list[DockerTag], *, skip_tls_verify: bool
+    ) -> dict[RegistryImage, str | None]:
+        digests: dict[RegistryImage, str | None] = {}
+        for tag in tags:
+            image = f"{repository}:{tag}"
+            if (digest := self._digest_cache.get(image)) is not None:
+                digests[image] = digest
+
+        missing_tags = [t for t in tags if f"{repository}:{t}" not in digests]
+        if missing_tags:
+            resolved = await self._backend.get_digests(
+                repository, missing_tags, skip_tls_verify=skip_tls_verify
+            )
+            for image, digest in resolved.items():
+                if digest is not None:
+                    self._digest_cache.set(image, digest)
+            digests.update(resolved)
+        return digests
+
+    async def get_image_tags(
+        self, image: RegistryImage, *, skip_tls_verify: bool
+    ) -> list[str]:
+        return await self._backend.get_image_tags(
+            image, skip_tls_verify=skip_tls_verify
+        )
+
+    async def get_image_size(
+        self, image: RegistryImage, *, skip_tls_verify: bool
+    ) -> int | None:
+        return await self._backend.get_image_size(
+            image, skip_tls_verify=skip_tls_verify
+        )
+
+    async def copy(
+        self,
+        source: RegistryImage,
+        destination: RegistryImage,
+        *,
+        src_skip_tls_verify: bool,
+        dst_skip_tls_verify: bool,
+    ) -> None:
+        self._digest_cache.invalidate(destination)
+        await self._backend.copy(
+            source,
+            destination,
+            src_skip_tls_verify=src_skip_tls_verify,
+            dst_skip_tls_verify=dst_skip_tls_verify,
+        )
+        if (digest := self._digest_cache.get(source)) is not None:
+            self._digest_cache.set(destination, digest)
+            self._copied.add(destination)
+
+    async def copy_to_many(
+        self,
+        source: RegistryImage,
+        destinations: dict[RegistryImage, bool],
+        *,
+        src_skip_tls_verify: bool,
+    ) -> dict[RegistryImage, BaseException]:
+        for destination in destinations:
+            self._digest_cache.invalidate(destination)
+        failures = await self._backend.copy_to_many(
+            source, destinations, src_skip_tls_verify=src_skip_tls_verify
+        )
+        if (digest := self._digest_cache.get(source)) is not None:
+            for destination in destinations.keys() - failures.keys():
+                self._digest_cache.set(destination, digest)
+                self._copied.add(destination)
+        return failures
+
+    async def clear_cache(self) -> None:
+        # NOTE: only the in-process caches are dropped, persisted digests are
+        # kept up to date by ``copy`` and expire via their TTL
+        await self._backend.clear_cache()
+
+    async def invalidate(self, image: RegistryImage) -> None:
+        if image in self._copied:
+            self._copied.remove(image)
+        else:
+            self._digest_cache.invalidate(image)
+        await self._backend.invalidate(image)
+
+    def get_cache_stats(self) -> CacheStats:
+        return self._backend.get_cache_stats()
+
+    def get_blob_stats(self) -> BlobStats | None:
+        return self._backend.get_blob_stats()
+
+    async def close(self) -> None:
+        await self._backend.close()
+        self._digest_cache.close()
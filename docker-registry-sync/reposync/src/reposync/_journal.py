@@ -0,0 +1,62 @@
+"""Append-only record of finished tasks, used to resume interrupted runs."""
+
+import json
+import logging
+from pathlib import Path
+from typing import Final, TextIO
+
+from ._models import TaskID
+
+_JOURNAL_FILE_NAME: Final[str] = "journal.jsonl"
+
+_logger = logging.getLogger(__name__)
+
+
+class Journal:
+    """One JSON line per finished task with the source digest it was synced from.
+    Tasks are keyed without their stage (see ``_sync._get_journal_key``).
+
+    Lines are flushed as soon as they are written, a run killed midway
+    leaves at most one incomplete line which is ignored when reading.
+    Without ``state_dir`` entries are only kept in memory.
+    """
+
+    def __init__(self, state_dir: Path | None, *, resume: bool):
+        self.entries: dict[TaskID, str] = {}
+        self._file: TextIO | None = None
+        if state_dir is None:
+            return
+
+        state_dir.mkdir(parents=True, exist_ok=True)
+        self.path = state_dir / _JOURNAL_FILE_NAME
+        if resume:
+            self.entries = self._read()
+        # NOTE: a new run starts a new journal, a resumed one extends it
+        self._file = self.path.open("a" if resume else "w", encoding="utf-8")
+        if self._file.tell() > 0 and not self.path.read_bytes().endswith(b"\n"):
+            self._file.write("\n")
+
+    def _read(self) -> dict[TaskID, str]:
+        entries: dict[TaskID, str] = {}
+        if not self.path.exists():
+            return entries
+        for line in self.path.read_text(encoding="utf-8").splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                _logger.debug("ignoring incomplete journal line '%s'", line)
+                continue
+            entries[entry["task_id"]] = entry["src_digest"]
+        return entries
+
+    def record(self, task_id: TaskID, src_digest: str) -> None:
+        self.entries[task_id] = src_digest
+        if self._file is None:
+            return
+        self._file.write(json.dumps({"task_id": task_id, "src_digest": src_digest}))
+        self._file.write("\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
@@ -0,0 +1,409 @@
+"""Metrics about registry operations in the Prometheus text format."""
+
+import asyncio
+import contextlib
+import logging
+import time
+from bisect import bisect_left
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Final, TypeVar
+
+from aiohttp import web
+from pydantic import NonNegativeFloat, SecretStr
+
+from ._backend import RegistryBackend
+from ._blob_store import BlobStats
+from ._cache import CacheStats, get_registry_url
+from ._models import DockerTag, RegistryImage
+from ._rate_limit import RegistryLimiter
+
+METRICS_PATH: Final[str] = "/metrics"
+
+_DEFAULT_BUCKETS: Final[tuple[float, ...]] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+    300,
+)
+_WRITE_INTERVAL_SECONDS: Final[float] = 15.0
+_CONTENT_TYPE: Final[str] = "text/plain; version=0.0.4; charset=utf-8"
+
+_logger = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+@dataclass
+class _HistogramSeries:
+    bucket_counts: list[int]
+    total: float = 0
+    count: int = 0
+
+
+class Histogram:
+    """Cumulative histogram with one series per combination of label values."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        *,
+        buckets: tuple[float, ...] = _DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self._series: dict[tuple[tuple[str, str], ...], _HistogramSeries] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        series = self._series.setdefault(
+            tuple(sorted(labels.items())),
+            _HistogramSeries(bucket_counts=[0] * len(self.buckets)),
+        )
+        # NOTE: values above the last bucket are only part of "+Inf"
+        if (index := bisect_left(self.buckets, value)) < len(self.buckets):
+            series.bucket_counts[index] += 1
+        series.total += value
+        series.count += 1
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for key, series in sorted(self._series.items()):
+            labels = dict(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, series.bucket_counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels({**labels, "le": f"{bound}"})
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            inf_labels = _format_labels({**labels, "le": "+Inf"})
+            lines.append(f"{self.name}_bucket{inf_labels} {series.count}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {series.total}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {series.count}")
+        return lines
+
+
+def _render_samples(
+    name: str, metric_type: str, documentation: str, samples: dict[str, float]
+) -> list[str]:
+    """``samples`` maps rendered labels to values"""
+    return [
+        f"# HELP {name} {documentation}",
+        f"# TYPE {name} {metric_type}",
+        *(f"{name}{labels} {value}" for labels, value in sorted(samples.items())),
+    ]
+
+
+class Metrics:
+    """Everything exported about one process, kept across runs.
+
+    Operation durations are observed by ``MeteredBackend``, waits for a slot of
+    a registry by its ``RegistryLimiter``. Cache, blob and throttling counters
+    are read when rendering.
+    """
+
+    def __init__(self) -> None:
+        self.request_duration = Histogram(
+            "reposync_registry_request_duration_seconds",
+            "Duration of digest lookups and tag listings per registry.",
+        )
+        self.copy_duration = Histogram(
+            "reposync_copy_duration_seconds",
+            "Duration of image copies per source and destination registry.",
+        )
+        self.slot_wait = Histogram(
+            "reposync_registry_slot_wait_seconds",
+            "Time operations waited for a slot of a registry's limits.",
+        )
+        self.copies_in_flight = 0
+        self.backend: RegistryBackend | None = None
+        self.limiters: dict[str, RegistryLimiter] = {}
+        # NOTE: only the native backend pushes blobs itself and counts them,
+        # without it the metric is not exported instead of reading 0
+        self.get_uploaded_bytes: Callable[[], dict[str, int]] | None = None
+
+    def observe_limiters(self, limiters: dict[str, RegistryLimiter]) -> None:
+        self.limiters = limiters
+        for registry_url, limiter in limiters.items():
+            limiter.on_wait = lambda seconds, url=registry_url: self.slot_wait.observe(
+                seconds, registry=url
+            )
+
+    def render(self) -> str:
+        lines = [
+            *self.request_duration.render(),
+            *self.copy_duration.render(),
+            *self.slot_wait.render(),
+            *_render_samples(
+                "reposync_copies_in_flight",
+                "gauge",
+                "Image copies currently running.",
+                {"": self.copies_in_flight},
+            ),
+            *_render_samples(
+                "reposync_registry_throttled_total",
+                "counter",
+                "Operations a registry refused with 429 or 503.",
+                {
+                    _format_labels({"registry": url}): limiter.throttled
+                    for url, limiter in self.limiters.items()
+                },
+            ),
+        ]
+        if self.backend is not None:
+            cache = self.backend.get_cache_stats()
+            lookups = cache.hits + cache.misses
+            lines += _render_samples(
+                "reposync_cache_lookups_total",
+                "counter",
+                "Lookups of cached tags and digests.",
+                {
+                    _format_labels({"result": "hit"}): cache.hits,
+                    _format_labels({"result": "miss"}): cache.misses,
+                },
+            )
+            lines += _render_samples(
+                "reposync_cache_coalesced_total",
+                "counter",
+                "Cache misses which waited for the same lookup already running.",
+                {"": cache.coalesced},
+            )
+            lines += _render_samples(
+                "reposync_cache_hit_ratio",
+                "gauge",
+                "Share of cached lookups which were hits.",
+                {"": cache.hits / lookups if lookups else 0},
+            )
+            if (blobs := self.backend.get_blob_stats()) is not None:
+                lines += _render_samples(
+                    "reposync_blob_bytes_total",
+                    "counter",
+                    "Bytes of blobs read from the blob cache or pulled.",
+                    {
+                        _format_labels({"source": "cache"}): blobs.from_cache,
+                        _format_labels({"source": "network"}): blobs.from_network,
+                    },
+                )
+        if self.get_uploaded_bytes is not None:
+            lines += _render_samples(
+                "reposync_uploaded_bytes_total",
+                "counter",
+                "Bytes of blobs pushed per destination registry (native backend only).",
+                {
+                    _format_labels({"registry": url}): size
+                    for url, size in self.get_uploaded_bytes().items()
+                },
+            )
+        return "\n".join(lines) + "\n"
+
+
+class MeteredBackend:
+    """Wraps a ``RegistryBackend`` observing the duration of its operations."""
+
+    def __init__(self, backend: RegistryBackend, metrics: Metrics):
+        self._backend = backend
+        self._metrics = metrics
+
+    async def _timed_request(
+        self, operation: str, image: RegistryImage, call: Awaitable[_T]
+    ) -> _T:
+        start = time.monotonic()
+        try:
+            return await call
+        finally:
+            self._metrics.request_duration.observe(
+                time.monotonic() - start,
+                operation=operation,
+                registry=get_registry_url(image),
+            )
+
+    async def _timed_copy(
+        self, source: RegistryImage, destination: RegistryImage, call: Awaitable[_T]
+    ) -> _T:
+        self._metrics.copies_in_flight += 1
+        start = time.monotonic()
+        try:
+            return await call
+        finally:
+            self._metrics.copies_in_flight -= 1
+            self._metrics.copy_duration.observe(
+                time.monotonic() - start,
+                source=get_registry_url(source),
+                destination=get_registry_url(destination),
+            )
+
+    async def login(
+        self, registry_url: str, username: str, password: SecretStr
+    ) -> None:
+        await self._backend.login(registry_url, username, password)
+
+    async def get_digest(
+        self, image: RegistryImage, *, skip_tls_verify: bool
+    ) -> str | None:
+        return await self._timed_request(
+            "get_digest",
+            image,
+            self._backend.get_digest(image, skip_tls_verify=skip_tls_verify),
+        )
+
+    async def get_digests(
+        self, repository: RegistryImage, tags: list[DockerTag], *, skip_tls_verify: bool
+    ) -> dict[RegistryImage, str | None]:
+        return await self._timed_request(
+            "get_digests",
+            repository,
+            self._backend.get_digests(
+                repository, tags, skip_tls_verify=skip_tls_verify
+            ),
+        )
+
+    async def get_image_tags(
+        self, image: RegistryImage, *, skip_tls_verify: bool
+    ) -> list[str]:
+        return await self._timed_request(
+            "get_image_tags",
+            image,
+            self._backend.get_image_tags(image, skip_tls_verify=skip_tls_verify),
+        )
+
+    async def get_image_size(
+        self, image: RegistryImage, *, skip_tls_verify: bool
+    ) -> int | None:
+        return await self._timed_request(
+            "get_image_size",
+            image,
+            self._backend.get_image_size(image, skip_tls_verify=skip_tls_verify),
+        )
+
+    async def copy(
+        self,
+        source: RegistryImage,
+        destination: RegistryImage,
+        *,
+        src_skip_tls_verify: bool,
+        dst_skip_tls_verify: bool,
+    ) -> None:
+        await self._timed_copy(
+            source,
+            destination,
+            self._backend.copy(
+                source,
+                destination,
+                src_skip_tls_verify=src_skip_tls_verify,
+                dst_skip_tls_verify=dst_skip_tls_verify,
+            ),
+        )
+
+    async def copy_to_many(
+        self,
+        source: RegistryImage,
+        destinations: dict[RegistryImage, bool],
+        *,
+        src_skip_tls_verify: bool,
+    ) -> dict[RegistryImage, BaseException]:
+        # NOTE: observed once, against the registry of the first destination
+        return await self._timed_copy(
+            source,
+            next(iter(destinations)),
+            self._backend.copy_to_many(
+                source, destinations, src_skip_tls_verify=src_skip_tls_verify
+            ),
+        )
+
+    async def clear_cache(self) -> None:
+        await self._backend.clear_cache()
+
+    async def invalidate(self, image: RegistryImage) -> None:
+        await self._backend.invalidate(image)
+
+    def get_cache_stats(self) -> CacheStats:
+        return self._backend.get_cache_stats()
+
+    def get_blob_stats(self) -> BlobStats | None:
+        return self._backend.get_blob_stats()
+
+    async def close(self) -> None:
+        await self._backend.close()
+
+
+def _write_metrics_file(metrics: Metrics, metrics_file: Path) -> None:
+    # NOTE: replaced at once, collectors never read a partially written file
+    metrics_file.parent.mkdir(parents=True, exist_ok=True)
+    partial_file = metrics_file.with_name(f"{metrics_file.name}.partial")
+    partial_file.write_text(metrics.render())
+    partial_file.replace(metrics_file)
+
+
+@contextlib.asynccontextmanager
+async def export_metrics(
+    metrics: Metrics,
+    *,
+    port: int | None,
+    metrics_file: Path | None,
+    write_interval: NonNegativeFloat = _WRITE_INTERVAL_SECONDS,
+) -> AsyncIterator[None]:
+    """Serves ``metrics`` on ``port`` and/or writes them to ``metrics_file``
+    (for node exporter's textfile collector) while the context is active.
+
+    The file is written periodically and once more when leaving.
+    """
+    runner: web.AppRunner | None = None
+    if port is not None:
+
+        async def _handle_metrics(_: web.Request) -> web.Response:
+            return web.Response(
+                body=metrics.render().encode(), headers={"Content-Type": _CONTENT_TYPE}
+            )
+
+        app = web.Application()
+        app.router.add_get(METRICS_PATH, _handle_metrics)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, port=port).start()
+        _logger.info("Serving metrics on port %s", port)
+
+    async def _write_periodically(path: Path) -> None:
+        while True:
+            await asyncio.sleep(write_interval)
+            _write_metrics_file(metrics, path)
+
+    writer = (
+        None
+        if metrics_file is None
+        else asyncio.create_task(_write_periodically(metrics_file))
+    )
+    try:
+        yield
+    finally:
+        if writer is not None:
+            writer.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await writer
+        if metrics_file is not None:
+            _write_metrics_file(metrics, metrics_file)
+        if runner is not None:
+            await runner.cleanup()
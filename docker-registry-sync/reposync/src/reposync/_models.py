@@ -1,4 +1,5 @@
 import os
+import re
 from uuid import uuid4
 from typing import Annotated, TypeAlias, Self
 
@@ -8,10 +9,14 @@ from pydantic import (
     BeforeValidator,
     AfterValidator,
     ConfigDict,
+    PositiveFloat,
+    PositiveInt,
     SecretStr,
     model_validator,
 )
 
+from ._tags import parse_constraint
+
 
 DockerImage: TypeAlias = str
 DockerTag: TypeAlias = str
@@ -32,6 +37,12 @@ def _resolve_from_env(env_var_name: str | None) -> str:
     return os.environ[env_var_name]
 
 
+def _validate_constraint(constraint: str | None) -> str | None:
+    if constraint is not None:
+        parse_constraint(constraint)
+    return constraint
+
+
 def _replace_none_stage(stage_id: StageID | None) -> StageID:
     return f"{uuid4()}" if stage_id is None else stage_id
 
@@ -41,6 +52,12 @@ class Registry(BaseModel):
     env_user: Annotated[str | None, BeforeValidator(_resolve_from_env)]
     env_password: Annotated[SecretStr | None, BeforeValidator(_resolve_from_env)]
     skip_tls_verify: Annotated[bool, Field(alias="skip-tls-verify")] = False
+    max_concurrent_operations: Annotated[
+        PositiveInt | None, Field(alias="max-concurrent-operations")
+    ] = None
+    requests_per_second: Annotated[
+        PositiveFloat | None, Field(alias="requests-per-second")
+    ] = None
 
 
 class FromEntry(BaseModel):
@@ -52,6 +69,18 @@ class ToEntry(BaseModel):
     destination: RegistryKey
     repository: DockerImage
     tags: list[DockerTag]
+    # tags (fully) matching never change once pushed, if the destination
+    # already has them their digests are not compared
+    immutable_tags: Annotated[re.Pattern | None, Field(alias="immutable-tags")] = None
+    # narrow down `tags` (or all listed tags), see `_tags.select_tags`
+    include: Annotated[list[re.Pattern], Field(default_factory=list)]
+    exclude: Annotated[list[re.Pattern], Field(default_factory=list)]
+    semver: Annotated[str | None, AfterValidator(_validate_constraint)] = None
+    newest: PositiveInt | None = None
+
+    @property
+    def selects_tags(self) -> bool:
+        return bool(self.include or self.exclude or self.semver or self.newest)
 
 
 class Stage(BaseModel):
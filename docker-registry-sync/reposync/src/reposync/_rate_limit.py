@@ -0,0 +1,147 @@
+"""Per-registry bounds for concurrent operations and their start rate."""
+
+import asyncio
+import contextlib
+import logging
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Awaitable, Callable, Final, TypeVar
+
+from pydantic import NonNegativeFloat, PositiveFloat, PositiveInt
+
+from ._tracing import span
+
+_MAX_THROTTLED_ATTEMPTS: Final[int] = 5
+_INITIAL_BACKOFF: Final[NonNegativeFloat] = 1
+_MAX_BACKOFF: Final[NonNegativeFloat] = 60
+
+_logger = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
+
+
+class RegistryRateLimitedError(RuntimeError):
+    """raised by backends when a registry refuses requests with 429 or 503"""
+
+    retry_after: NonNegativeFloat | None = None
+
+
+def parse_retry_after(value: str | None) -> NonNegativeFloat | None:
+    """``Retry-After`` header in seconds, it is either a number or a date"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0)
+
+
+class RegistryLimiter:
+    """Bounds the operations running against one registry.
+
+    At most ``max_concurrent`` operations run at once and at most
+    ``requests_per_second`` are started per second (unbounded when ``None``).
+    When the registry throttles, operations are held back until its
+    ``Retry-After`` (or an exponential backoff) has passed and the allowed
+    concurrency is halved. Every successful operation raises it by one again,
+    up to ``max_concurrent``.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_concurrent: PositiveInt | None,
+        requests_per_second: PositiveFloat | None,
+    ):
+        self.max_concurrent = max_concurrent
+        self.limit = max_concurrent
+        self.throttled = 0
+        # called with the seconds each operation waited for its slot
+        self.on_wait: Callable[[float], None] | None = None
+
+        self._interval = 0 if requests_per_second is None else 1 / requests_per_second
+        self._running = 0
+        self._condition = asyncio.Condition()
+        self._next_start: float = 0
+        self._paused_until: float = 0
+        self._backoff = _INITIAL_BACKOFF
+
+    def _has_capacity(self) -> bool:
+        return self.limit is None or self._running < self.limit
+
+    async def _acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        async with self._condition:
+            await self._condition.wait_for(self._has_capacity)
+            self._running += 1
+            start = max(loop.time(), self._next_start)
+            self._next_start = start + self._interval
+
+        while (delay := max(start, self._paused_until) - loop.time()) > 0:
+            await asyncio.sleep(delay)
+
+    async def _release(self, *, succeeded: bool) -> None:
+        async with self._condition:
+            self._running -= 1
+            if succeeded:
+                self._backoff = _INITIAL_BACKOFF
+                if self.limit is not None and (
+                    self.max_concurrent is None or self.limit < self.max_concurrent
+                ):
+                    self.limit += 1
+            self._condition.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        waiting_since = asyncio.get_running_loop().time()
+        await self._acquire()
+        if self.on_wait is not None:
+            self.on_wait(asyncio.get_running_loop().time() - waiting_since)
+        succeeded = False
+        try:
+            yield
+            succeeded = True
+        finally:
+            await self._release(succeeded=succeeded)
+
+    def throttle(self, retry_after: NonNegativeFloat | None) -> None:
+        self.throttled += 1
+        delay = self._backoff if retry_after is None else retry_after
+        self._backoff = min(self._backoff * 2, _MAX_BACKOFF)
+        self._paused_until = max(
+            self._paused_until, asyncio.get_running_loop().time() + delay
+        )
+        # NOTE: called once the throttled operation released its slot
+        current = self._running + 1 if self.limit is None else self.limit
+        self.limit = max(current // 2, 1)
+
+
+async def run_limited(
+    limiters: list[RegistryLimiter], operation: Callable[[], Awaitable[_T]]
+) -> _T:
+    """Runs ``operation`` holding a slot of every limiter.
+
+    Throttled operations are repeated after backing off, the error is raised
+    once they were throttled ``_MAX_THROTTLED_ATTEMPTS`` times.
+    ``limiters`` must always be passed in the same order to avoid deadlocks.
+    """
+    attempt = 1
+    while True:
+        try:
+            async with contextlib.AsyncExitStack() as stack:
+                with span("wait for registry slots", attempt=attempt):
+                    for limiter in limiters:
+                        await stack.enter_async_context(limiter.slot())
+                return await operation()
+        except RegistryRateLimitedError as e:
+            if attempt >= _MAX_THROTTLED_ATTEMPTS:
+                raise
+            for limiter in limiters:
+                limiter.throttle(e.retry_after)
+            _logger.warning("Throttled (attempt %s), backing off: %s", attempt, e)
+            attempt += 1
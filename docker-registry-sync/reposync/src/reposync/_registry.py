@@ -0,0 +1,851 @@
+"""In-process OCI Distribution client.
+
+Mirrors the public functions of ``_crane`` so it can be used as a drop-in
+backend. Instead of forking a ``crane`` process per call, it keeps one pooled
+keep-alive ``aiohttp`` session per registry and talks the registry HTTP API
+directly.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import math
+import re
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Final
+
+import aiohttp
+from aiocache import cached
+from pydantic import NonNegativeFloat, SecretStr
+from yarl import URL
+
+from ._blob_store import BlobStats, BlobStore
+from ._cache import (
+    CacheStats,
+    StatsPlugin,
+    coalesce,
+    evict,
+    get_digests_concurrently,
+    get_repository,
+    image_key,
+    is_foreign,
+)
+from ._models import DockerTag, RegistryImage
+from ._rate_limit import RegistryRateLimitedError, parse_retry_after
+
+_DIGEST_TIMEOUT: Final[NonNegativeFloat] = 30
+_TAGS_TIMEOUT: Final[NonNegativeFloat] = 60
+_MANIFESTS_TIMEOUT: Final[NonNegativeFloat] = 60
+_PING_TIMEOUT: Final[NonNegativeFloat] = 10
+
+_TAGS_PAGE_SIZE: Final[int] = 1000
+_CONNECTIONS_PER_REGISTRY: Final[int] = 32
+_BLOB_CHUNK_SIZE: Final[int] = 1024 * 1024
+
+_RATE_LIMITED_STATUSES: Final[set[int]] = {429, 503}
+
+_DOCKER_HUB_HOSTS: Final[set[str]] = {"docker.io", "index.docker.io"}
+_DOCKER_HUB_API_HOST: Final[str] = "registry-1.docker.io"
+_DOCKER_HUB_REPOSITORIES_URL: Final[URL] = URL("https://hub.docker.com/v2/repositories")
+_DOCKER_HUB_PAGE_SIZE: Final[int] = 100
+_LOCAL_HOSTS: Final[set[str]] = {"localhost", "127.0.0.1", "[::1]"}
+
+_INDEX_MEDIA_TYPES: Final[set[str]] = {
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+}
+_MANIFEST_MEDIA_TYPES: Final[tuple[str, ...]] = (
+    *sorted(_INDEX_MEDIA_TYPES),
+    "application/vnd.oci.image.manifest.v1+json",
+    "application/vnd.docker.distribution.manifest.v2+json",
+)
+_ACCEPT_MANIFESTS: Final[str] = ", ".join(_MANIFEST_MEDIA_TYPES)
+
+_CHALLENGE_PARAMS: Final[re.Pattern] = re.compile(r'(\w+)="([^"]*)"')
+_LINK_NEXT: Final[re.Pattern] = re.compile(r'<([^>]+)>\s*;\s*rel="?next"?')
+
+_logger = logging.getLogger(__name__)
+
+_cache_stats = CacheStats()
+
+
+class RegistryRequestError(RuntimeError):
+    def __init__(self, method: str, url: URL | str, status: int, body: str):
+        self.status = status
+        super().__init__(f"Request '{method} {url}' failed with {status=}:\n{body}")
+
+
+class RegistryRequestRateLimitedError(RegistryRequestError, RegistryRateLimitedError):
+    def __init__(
+        self,
+        method: str,
+        url: URL | str,
+        status: int,
+        body: str,
+        *,
+        retry_after: NonNegativeFloat | None,
+    ):
+        self.retry_after = retry_after
+        super().__init__(method, url, status, body)
+
+
+class RegistryRequestTimeoutError(RuntimeError):
+    def __init__(self, image: RegistryImage, timeout: NonNegativeFloat):
+        super().__init__(f"Request for '{image}' timed out after {timeout} seconds")
+
+
+@dataclass(frozen=True)
+class _ImageReference:
+    host: str
+    repository: str
+    reference: str
+
+
+def _normalize_host(registry_url: str) -> str:
+    host = registry_url.rstrip("/")
+    return _DOCKER_HUB_API_HOST if host in _DOCKER_HUB_HOSTS else host
+
+
+def _parse_image(image: RegistryImage) -> _ImageReference:
+    """splits ``host/some/repo:tag`` (or ``@sha256:...``) into its parts"""
+    host, _, remainder = image.partition("/")
+    if "@" in remainder:
+        repository, reference = remainder.split("@", 1)
+    else:
+        repository, separator, reference = remainder.rpartition(":")
+        if not separator:
+            repository, reference = remainder, "latest"
+
+    host = _normalize_host(host)
+    if host == _DOCKER_HUB_API_HOST and "/" not in repository:
+        repository = f"library/{repository}"
+    return _ImageReference(host=host, repository=repository, reference=reference)
+
+
+def _pull_scope(repository: str) -> str:
+    return f"repository:{repository}:pull"
+
+
+def _push_scope(repository: str) -> str:
+    return f"repository:{repository}:pull,push"
+
+
+class RegistryClient:
+    """Talks to a single registry host.
+
+    All requests share one ``aiohttp.ClientSession`` so TCP and TLS
+    connections are kept alive and reused. Authentication follows the
+    ``WWW-Authenticate`` challenge returned by ``GET /v2/`` (Basic or Bearer
+    token), bearer tokens are cached per scope.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        *,
+        skip_tls_verify: bool,
+        credentials: tuple[str, SecretStr] | None,
+    ):
+        self.host = host
+        self.skip_tls_verify = skip_tls_verify
+        self._credentials = credentials
+
+        self._session: aiohttp.ClientSession | None = None
+        self._base_url: URL | None = None
+        self._challenge: tuple[str, dict[str, str]] | None = None
+        self._tokens: dict[tuple[str, ...], str] = {}
+        self._lock = asyncio.Lock()
+
+    @property
+    def _basic_auth(self) -> aiohttp.BasicAuth | None:
+        if self._credentials is None:
+            return None
+        username, password = self._credentials
+        return aiohttp.BasicAuth(username, password.get_secret_value())
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=_CONNECTIONS_PER_REGISTRY,
+                ssl=False if self.skip_tls_verify else True,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _ping(self) -> URL:
+        """finds out which scheme the registry talks and how it wants to be authenticated"""
+        schemes = ["https"]
+        if self.skip_tls_verify or self.host.split(":")[0] in _LOCAL_HOSTS:
+            schemes.append("http")
+
+        last_error: BaseException | None = None
+        for scheme in schemes:
+            base_url = URL(f"{scheme}://{self.host}")
+            try:
+                async with self._get_session().get(
+                    base_url / "v2/",
+                    timeout=aiohttp.ClientTimeout(total=_PING_TIMEOUT),
+                ) as response:
+                    if response.status == 401:
+                        self._challenge = self._parse_challenge(
+                            response.headers.get("WWW-Authenticate", "")
+                        )
+                    return base_url
+            except (aiohttp.ClientError, TimeoutError) as e:
+                _logger.debug("'%s' not reachable via %s: %s", self.host, scheme, e)
+                last_error = e
+
+        assert last_error is not None  # nosec
+        raise last_error
+
+    @staticmethod
+    def _parse_challenge(header: str) -> tuple[str, dict[str, str]]:
+        scheme, _, params = header.partition(" ")
+        return scheme.lower(), dict(_CHALLENGE_PARAMS.findall(params))
+
+    async def _get_base_url(self) -> URL:
+        if self._base_url is None:
+            async with self._lock:
+                if self._base_url is None:
+                    self._base_url = await self._ping()
+        return self._base_url
+
+    async def _fetch_token(self, scopes: tuple[str, ...]) -> str:
+        assert self._challenge is not None  # nosec
+        _, params = self._challenge
+        query: list[tuple[str, str]] = []
+        if "service" in params:
+            query.append(("service", params["service"]))
+        query.extend(("scope", scope) for scope in scopes)
+
+        async with self._get_session().get(
+            params["realm"], params=query, auth=self._basic_auth
+        ) as response:
+            if response.status != 200:
+                raise RegistryRequestError(
+                    "GET", response.url, response.status, await response.text()
+                )
+            payload = await response.json(content_type=None)
+        return payload.get("token") or payload["access_token"]
+
+    async def _auth_headers(self, scopes: tuple[str, ...]) -> dict[str, str]:
+        if self._challenge is None:
+            return {}
+
+        scheme, _ = self._challenge
+        if scheme == "basic":
+            basic_auth = self._basic_auth
+            return {} if basic_auth is None else {"Authorization": basic_auth.encode()}
+
+        if scopes not in self._tokens:
+            self._tokens[scopes] = await self._fetch_token(scopes)
+        return {"Authorization": f"Bearer {self._tokens[scopes]}"}
+
+    @contextlib.asynccontextmanager
+    async def _request(
+        self,
+        method: str,
+        path_or_url: str | URL,
+        *,
+        scopes: tuple[str, ...],
+        expected: tuple[int, ...],
+        headers: dict[str, str] | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        base_url = await self._get_base_url()
+        url = (
+            base_url.join(URL(path_or_url))
+            if isinstance(path_or_url, URL)
+            else base_url / path_or_url.lstrip("/")
+        )
+        # bodies which are streamed cannot be replayed after a 401
+        can_retry = not isinstance(kwargs.get("data"), AsyncIterator)
+
+        for attempt in range(2):
+            request_headers = {**(headers or {}), **await self._auth_headers(scopes)}
+            response = await self._get_session().request(
+                method, url, headers=request_headers, allow_redirects=True, **kwargs
+            )
+            try:
+                if response.status == 401 and attempt == 0 and can_retry:
+                    # token expired or auth challenge was not known yet
+                    self._challenge = self._parse_challenge(
+                        response.headers.get("WWW-Authenticate", "")
+                    )
+                    self._tokens.pop(scopes, None)
+                    continue
+                if response.status in _RATE_LIMITED_STATUSES:
+                    raise RegistryRequestRateLimitedError(
+                        method,
+                        url,
+                        response.status,
+                        await response.text(),
+                        retry_after=parse_retry_after(
+                            response.headers.get("Retry-After")
+                        ),
+                    )
+                if response.status not in expected:
+                    raise RegistryRequestError(
+                        method, url, response.status, await response.text()
+                    )
+                yield response
+                return
+            finally:
+                response.release()
+
+    async def get_digest(self, repository: str, reference: str) -> str | None:
+        async with self._request(
+            "HEAD",
+            f"v2/{repository}/manifests/{reference}",
+            scopes=(_pull_scope(repository),),
+            expected=(200, 404),
+            headers={"Accept": _ACCEPT_MANIFESTS},
+        ) as response:
+            if response.status == 404:
+                return None
+            if digest := response.headers.get("Docker-Content-Digest"):
+                return digest
+
+        # some registries do not return the digest on HEAD
+        body, _ = await self.get_manifest(repository, reference)
+        return f"sha256:{hashlib.sha256(body).hexdigest()}"
+
+    async def list_tags(self, repository: str) -> list[str]:
+        tags: list[str] = []
+        next_page: str | URL = f"v2/{repository}/tags/list?n={_TAGS_PAGE_SIZE}"
+        while next_page:
+            async with self._request(
+                "GET",
+                next_page if isinstance(next_page, URL) else URL(next_page),
+                scopes=(_pull_scope(repository),),
+                expected=(200,),
+            ) as response:
+                payload = await response.json(content_type=None)
+                link = _LINK_NEXT.search(response.headers.get("Link", ""))
+            tags.extend(payload.get("tags") or [])
+            next_page = URL(link.group(1)) if link else ""
+        return tags
+
+    async def list_docker_hub_digests(
+        self, repository: str, tags: list[DockerTag]
+    ) -> dict[str, str]:
+        """digests of ``tags`` from the Docker Hub API, one request per 100 tags
+
+        Pages are only requested while more of ``tags`` are missing than pages
+        are left, the remaining tags take fewer requests looked up one by one.
+        Only public repositories are listed, the API does not take registry tokens.
+        """
+        digests: dict[str, str] = {}
+        missing = set(tags)
+        # NOTE: the tag count is only known once the first page was read
+        pages_left = 1
+        listed = 0
+        next_page: URL | None = (
+            _DOCKER_HUB_REPOSITORIES_URL / repository / "tags/"
+        ).with_query(page_size=_DOCKER_HUB_PAGE_SIZE)
+        while next_page is not None and len(missing) > pages_left:
+            async with self._get_session().get(
+                next_page, timeout=aiohttp.ClientTimeout(total=_TAGS_TIMEOUT)
+            ) as response:
+                if response.status != 200:
+                    raise RegistryRequestError(
+                        "GET", next_page, response.status, await response.text()
+                    )
+                payload = await response.json(content_type=None)
+            results = payload.get("results") or []
+            for result in results:
+                if result.get("name") in missing and result.get("digest"):
+                    digests[result["name"]] = result["digest"]
+                    missing.discard(result["name"])
+            listed += len(results)
+            pages_left = math.ceil(
+                max(payload.get("count", 0) - listed, 0) / _DOCKER_HUB_PAGE_SIZE
+            )
+            next_page = URL(payload["next"]) if payload.get("next") else None
+        return digests
+
+    async def get_manifest(self, repository: str, reference: str) -> tuple[bytes, str]:
+        async with self._request(
+            "GET",
+            f"v2/{repository}/manifests/{reference}",
+            scopes=(_pull_scope(repository),),
+            expected=(200,),
+            headers={"Accept": _ACCEPT_MANIFESTS},
+        ) as response:
+            body = await response.read()
+            media_type = response.headers.get("Content-Type", "").split(";")[0]
+        return body, json.loads(body).get("mediaType", media_type)
+
+    async def put_manifest(
+        self, repository: str, reference: str, body: bytes, media_type: str
+    ) -> None:
+        async with self._request(
+            "PUT",
+            f"v2/{repository}/manifests/{reference}",
+            scopes=(_push_scope(repository),),
+            expected=(200, 201),
+            headers={"Content-Type": media_type},
+            data=body,
+        ):
+            pass
+
+    async def blob_exists(self, repository: str, digest: str) -> bool:
+        async with self._request(
+            "HEAD",
+            f"v2/{repository}/blobs/{digest}",
+            scopes=(_push_scope(repository),),
+            expected=(200, 404),
+        ) as response:
+            return response.status == 200
+
+    async def mount_blob(
+        self, repository: str, digest: str, *, from_repository: str
+    ) -> URL | None:
+        """cross-repository mount, returns ``None`` when the blob was mounted
+        otherwise the upload location the registry opened instead"""
+        async with self._request(
+            "POST",
+            f"v2/{repository}/blobs/uploads/",
+            scopes=(_push_scope(repository), _pull_scope(from_repository)),
+            expected=(201, 202),
+            params={"mount": digest, "from": from_repository},
+        ) as response:
+            if response.status == 201:
+                return None
+            return URL(response.headers["Location"])
+
+    async def stream_blob(self, repository: str, digest: str) -> AsyncIterator[bytes]:
+        async with self._request(
+            "GET",
+            f"v2/{repository}/blobs/{digest}",
+            scopes=(_pull_scope(repository),),
+            expected=(200,),
+        ) as response:
+            async for chunk in response.content.iter_chunked(_BLOB_CHUNK_SIZE):
+                yield chunk
+
+    async def upload_blob(
+        self,
+        repository: str,
+        digest: str,
+        size: int,
+        data: AsyncIterator[bytes],
+        *,
+        location: URL | None = None,
+    ) -> None:
+        scopes = (_push_scope(repository),)
+        if location is None:
+            async with self._request(
+                "POST",
+                f"v2/{repository}/blobs/uploads/",
+                scopes=scopes,
+                expected=(202,),
+            ) as response:
+                location = URL(response.headers["Location"])
+
+        async with self._request(
+            "PUT",
+            location.update_query(digest=digest),
+            scopes=scopes,
+            expected=(201,),
+            headers={
+                "Content-Type": "application/octet-stream",
+                "Content-Length": f"{size}",
+            },
+            data=data,
+        ):
+            pass
+        _uploaded_bytes[self.host] = _uploaded_bytes.get(self.host, 0) + size
+
+
+_credentials: dict[str, tuple[str, SecretStr]] = {}
+_clients: dict[tuple[str, bool], RegistryClient] = {}
+_blob_store: BlobStore | None = None
+# per registry host, for metrics
+_uploaded_bytes: dict[str, int] = {}
+
+
+def _get_client(host: str, *, skip_tls_verify: bool) -> RegistryClient:
+    key = (host, skip_tls_verify)
+    if key not in _clients:
+        _clients[key] = RegistryClient(
+            host, skip_tls_verify=skip_tls_verify, credentials=_credentials.get(host)
+        )
+    return _clients[key]
+
+
+@dataclass(frozen=True)
+class _CopyTarget:
+    image: RegistryImage
+    client: RegistryClient
+    repository: str
+    reference: str
+
+
+async def _fetch_image(
+    client: RegistryClient, repository: str, reference: str
+) -> tuple[list[tuple[str, bytes, str]], dict[str, dict[str, Any]]]:
+    """Reads all manifests of an image (all architectures) and the blobs they use.
+
+    Manifests are returned in the order they must be pushed: children before
+    the index referencing them, the manifest of ``reference`` is always last.
+    """
+    manifests: list[tuple[str, bytes, str]] = []
+    blobs: dict[str, dict[str, Any]] = {}
+
+    async def _fetch(manifest_reference: str) -> None:
+        body, media_type = await client.get_manifest(repository, manifest_reference)
+        manifest = json.loads(body)
+        if media_type in _INDEX_MEDIA_TYPES:
+            # children are referenced by digest
+            await asyncio.gather(*(_fetch(c["digest"]) for c in manifest["manifests"]))
+        else:
+            for blob in [manifest["config"], *manifest.get("layers", [])]:
+                # like crane, foreign layers are referenced and not copied
+                if not is_foreign(blob):
+                    blobs[blob["digest"]] = blob
+        manifests.append((manifest_reference, body, media_type))
+
+    await _fetch(reference)
+    return manifests, blobs
+
+
+async def _spool(chunks: AsyncIterator[bytes], path: Path) -> None:
+    with path.open("wb") as file:
+        async for chunk in chunks:
+            file.write(chunk)
+
+
+async def _read_file(path: Path) -> AsyncIterator[bytes]:
+    with path.open("rb") as file:
+        while chunk := file.read(_BLOB_CHUNK_SIZE):
+            yield chunk
+
+
+async def _collect_failure(
+    target: _CopyTarget,
+    failures: dict[_CopyTarget, BaseException],
+    coro: Awaitable[None],
+) -> None:
+    try:
+        await coro
+    except Exception as exc:  # pylint: disable=broad-except  # noqa: BLE001
+        failures.setdefault(target, exc)
+
+
+async def _distribute_blob(
+    src_client: RegistryClient,
+    src_repository: str,
+    targets: list[_CopyTarget],
+    descriptor: dict[str, Any],
+    *,
+    spool_dir: Path,
+    failures: dict[_CopyTarget, BaseException],
+) -> None:
+    """pushes a blob to every target missing it, pulling it from the source at most once"""
+    digest: str = descriptor["digest"]
+    uploads: dict[_CopyTarget, URL | None] = {}
+
+    async def _prepare(target: _CopyTarget) -> None:
+        if await target.client.blob_exists(target.repository, digest):
+            return
+        location: URL | None = None
+        if target.client.host == src_client.host:
+            location = await target.client.mount_blob(
+                target.repository, digest, from_repository=src_repository
+            )
+            if location is None:
+                _logger.debug("mounted '%s' from '%s'", digest, src_repository)
+                return
+        uploads[target] = location
+
+    await asyncio.gather(
+        *(
+            _collect_failure(target, failures, _prepare(target))
+            for target in targets
+            if target not in failures
+        )
+    )
+    if not uploads:
+        return
+
+    if _blob_store is not None:
+        try:
+            async with _blob_store.blob(
+                digest, lambda: src_client.stream_blob(src_repository, digest)
+            ) as stored_blob:
+                await _upload_from_file(descriptor, uploads, stored_blob, failures)
+        except Exception as exc:  # pylint: disable=broad-except  # noqa: BLE001
+            for target in uploads:
+                failures.setdefault(target, exc)
+        return
+
+    if len(uploads) == 1:
+        ((target, location),) = uploads.items()
+        data = src_client.stream_blob(src_repository, digest)
+        await _collect_failure(
+            target,
+            failures,
+            target.client.upload_blob(
+                target.repository, digest, descriptor["size"], data, location=location
+            ),
+        )
+        return
+
+    spooled_blob = spool_dir / digest.replace(":", "-")
+    try:
+        await _spool(src_client.stream_blob(src_repository, digest), spooled_blob)
+    except Exception as exc:  # pylint: disable=broad-except  # noqa: BLE001
+        for target in uploads:
+            failures.setdefault(target, exc)
+        return
+
+    await _upload_from_file(descriptor, uploads, spooled_blob, failures)
+
+
+async def _upload_from_file(
+    descriptor: dict[str, Any],
+    uploads: dict[_CopyTarget, URL | None],
+    path: Path,
+    failures: dict[_CopyTarget, BaseException],
+) -> None:
+    await asyncio.gather(
+        *(
+            _collect_failure(
+                target,
+                failures,
+                target.client.upload_blob(
+                    target.repository,
+                    descriptor["digest"],
+                    descriptor["size"],
+                    _read_file(path),
+                    location=location,
+                ),
+            )
+            for target, location in uploads.items()
+        )
+    )
+
+
+async def _push_manifests(
+    target: _CopyTarget, manifests: list[tuple[str, bytes, str]]
+) -> None:
+    *children, (_, body, media_type) = manifests
+    for reference, child_body, child_media_type in children:
+        await target.client.put_manifest(
+            target.repository, reference, child_body, child_media_type
+        )
+    await target.client.put_manifest(
+        target.repository, target.reference, body, media_type
+    )
+
+
+async def login(registry_url: str, username: str, password: SecretStr) -> None:
+    # like `crane auth login` nothing is contacted here, credentials are
+    # used once the registry asks for them
+    _credentials[_normalize_host(registry_url)] = (username, password)
+
+
+@cached(key_builder=image_key, plugins=[StatsPlugin(_cache_stats)])
+@coalesce(_cache_stats)
+async def get_digest(image: RegistryImage, *, skip_tls_verify: bool) -> str | None:
+    """computes the digest of an image, results are cached for efficiency"""
+    reference = _parse_image(image)
+    client = _get_client(reference.host, skip_tls_verify=skip_tls_verify)
+    try:
+        async with asyncio.timeout(delay=_DIGEST_TIMEOUT):
+            return await client.get_digest(reference.repository, reference.reference)
+    except TimeoutError as e:
+        raise RegistryRequestTimeoutError(image, _DIGEST_TIMEOUT) from e
+
+
+async def get_digests(
+    repository: RegistryImage, tags: list[DockerTag], *, skip_tls_verify: bool
+) -> dict[RegistryImage, str | None]:
+    """Digests of many tags of ``repository``, results are cached like ``get_digest``.
+
+    Many tags of a Docker Hub repository are resolved through its tag listing
+    API (see ``RegistryClient.list_docker_hub_digests``), all other tags get
+    one ``HEAD`` each over the pooled connections.
+    """
+    reference = _parse_image(repository)
+    client = _get_client(reference.host, skip_tls_verify=skip_tls_verify)
+
+    digests: dict[RegistryImage, str | None] = {}
+    if reference.host == _DOCKER_HUB_API_HOST:
+        try:
+            listed = await client.list_docker_hub_digests(reference.repository, tags)
+        except (aiohttp.ClientError, RegistryRequestError, TimeoutError) as e:
+            _logger.debug("could not list digests of '%s': %s", repository, e)
+            listed = {}
+        for tag in tags:
+            if tag in listed:
+                image = f"{repository}:{tag}"
+                digests[image] = listed[tag]
+                await get_digest.cache.set(image_key(get_digest, image), listed[tag])
+
+    missing_tags = [t for t in tags if f"{repository}:{t}" not in digests]
+    digests.update(
+        await get_digests_concurrently(
+            get_digest,
+            repository,
+            missing_tags,
+            skip_tls_verify=skip_tls_verify,
+            limit=_CONNECTIONS_PER_REGISTRY,
+        )
+    )
+    return digests
+
+
+async def get_image_size(image: RegistryImage, *, skip_tls_verify: bool) -> int | None:
+    """bytes of the distinct blobs of all architectures, ``None`` if it does not exist"""
+    reference = _parse_image(image)
+    client = _get_client(reference.host, skip_tls_verify=skip_tls_verify)
+    try:
+        async with asyncio.timeout(delay=_MANIFESTS_TIMEOUT):
+            _, blobs = await _fetch_image(
+                client, reference.repository, reference.reference
+            )
+    except TimeoutError as e:
+        raise RegistryRequestTimeoutError(image, _MANIFESTS_TIMEOUT) from e
+    except RegistryRequestError as e:
+        if e.status == 404:
+            return None
+        raise
+    return sum(blob["size"] for blob in blobs.values())
+
+
+async def copy(
+    source: RegistryImage,
+    destination: RegistryImage,
+    *,
+    src_skip_tls_verify: bool,
+    dst_skip_tls_verify: bool,
+) -> None:
+    failures = await copy_to_many(
+        source,
+        {destination: dst_skip_tls_verify},
+        src_skip_tls_verify=src_skip_tls_verify,
+    )
+    if (error := failures.get(destination)) is not None:
+        raise error
+
+
+async def copy_to_many(
+    source: RegistryImage,
+    destinations: dict[RegistryImage, bool],
+    *,
+    src_skip_tls_verify: bool,
+) -> dict[RegistryImage, BaseException]:
+    """Copies ``source`` to all ``destinations`` (mapped to their ``skip_tls_verify``).
+
+    Manifests and blobs are pulled once from the source, blobs are mounted
+    on destinations which are on the same registry as the source.
+    Raises if the source cannot be read, failures of single destinations
+    are returned instead.
+    """
+    src_reference = _parse_image(source)
+    src_client = _get_client(src_reference.host, skip_tls_verify=src_skip_tls_verify)
+    targets: list[_CopyTarget] = []
+    for destination, dst_skip_tls_verify in destinations.items():
+        dst_reference = _parse_image(destination)
+        targets.append(
+            _CopyTarget(
+                image=destination,
+                client=_get_client(
+                    dst_reference.host, skip_tls_verify=dst_skip_tls_verify
+                ),
+                repository=dst_reference.repository,
+                reference=dst_reference.reference,
+            )
+        )
+
+    manifests, blobs = await _fetch_image(
+        src_client, src_reference.repository, src_reference.reference
+    )
+
+    failures: dict[_CopyTarget, BaseException] = {}
+    with tempfile.TemporaryDirectory(prefix="reposync-") as spool_dir:
+        await asyncio.gather(
+            *(
+                _distribute_blob(
+                    src_client,
+                    src_reference.repository,
+                    targets,
+                    descriptor,
+                    spool_dir=Path(spool_dir),
+                    failures=failures,
+                )
+                for descriptor in blobs.values()
+            )
+        )
+
+    await asyncio.gather(
+        *(
+            _collect_failure(target, failures, _push_manifests(target, manifests))
+            for target in targets
+            if target not in failures
+        )
+    )
+    return {target.image: error for target, error in failures.items()}
+
+
+@cached(key_builder=image_key, plugins=[StatsPlugin(_cache_stats)])
+@coalesce(_cache_stats)
+async def get_image_tags(image: RegistryImage, *, skip_tls_verify: bool) -> list[str]:
+    reference = _parse_image(image)
+    client = _get_client(reference.host, skip_tls_verify=skip_tls_verify)
+    try:
+        async with asyncio.timeout(delay=_TAGS_TIMEOUT):
+            tags = await client.list_tags(reference.repository)
+    except TimeoutError as e:
+        raise RegistryRequestTimeoutError(image, _TAGS_TIMEOUT) from e
+    # same as `crane ls --omit-digest-tags`
+    return [t for t in tags if not t.startswith("sha256-")]
+
+
+async def clear_cache() -> None:
+    await get_digest.cache.clear()
+    await get_image_tags.cache.clear()
+
+
+async def invalidate(image: RegistryImage) -> None:
+    """drops the cached digest of ``image`` and the tags of its repository"""
+    await evict(get_digest, image, _cache_stats)
+    await evict(get_image_tags, get_repository(image), _cache_stats)
+
+
+def get_cache_stats() -> CacheStats:
+    return _cache_stats
+
+
+def use_blob_store(blob_store: BlobStore | None) -> None:
+    """blobs are read from ``blob_store`` before pulling them from the source"""
+    global _blob_store  # pylint: disable=global-statement
+    _blob_store = blob_store
+
+
+def get_blob_stats() -> BlobStats | None:
+    return None if _blob_store is None else _blob_store.stats
+
+
+def get_uploaded_bytes() -> dict[str, int]:
+    """bytes of all blobs pushed so far, per registry host"""
+    return dict(_uploaded_bytes)
+
+
+async def close() -> None:
+    """releases all pooled connections and detaches the blob store"""
+    use_blob_store(None)
+    clients = list(_clients.values())
+    _clients.clear()
+    await asyncio.gather(*(c.close() for c in clients))
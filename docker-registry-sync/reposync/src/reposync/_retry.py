@@ -0,0 +1,69 @@
+"""Which registry errors are worth retrying and how long to wait before."""
+
+import random
+import re
+from dataclasses import dataclass
+from typing import Final
+
+import aiohttp
+from pydantic import NonNegativeFloat, NonNegativeInt
+
+from ._blob_store import BlobDigestMismatchError
+from ._crane import CraneCommandError, CraneCommandTimeoutError
+from ._rate_limit import RegistryRateLimitedError
+from ._registry import RegistryRequestError, RegistryRequestTimeoutError
+
+# statuses for which the same request might succeed later
+_RETRYABLE_STATUSES: Final[set[int]] = {408, 425, 429, 500, 502, 503, 504}
+
+# crane only reports errors as text
+_CRANE_RETRYABLE_OUTPUT: Final[re.Pattern] = re.compile(
+    r"status code (408|425|429|5\d\d)\b"
+    r"|connection (reset|refused)"
+    r"|broken pipe"
+    r"|i/o timeout"
+    r"|TLS handshake timeout"
+    r"|unexpected EOF"
+    r"|context deadline exceeded",
+    re.IGNORECASE,
+)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """``True`` for transient errors (timeouts, 5xx, dropped connections),
+    ``False`` for permanent ones (not found, authentication, bad input)"""
+    if isinstance(
+        exc,
+        (
+            TimeoutError,
+            CraneCommandTimeoutError,
+            RegistryRequestTimeoutError,
+            RegistryRateLimitedError,
+            BlobDigestMismatchError,
+            aiohttp.ClientConnectionError,
+            aiohttp.ClientPayloadError,
+            ConnectionError,
+        ),
+    ):
+        return True
+    if isinstance(exc, RegistryRequestError):
+        return exc.status in _RETRYABLE_STATUSES
+    if isinstance(exc, CraneCommandError):
+        return _CRANE_RETRYABLE_OUTPUT.search(f"{exc}") is not None
+    return False
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """``retries`` extra attempts per operation, waiting a random time up to
+    ``initial_delay * 2**attempt`` (capped at ``max_delay``) before each"""
+
+    retries: NonNegativeInt = 0
+    initial_delay: NonNegativeFloat = 1
+    max_delay: NonNegativeFloat = 30
+
+    def get_delay(self, attempt: NonNegativeInt) -> NonNegativeFloat:
+        # "full jitter", retries of many tasks failing together spread out
+        return random.uniform(  # noqa: S311 # nosec
+            0, min(self.max_delay, self.initial_delay * 2**attempt)
+        )
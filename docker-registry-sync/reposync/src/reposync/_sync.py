@@ -1,33 +1,79 @@
 import asyncio
 import contextlib
+import heapq
+import itertools
+import json
 import logging
+import time
 import traceback
-from dataclasses import dataclass, field
-from datetime import datetime, timezone
+from dataclasses import asdict, dataclass, field, replace
+from datetime import datetime, timedelta, timezone
 from enum import Enum
 from pathlib import Path
-from typing import Any, Coroutine, Final
-
-from networkx import DiGraph, is_directed_acyclic_graph
-from pydantic import NonNegativeInt
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Final,
+    Hashable,
+    Iterable,
+    Iterator,
+    TypeVar,
+)
 
-from . import _crane
+from networkx import (
+    DiGraph,
+    Graph,
+    ancestors,
+    connected_components,
+    descendants,
+    is_directed_acyclic_graph,
+    topological_sort,
+)
+from pydantic import NonNegativeFloat, NonNegativeInt, PositiveInt
+
+from . import _registry, _tracing
+from ._backend import (
+    Backend,
+    RateLimitedBackend,
+    RegistryBackend,
+    TracingBackend,
+    get_backend,
+)
+from ._blob_store import BlobStats, BlobStore
+from ._cache import CacheStats
+from ._digest_cache import DigestCache, PersistentDigestBackend
+from ._journal import Journal
+from ._metrics import MeteredBackend, Metrics, export_metrics
 from ._models import (
     Configuration,
     DockerImage,
     RegistryImage,
     DockerTag,
     FromEntry,
+    Registry,
     RegistryKey,
     Stage,
     StageID,
     TaskID,
     ToEntry,
 )
+from ._rate_limit import RegistryLimiter
+from ._retry import RetryPolicy, is_retryable
+from ._tags import select_tags
+from ._work_queue import WorkQueue
 
 _logger = logging.getLogger(__name__)
 
 _PROGRESS_INTERVAL_SECONDS: Final[float] = 5.0
+_TIMINGS_FILE_NAME: Final[str] = "timings.json"
+_SLOWEST_TASKS: Final[int] = 10
+# NOTE: a copy also costs digest lookups and manifest pushes, counted like
+# this many bytes so that long chains of small images still rank high
+_TASK_OVERHEAD_BYTES: Final[int] = 10 * 1024**2
+DEFAULT_BLOB_CACHE_MAX_BYTES: Final[NonNegativeInt] = 10 * 1024**3
+
+_T = TypeVar("_T")
 
 
 class CopyResult(str, Enum):
@@ -35,6 +81,13 @@ class CopyResult(str, Enum):
     COPIED = "copied"
 
 
+class _Phase(str, Enum):
+    QUEUE_WAIT = "queue-wait"
+    SRC_DIGEST = "source-digest"
+    DST_DIGEST = "destination-digest"
+    COPY = "copy"
+
+
 class CyclicDependencyError(RuntimeError):
     def __init__(self, predecessors: dict[TaskID, list[TaskID]]):
         super().__init__(
@@ -42,6 +95,10 @@ class CyclicDependencyError(RuntimeError):
         )
 
 
+class RemoteTaskError(RuntimeError):
+    """a task failed on a worker, the message is the worker's traceback"""
+
+
 @dataclass(frozen=True)
 class _SyncTask:
     task_id: TaskID
@@ -53,22 +110,86 @@ class _SyncTask:
     src_path: DockerImage
     dst_path: DockerImage
     tag: DockerTag
+    # matches the ``immutable_tags`` of its ``ToEntry``
+    immutable: bool = False
 
 
-async def _login_into_all_registries(configuration: Configuration) -> None:
-    for registry in configuration.registries.values():
+async def _gather_bounded(
+    coros: Iterable[Awaitable[_T]], *, limit: NonNegativeInt
+) -> list[_T]:
+    """like ``asyncio.gather`` but at most ``limit`` awaitables run at once"""
+    semaphore = asyncio.Semaphore(max(limit, 1))
+
+    async def _bounded(coro: Awaitable[_T]) -> _T:
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(_bounded(coro) for coro in coros))
+
+
+async def _login_into_all_registries(
+    configuration: Configuration,
+    backend: RegistryBackend,
+    *,
+    parallel_discovery_tasks: NonNegativeInt,
+) -> None:
+    async def _login(registry: Registry) -> None:
         _logger.debug("logging into '%s'", registry.url)
-        await _crane.login(registry.url, registry.env_user, registry.env_password)
+        await backend.login(registry.url, registry.env_user, registry.env_password)
 
+    with _tracing.span("login"):
+        await _gather_bounded(
+            (_login(registry) for registry in configuration.registries.values()),
+            limit=parallel_discovery_tasks,
+        )
 
-async def _get_tags_to_sync(
-    image: RegistryImage, defined_tags: list[DockerTag], *, use_explicit_tags: bool
-) -> list[DockerTag]:
+
+def _lists_all_tags(to_entry: ToEntry, *, use_explicit_tags: bool) -> bool:
     # if `use_explicit_tags is False` and `tags: []` in the configuration
-    # it will fetch all tags from the remote repository
-    if len(defined_tags) == 0 and not use_explicit_tags:
-        return await _crane.get_image_tags(image)
-    return defined_tags
+    # it will fetch all tags from the remote repository, tag selectors
+    # (`include`, `semver`, ...) are explicit enough in any case
+    return len(to_entry.tags) == 0 and (not use_explicit_tags or to_entry.selects_tags)
+
+
+async def _list_tags(
+    backend: RegistryBackend,
+    images: dict[RegistryImage, bool],
+    *,
+    parallel_discovery_tasks: NonNegativeInt,
+) -> dict[RegistryImage, list[DockerTag]]:
+    """lists the tags of all ``images`` (mapped to their ``skip_tls_verify``) concurrently"""
+    listed_tags = await _gather_bounded(
+        (
+            backend.get_image_tags(image, skip_tls_verify=skip_tls_verify)
+            for image, skip_tls_verify in images.items()
+        ),
+        limit=parallel_discovery_tasks,
+    )
+    return dict(zip(images.keys(), listed_tags))
+
+
+def _get_tags_to_sync(
+    image: RegistryImage,
+    to_entry: ToEntry,
+    listed_tags: dict[RegistryImage, list[DockerTag]],
+    *,
+    use_explicit_tags: bool,
+) -> list[DockerTag]:
+    """defined (or listed) tags narrowed down by the selectors of ``to_entry``"""
+    tags = (
+        listed_tags[image]
+        if _lists_all_tags(to_entry, use_explicit_tags=use_explicit_tags)
+        else to_entry.tags
+    )
+    if not to_entry.selects_tags:
+        return tags
+    return select_tags(
+        tags,
+        include=to_entry.include,
+        exclude=to_entry.exclude,
+        semver=to_entry.semver,
+        newest=to_entry.newest,
+    )
 
 
 def _get_unique_task_id(
@@ -82,6 +203,16 @@ def _get_unique_task_id(
     )
 
 
+def _get_journal_key(sync_task: _SyncTask) -> TaskID:
+    """the task id without its stage, which is new every run for stages
+    without an ``id``. Journal entries hold for the same copy in any stage."""
+    return (
+        f"{sync_task.src}/{sync_task.src_path}:{sync_task.tag}"
+        " --> "
+        f"{sync_task.dst}/{sync_task.dst_path}:{sync_task.tag}"
+    )
+
+
 def _get_registry_image(
     *, url: str, image: DockerImage, tag: DockerTag | None = None
 ) -> RegistryImage:
@@ -89,20 +220,54 @@ def _get_registry_image(
     return image_path if tag is None else f"{image_path}:{tag}"
 
 
+def _get_src_image(configuration: Configuration, sync_task: _SyncTask) -> RegistryImage:
+    return _get_registry_image(
+        url=configuration.registries[sync_task.src].url,
+        image=sync_task.src_path,
+        tag=sync_task.tag,
+    )
+
+
+def _get_dst_image(configuration: Configuration, sync_task: _SyncTask) -> RegistryImage:
+    return _get_registry_image(
+        url=configuration.registries[sync_task.dst].url,
+        image=sync_task.dst_path,
+        tag=sync_task.tag,
+    )
+
+
 async def _get_sync_tasks(
-    configuration: Configuration, *, use_explicit_tags: bool
+    configuration: Configuration,
+    backend: RegistryBackend,
+    *,
+    use_explicit_tags: bool,
+    parallel_discovery_tasks: NonNegativeInt,
 ) -> list[_SyncTask]:
     sync_tasks: list[_SyncTask] = []
 
+    # identical source repositories are only listed once
+    images_to_list: dict[RegistryImage, bool] = {}
+    for stage in configuration.stages:
+        src_registry = configuration.registries[stage.from_entry.source]
+        for to_entry in stage.to_entries:
+            if _lists_all_tags(to_entry, use_explicit_tags=use_explicit_tags):
+                image = _get_registry_image(
+                    url=src_registry.url, image=stage.from_entry.repository
+                )
+                images_to_list[image] = src_registry.skip_tls_verify
+
+    listed_tags = await _list_tags(
+        backend, images_to_list, parallel_discovery_tasks=parallel_discovery_tasks
+    )
+
     for stage in configuration.stages:
         from_entry = stage.from_entry
+        src_registry = configuration.registries[from_entry.source]
         for to_entry in stage.to_entries:
-            tags_to_sync = await _get_tags_to_sync(
-                _get_registry_image(
-                    url=configuration.registries[from_entry.source].url,
-                    image=from_entry.repository,
-                ),
-                to_entry.tags,
+            tags_to_sync = _get_tags_to_sync(
+                _get_registry_image(url=src_registry.url, image=from_entry.repository),
+                to_entry,
+                listed_tags,
                 use_explicit_tags=use_explicit_tags,
             )
 
@@ -117,6 +282,8 @@ async def _get_sync_tasks(
                     src_path=from_entry.repository,
                     dst_path=to_entry.repository,
                     tag=tag,
+                    immutable=to_entry.immutable_tags is not None
+                    and to_entry.immutable_tags.fullmatch(tag) is not None,
                 )
                 sync_tasks.append(sync_task)
 
@@ -137,13 +304,124 @@ async def _get_sync_tasks(
 @dataclass
 class ExecutionPlan:
     task_mapping: dict[TaskID, _SyncTask]
+    # NOTE: besides tasks, contains one virtual join node per stage which
+    # other stages depend on. The join node waits for all tasks of its stage
+    # and dependent tasks wait for the join node. This keeps the amount of
+    # edges linear in tasks + stages instead of tasks x tasks.
     predecessors: dict[TaskID, list[TaskID]]
+    join_ids: set[TaskID] = field(default_factory=set)
+    # stages sorted so that every stage comes after the ones it depends on
+    stage_order: list[StageID] = field(default_factory=list)
+    # tasks declared by several stages only run once, keyed by the one kept
+    duplicates: dict[TaskID, list[TaskID]] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class Shard:
+    """the ``index`` (counted from 1) of ``count`` processes splitting a sync"""
+
+    index: PositiveInt
+    count: PositiveInt
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+    @classmethod
+    def parse(cls, value: str) -> "Shard":
+        """``"2/4"`` -> ``Shard(index=2, count=4)``"""
+        index, _, count = value.partition("/")
+        if not (index.isdigit() and count.isdigit() and 1 <= int(index) <= int(count)):
+            msg = f"{value=} must look like 'INDEX/COUNT' with 1 <= INDEX <= COUNT"
+            raise ValueError(msg)
+        return cls(int(index), int(count))
+
+    def get_file(self, path: Path) -> Path:
+        """``path`` with the shard in its name, shards do not overwrite each other"""
+        return path.with_name(
+            f"{path.stem}.shard-{self.index}-of-{self.count}{path.suffix}"
+        )
+
+
+def _get_stage_join_id(stage_id: StageID) -> TaskID:
+    return f"#{stage_id} done"
+
+
+def _get_duplicate_tasks(
+    configuration: Configuration,
+    sync_tasks: list[_SyncTask],
+    stage_graph: DiGraph,
+    stage_order: list[StageID],
+) -> dict[TaskID, list[_SyncTask]]:
+    """Maps tasks copying an image which other stages copy to the same
+    destination as well, to the duplicates they stand for.
+
+    Only tasks of stages which do not depend on each other (also transitively)
+    are merged: the kept task waits for the dependencies of all their stages,
+    which would be a cycle otherwise. It is the one of the stage coming last
+    in ``stage_order``.
+    """
+    # NOTE: only stages sharing a source and destination repository can
+    # declare the same copy, tasks of all others are not looked at
+    repository_stages: dict[tuple, set[StageID]] = {}
+    for stage in configuration.stages:
+        for to_entry in stage.to_entries:
+            repository_stages.setdefault(
+                (
+                    stage.from_entry.source,
+                    stage.from_entry.repository,
+                    to_entry.destination,
+                    to_entry.repository,
+                ),
+                set(),
+            ).add(stage.id)
+    candidate_stages = {
+        stage_id
+        for stage_ids in repository_stages.values()
+        if len(stage_ids) > 1
+        for stage_id in stage_ids
+    }
+    if not candidate_stages:
+        return {}
+
+    copies: dict[tuple, list[_SyncTask]] = {}
+    for t in sync_tasks:
+        if t.stage_id in candidate_stages:
+            key = (t.src, t.src_path, t.dst, t.dst_path, t.tag)
+            copies.setdefault(key, []).append(t)
+
+    position = {stage_id: i for i, stage_id in enumerate(stage_order)}
+    related: dict[StageID, set[StageID]] = {}
+    duplicates: dict[TaskID, list[_SyncTask]] = {}
+    for tasks in copies.values():
+        if len(tasks) == 1:
+            continue
+        kept: list[list[_SyncTask]] = []
+        for sync_task in sorted(tasks, key=lambda t: -position[t.stage_id]):
+            stage_id = sync_task.stage_id
+            if stage_id not in related:
+                related[stage_id] = ancestors(stage_graph, stage_id) | descendants(
+                    stage_graph, stage_id
+                )
+            for group in kept:
+                if not any(t.stage_id in related[stage_id] for t in group):
+                    group.append(sync_task)
+                    break
+            else:
+                kept.append([sync_task])
+        for first, *others in kept:
+            if others:
+                duplicates[first.task_id] = others
+    return duplicates
 
 
 def _get_execution_plan(
     configuration: Configuration, sync_tasks: list[_SyncTask]
 ) -> ExecutionPlan:
-    """transforms stage dependencies into ordered groups of sync tasks to run in parallel"""
+    """Transforms stage dependencies into a graph of sync tasks.
+
+    A copy declared by several independent stages becomes one task, which
+    runs after the dependencies of each of them and before their dependents.
+    """
 
     stage_mapping: dict[StageID, Stage] = {s.id: s for s in configuration.stages}
     task_mapping: dict[TaskID, _SyncTask] = {task.task_id: task for task in sync_tasks}
@@ -152,137 +430,976 @@ def _get_execution_plan(
         msg = f"Issue deteceted size of task_mapping {len(task_mapping)} != {len(sync_tasks)} number of sync_tasks"
         raise ValueError(msg)
 
-    stage_to_tasks_mapping: dict[StageID, set[_SyncTask]] = {}
+    # cycles are checked on the (small) graph of stages
+    stage_predecessors: dict[StageID, list[StageID]] = {
+        stage.id: list(stage.depends_on) for stage in configuration.stages
+    }
+    stage_graph = DiGraph()
+    stage_graph.add_nodes_from(stage_predecessors.keys())
+    for stage_id, depends_on in stage_predecessors.items():
+        stage_graph.add_edges_from((d, stage_id) for d in depends_on)
+    if not is_directed_acyclic_graph(stage_graph):
+        raise CyclicDependencyError(stage_predecessors)
+
+    join_ids: dict[StageID, TaskID] = {
+        stage_id: _get_stage_join_id(stage_id)
+        for stage in configuration.stages
+        for stage_id in stage.depends_on
+    }
+    stage_order = list(topological_sort(stage_graph))
+    duplicates = _get_duplicate_tasks(
+        configuration, sync_tasks, stage_graph, stage_order
+    )
+    merged = {t.task_id for tasks in duplicates.values() for t in tasks}
 
+    predecessors: dict[TaskID, list[TaskID]] = {
+        join_id: [] for join_id in join_ids.values()
+    }
     for task in sync_tasks:
-        if task.stage_id not in stage_to_tasks_mapping:
-            stage_to_tasks_mapping[task.stage_id] = set()
+        if task.task_id in merged:
+            continue
+        stage_ids = [task.stage_id]
+        depends_on = stage_mapping[task.stage_id].depends_on
+        if task.task_id in duplicates:
+            stage_ids += [t.stage_id for t in duplicates[task.task_id]]
+            depends_on = list(
+                dict.fromkeys(d for s in stage_ids for d in stage_mapping[s].depends_on)
+            )
+        predecessors[task.task_id] = [join_ids[stage_id] for stage_id in depends_on]
+        for stage_id in stage_ids:
+            if stage_id in join_ids:
+                predecessors[join_ids[stage_id]].append(task.task_id)
+
+    if merged:
+        task_mapping = {k: v for k, v in task_mapping.items() if k not in merged}
+    return ExecutionPlan(
+        task_mapping,
+        predecessors,
+        set(join_ids.values()),
+        stage_order,
+        {task_id: [t.task_id for t in tasks] for task_id, tasks in duplicates.items()},
+    )
 
-        stage_to_tasks_mapping[task.stage_id].add(task)
 
-    graph = DiGraph()
-    graph.add_nodes_from(task_mapping.keys())
-    for task in sync_tasks:
-        task_depedns_on: list[StageID] = stage_mapping[task.stage_id].depends_on
+def _prune_execution_plan(
+    configuration: Configuration,
+    execution_plan: ExecutionPlan,
+    known_digests: dict[RegistryImage, str | None],
+    journal_entries: dict[TaskID, str] | None = None,
+    trusted: set[TaskID] | None = None,
+) -> tuple[ExecutionPlan, list[TaskID], list[TaskID]]:
+    """Removes tasks whose destination already has the digest of their source,
+    so that sync slots only go to images which need copying. ``trusted``
+    tasks (see ``_diff_tag_sets``) are removed like those. When resuming,
+    tasks finished with the current source digest (see ``Journal``) are
+    removed as well.
+
+    Stages are visited in dependency order. A task reading an image which a
+    remaining task writes is always kept, its source is about to change.
+    Returns the pruned plan, the task ids removed because of the same digest
+    and the ones removed because they were already finished.
+    """
+    journal_entries = journal_entries or {}
+    trusted = trusted or set()
+    stage_tasks: dict[StageID, list[_SyncTask]] = {}
+    for sync_task in execution_plan.task_mapping.values():
+        stage_tasks.setdefault(sync_task.stage_id, []).append(sync_task)
+
+    written: set[RegistryImage] = set()
+    pruned: set[TaskID] = set()
+    resumed: set[TaskID] = set()
+    for stage_id in execution_plan.stage_order:
+        for sync_task in stage_tasks.get(stage_id, []):
+            src_image = _get_src_image(configuration, sync_task)
+            dst_image = _get_dst_image(configuration, sync_task)
+            src_digest = known_digests.get(src_image)
+            if src_image in written:
+                written.add(dst_image)
+            elif sync_task.task_id in trusted:
+                pruned.add(sync_task.task_id)
+            elif src_digest is None:
+                written.add(dst_image)
+            elif journal_entries.get(_get_journal_key(sync_task)) == src_digest:
+                resumed.add(sync_task.task_id)
+            elif src_digest == known_digests.get(dst_image):
+                pruned.add(sync_task.task_id)
+            else:
+                written.add(dst_image)
+    removed = pruned | resumed
+
+    pruned_plan = ExecutionPlan(
+        task_mapping={
+            task_id: sync_task
+            for task_id, sync_task in execution_plan.task_mapping.items()
+            if task_id not in removed
+        },
+        predecessors={
+            task_id: [p for p in requirements if p not in removed]
+            for task_id, requirements in execution_plan.predecessors.items()
+            if task_id not in removed
+        },
+        join_ids=execution_plan.join_ids,
+        stage_order=execution_plan.stage_order,
+        duplicates={
+            task_id: duplicates
+            for task_id, duplicates in execution_plan.duplicates.items()
+            if task_id not in removed
+        },
+    )
+    return pruned_plan, sorted(pruned), sorted(resumed)
+
 
-        tasks_required_to_finish: set[TaskID] = set()
-        for stage_id in task_depedns_on:
-            tasks_in_stage = stage_to_tasks_mapping[stage_id]
-            for stage_task in tasks_in_stage:
-                tasks_required_to_finish.add(stage_task.task_id)
+def _shard_execution_plan(
+    execution_plan: ExecutionPlan,
+    shard: Shard,
+    costs: dict[TaskID, int] | None = None,
+) -> ExecutionPlan:
+    """Keeps the part of the plan which ``shard`` runs.
 
-        node_edges = [(task_id, task.task_id) for task_id in tasks_required_to_finish]
-        graph.add_edges_from(node_edges)
+    Tasks connected by dependencies (through the join nodes of their stages)
+    always end up on the same shard. Starting with the most expensive, every
+    group of connected tasks goes to the shard with the lowest total so far.
+    Costs default to one per task. The result only depends on the plan, every
+    shard computes the same partition.
+    """
+    graph = Graph()
+    graph.add_nodes_from(execution_plan.predecessors)
+    for task_id, requirements in execution_plan.predecessors.items():
+        graph.add_edges_from((r, task_id) for r in requirements)
+
+    def _cost(task_id: TaskID) -> int:
+        if task_id not in execution_plan.task_mapping:
+            return 0
+        return 1 if costs is None else costs[task_id]
+
+    components = sorted(
+        (
+            (sum(_cost(t) for t in component), min(component), component)
+            for component in connected_components(graph)
+        ),
+        key=lambda item: (-item[0], item[1]),
+    )
+    # (total cost, shard index) of every shard
+    totals = [(0, index) for index in range(1, shard.count + 1)]
+    selected: set[TaskID] = set()
+    for cost, _, component in components:
+        total, index = heapq.heappop(totals)
+        heapq.heappush(totals, (total + cost, index))
+        if index == shard.index:
+            selected |= component
+
+    return ExecutionPlan(
+        task_mapping={
+            task_id: sync_task
+            for task_id, sync_task in execution_plan.task_mapping.items()
+            if task_id in selected
+        },
+        predecessors={
+            task_id: requirements
+            for task_id, requirements in execution_plan.predecessors.items()
+            if task_id in selected
+        },
+        join_ids=execution_plan.join_ids & selected,
+        stage_order=execution_plan.stage_order,
+        duplicates={
+            task_id: duplicates
+            for task_id, duplicates in execution_plan.duplicates.items()
+            if task_id in selected
+        },
+    )
 
-    predecessors: dict[TaskID, list[TaskID]] = {}
-    for node in task_mapping.keys():
-        predecessors[node] = [x for x in graph.predecessors(node)]
 
-    if not is_directed_acyclic_graph(graph):
-        raise CyclicDependencyError(predecessors)
-    return ExecutionPlan(task_mapping, predecessors)
+async def _resolve_digests(
+    configuration: Configuration,
+    backend: RegistryBackend,
+    sync_tasks: list[_SyncTask],
+    *,
+    parallel_discovery_tasks: NonNegativeInt,
+    journaled: Iterable[TaskID] = (),
+    decided: Iterable[TaskID] = (),
+) -> dict[RegistryImage, str | None]:
+    """Looks up the digests of all source and destination images up front,
+    with one bulk request per repository instead of one per image.
+
+    Destinations of tasks whose ``_get_journal_key`` is ``journaled`` are
+    skipped, their source digest is compared with the journal instead.
+    Images of ``decided`` tasks (see ``_diff_tag_sets``) are not looked up
+    at all.
+    Repositories which cannot be resolved are left out, their images are
+    looked up one by one (and fail) while syncing.
+    """
+    journaled = set(journaled)
+    decided = set(decided)
+    repositories: dict[tuple[RegistryImage, bool], set[DockerTag]] = {}
+    for sync_task in sync_tasks:
+        if sync_task.task_id in decided:
+            continue
+        images = [(sync_task.src, sync_task.src_path)]
+        if _get_journal_key(sync_task) not in journaled:
+            images.append((sync_task.dst, sync_task.dst_path))
+        for registry_key, path in images:
+            registry = configuration.registries[registry_key]
+            key = (
+                _get_registry_image(url=registry.url, image=path),
+                registry.skip_tls_verify,
+            )
+            repositories.setdefault(key, set()).add(sync_task.tag)
+
+    async def _resolve(
+        repository: RegistryImage, skip_tls_verify: bool, tags: set[DockerTag]
+    ) -> dict[RegistryImage, str | None]:
+        try:
+            return await backend.get_digests(
+                repository, sorted(tags), skip_tls_verify=skip_tls_verify
+            )
+        except Exception as exc:  # pylint: disable=broad-except  # noqa: BLE001
+            _logger.warning("Could not resolve digests of '%s': %s", repository, exc)
+            return {}
+
+    resolved = await _gather_bounded(
+        (
+            _resolve(repository, skip_tls_verify, tags)
+            for (repository, skip_tls_verify), tags in repositories.items()
+        ),
+        limit=parallel_discovery_tasks,
+    )
+    digests: dict[RegistryImage, str | None] = {}
+    for repository_digests in resolved:
+        digests.update(repository_digests)
+    _logger.info(
+        "Resolved '%s' digests of '%s' repositories", len(digests), len(repositories)
+    )
+    return digests
+
+
+async def _get_image_sizes(
+    configuration: Configuration,
+    backend: RegistryBackend,
+    sync_tasks: Iterable[_SyncTask],
+    *,
+    parallel_discovery_tasks: NonNegativeInt,
+) -> dict[RegistryImage, int | None]:
+    """Sizes of the source images of ``sync_tasks``, one lookup per image
+    however many destinations it has. Images which do not exist (yet) or
+    cannot be looked up have no size.
+    """
+    sources: dict[RegistryImage, bool] = {
+        _get_src_image(configuration, sync_task): configuration.registries[
+            sync_task.src
+        ].skip_tls_verify
+        for sync_task in sync_tasks
+    }
+
+    async def _get_size(image: RegistryImage, skip_tls_verify: bool) -> int | None:
+        try:
+            return await backend.get_image_size(image, skip_tls_verify=skip_tls_verify)
+        except Exception as exc:  # pylint: disable=broad-except  # noqa: BLE001
+            _logger.warning("Could not get the size of '%s': %s", image, exc)
+            return None
+
+    sizes = await _gather_bounded(
+        (_get_size(image, skip) for image, skip in sources.items()),
+        limit=parallel_discovery_tasks,
+    )
+    return dict(zip(sources, sizes))
+
+
+async def _get_shard_plan(
+    configuration: Configuration,
+    backend: RegistryBackend,
+    execution_plan: ExecutionPlan,
+    shard: Shard,
+    *,
+    by_size: bool,
+    parallel_discovery_tasks: NonNegativeInt,
+) -> tuple[ExecutionPlan, dict[RegistryImage, int | None] | None]:
+    """the part of the (not yet pruned) plan ``shard`` runs, ``by_size`` balanced
+    by the sizes of all images to copy which are returned as well"""
+    if not by_size:
+        return _shard_execution_plan(execution_plan, shard), None
+
+    # NOTE: looked up before pruning, so that every shard has the same costs
+    image_sizes = await _get_image_sizes(
+        configuration,
+        backend,
+        execution_plan.task_mapping.values(),
+        parallel_discovery_tasks=parallel_discovery_tasks,
+    )
+    costs = {
+        task_id: _TASK_OVERHEAD_BYTES
+        + (image_sizes.get(_get_src_image(configuration, sync_task)) or 0)
+        for task_id, sync_task in execution_plan.task_mapping.items()
+    }
+    return _shard_execution_plan(execution_plan, shard, costs), image_sizes
+
+
+def _get_stage_depths(
+    configuration: Configuration, execution_plan: ExecutionPlan
+) -> dict[StageID, int]:
+    """how many stages with tasks run one after another up to (and with) each stage"""
+    stage_mapping: dict[StageID, Stage] = {s.id: s for s in configuration.stages}
+    stages_with_tasks = {t.stage_id for t in execution_plan.task_mapping.values()}
+    depths: dict[StageID, int] = {}
+    for stage_id in execution_plan.stage_order:
+        depths[stage_id] = int(stage_id in stages_with_tasks) + max(
+            (depths[d] for d in stage_mapping[stage_id].depends_on), default=0
+        )
+    return depths
+
+
+def _get_plan_report(
+    configuration: Configuration,
+    execution_plan: ExecutionPlan,
+    pruned_plan: ExecutionPlan,
+    known_digests: dict[RegistryImage, str | None],
+    image_sizes: dict[RegistryImage, int | None],
+    trusted: set[TaskID] | None = None,
+) -> dict[str, Any]:
+    """Describes what a sync would do: which tasks copy (and why) or are skipped,
+    per stage and in total, with the bytes of the images to copy.
+
+    Bytes are an upper bound: the whole source image is counted for every
+    destination, layers a destination already has are not subtracted.
+    """
+    stage_tasks: dict[StageID, list[_SyncTask]] = {}
+    for sync_task in execution_plan.task_mapping.values():
+        stage_tasks.setdefault(sync_task.stage_id, []).append(sync_task)
+
+    # NOTE: visited like `_prune_execution_plan` so reasons match its decisions
+    written: set[RegistryImage] = set()
+    tasks: list[dict[str, Any]] = []
+    stages: dict[StageID, dict[str, int]] = {}
+    for stage_id in execution_plan.stage_order:
+        stage = stages[stage_id] = {"total": 0, "copy": 0, "skip": 0, "bytes": 0}
+        for sync_task in stage_tasks.get(stage_id, []):
+            src_image = _get_src_image(configuration, sync_task)
+            dst_image = _get_dst_image(configuration, sync_task)
+            size = 0
+            if sync_task.task_id in (trusted or set()):
+                action, reason = "skip", "immutable-present"
+            elif sync_task.task_id not in pruned_plan.task_mapping:
+                action, reason = "skip", "same-digest"
+            else:
+                action = "copy"
+                if src_image in written:
+                    reason = "source-written-by-sync"
+                elif dst_image in known_digests and known_digests[dst_image] is None:
+                    reason = "missing"
+                elif src_image not in known_digests:
+                    reason = "unresolved"
+                elif known_digests[src_image] is None:
+                    reason = "source-missing"
+                elif dst_image not in known_digests:
+                    reason = "unresolved"
+                else:
+                    reason = "different-digest"
+                size = image_sizes.get(src_image) or 0
+                written.add(dst_image)
+            stage["total"] += 1
+            stage[action] += 1
+            stage["bytes"] += size
+            tasks.append(
+                {
+                    "task_id": sync_task.task_id,
+                    "stage_id": stage_id,
+                    "source": src_image,
+                    "destination": dst_image,
+                    "action": action,
+                    "reason": reason,
+                    "bytes": size,
+                }
+            )
+
+    return {
+        "total": len(tasks),
+        "copy": sum(s["copy"] for s in stages.values()),
+        "skip": sum(s["skip"] for s in stages.values()),
+        "depth": max(_get_stage_depths(configuration, pruned_plan).values(), default=0),
+        "estimated_bytes": sum(s["bytes"] for s in stages.values()),
+        "stages": stages,
+        "tasks": tasks,
+    }
+
+
+async def _diff_tag_sets(
+    configuration: Configuration,
+    backend: RegistryBackend,
+    sync_tasks: list[_SyncTask],
+    *,
+    parallel_discovery_tasks: NonNegativeInt,
+) -> tuple[dict[RegistryImage, str | None], set[TaskID]]:
+    """Lists the tags of every destination repository once, instead of
+    comparing digests tag by tag.
+
+    Returns the destination images which do not exist (with digest ``None``,
+    they are copied without comparing digests) and the ``immutable`` tasks
+    whose tag the destination already has (trusted to be up to date).
+    Repositories which cannot be listed are left out, their digests are compared.
+    """
+    repositories: dict[RegistryImage, bool] = {}
+    for sync_task in sync_tasks:
+        registry = configuration.registries[sync_task.dst]
+        repository = _get_registry_image(url=registry.url, image=sync_task.dst_path)
+        repositories[repository] = registry.skip_tls_verify
+
+    async def _list(
+        repository: RegistryImage, skip_tls_verify: bool
+    ) -> set[DockerTag] | None:
+        try:
+            tags = await backend.get_image_tags(
+                repository, skip_tls_verify=skip_tls_verify
+            )
+        except Exception as exc:  # pylint: disable=broad-except  # noqa: BLE001
+            _logger.debug("Could not list tags of '%s': %s", repository, exc)
+            return None
+        return set(tags)
+
+    listed = dict(
+        zip(
+            repositories,
+            await _gather_bounded(
+                (_list(r, skip) for r, skip in repositories.items()),
+                limit=parallel_discovery_tasks,
+            ),
+        )
+    )
+
+    missing: dict[RegistryImage, str | None] = {}
+    trusted: set[TaskID] = set()
+    for sync_task in sync_tasks:
+        registry = configuration.registries[sync_task.dst]
+        repository = _get_registry_image(url=registry.url, image=sync_task.dst_path)
+        if (tags := listed[repository]) is None:
+            continue
+        if sync_task.tag not in tags:
+            missing[_get_dst_image(configuration, sync_task)] = None
+        elif sync_task.immutable:
+            trusted.add(sync_task.task_id)
+    _logger.info(
+        "Listed '%s' destination repositories: '%s' missing tags, '%s' immutable present",
+        len([t for t in listed.values() if t is not None]),
+        len(missing),
+        len(trusted),
+    )
+    return missing, trusted
+
+
+async def _compare_images(
+    configuration: Configuration,
+    backend: RegistryBackend,
+    sync_tasks: list[_SyncTask],
+    *,
+    parallel_discovery_tasks: NonNegativeInt,
+    journaled: Iterable[TaskID] = (),
+) -> tuple[dict[RegistryImage, str | None], set[TaskID]]:
+    """Digests known before syncing and the tasks trusted to be up to date.
+
+    Destination tags are diffed first (see ``_diff_tag_sets``), digests are
+    only resolved for the tasks this does not decide.
+    """
+    missing, trusted = await _diff_tag_sets(
+        configuration,
+        backend,
+        sync_tasks,
+        parallel_discovery_tasks=parallel_discovery_tasks,
+    )
+    known_digests = await _resolve_digests(
+        configuration,
+        backend,
+        sync_tasks,
+        parallel_discovery_tasks=parallel_discovery_tasks,
+        journaled=journaled,
+        decided=trusted
+        | {
+            t.task_id for t in sync_tasks if _get_dst_image(configuration, t) in missing
+        },
+    )
+    known_digests.update(missing)
+    return known_digests, trusted
+
+
+def _get_copy_group(
+    sync_task: _SyncTask,
+) -> tuple[StageID, RegistryKey, DockerImage, DockerTag]:
+    """tasks of a stage copying the same source image to different destinations"""
+    return (sync_task.stage_id, sync_task.src, sync_task.src_path, sync_task.tag)
 
 
 async def _copy_image(
     configuration: Configuration,
+    backend: RegistryBackend,
     task_mapping: dict[TaskID, _SyncTask],
-    task_id: TaskID,
+    task_ids: list[TaskID],
     stats: "_RunStats",
-) -> tuple[TaskID, CopyResult | BaseException]:
-    _logger.debug("Starting '%s'", task_id)
+    known_digests: dict[RegistryImage, str | None],
+    retry_policy: RetryPolicy,
+    journal: Journal | None,
+) -> list[tuple[TaskID, CopyResult | BaseException]]:
+    """Syncs tasks sharing the same source image (see ``_get_copy_group``).
+
+    The source digest is checked once and, when more than one destination
+    differs, the image is pulled once and pushed to all of them.
+    Digests in ``known_digests`` (see ``_resolve_digests``) are not requested again.
+    Transient errors are retried up to ``retry_policy.retries`` times per
+    task and step (source digest, destination digest, copy), a flaky
+    destination does not use up the retries of the others.
+    Finished tasks are added to ``journal``.
+    """
+    _logger.debug("Starting '%s'", task_ids)
     start_datetime = datetime.now(timezone.utc)
+    results: dict[TaskID, CopyResult | BaseException] = {}
+
+    def _can_retry(
+        retried: dict[TaskID, int], task_id: TaskID, exc: BaseException
+    ) -> bool:
+        return retried.get(task_id, 0) < retry_policy.retries and is_retryable(exc)
+
+    @contextlib.contextmanager
+    def _timed(phase: _Phase, timed_task_ids: Iterable[TaskID]) -> Iterator[None]:
+        # NOTE: waiting for retries is part of the phase
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            for task_id in timed_task_ids:
+                stats.get_timings(task_mapping[task_id]).add(phase, elapsed)
+
+    async def _before_retry(
+        retried: dict[TaskID, int], errors: dict[TaskID, BaseException]
+    ) -> None:
+        # NOTE: tasks retried together back off like the most retried one
+        delay = retry_policy.get_delay(max(retried.get(t, 0) for t in errors))
+        elapsed = datetime.now(timezone.utc) - start_datetime
+        for task_id, exc in errors.items():
+            retried[task_id] = retried.get(task_id, 0) + 1
+            _logger.warning(
+                "🔁 [%s] %s — retry %s/%s in %.1fs after: %s: %s",
+                elapsed,
+                task_id,
+                retried[task_id],
+                retry_policy.retries,
+                delay,
+                type(exc).__name__,
+                exc or repr(exc),
+            )
+            stats.record_retry(task_id, exc)
+        await asyncio.sleep(delay)
+
+    async def _retrying(
+        retry_task_ids: list[TaskID], operation: Callable[[], Awaitable[_T]]
+    ) -> _T:
+        retried: dict[TaskID, int] = {}
+        while True:
+            try:
+                return await operation()
+            except Exception as exc:  # pylint: disable=broad-except  # noqa: BLE001
+                if not all(_can_retry(retried, t, exc) for t in retry_task_ids):
+                    raise
+                await _before_retry(
+                    retried, {task_id: exc for task_id in retry_task_ids}
+                )
+
+    async def _get_digest(
+        retry_task_ids: list[TaskID], image: RegistryImage, *, skip_tls_verify: bool
+    ) -> str | None:
+        if image in known_digests:
+            return known_digests[image]
+        return await _retrying(
+            retry_task_ids,
+            lambda: backend.get_digest(image, skip_tls_verify=skip_tls_verify),
+        )
 
+    def _record(task_id: TaskID, outcome: CopyResult | BaseException) -> None:
+        elapsed = datetime.now(timezone.utc) - start_datetime
+        if outcome == CopyResult.SAME_DIGEST:
+            _logger.debug("⏭️  [%s] %s — same digest", elapsed, task_id)
+        elif outcome == CopyResult.COPIED:
+            _logger.info("✅ [%s] %s — copied", elapsed, task_id)
+        else:
+            # Capture the exception and pair it with the task_id so the final
+            # summary can attribute the failure. Tracebacks are written to the
+            # mandatory ``--tracebacks-file`` (see ``_write_tracebacks_file``);
+            # the live log only carries a one-line summary so CI logs stay small.
+            _logger.error(
+                "❌ [%s] %s — error: %s: %s",
+                elapsed,
+                task_id,
+                type(outcome).__name__,
+                outcome or repr(outcome),
+            )
+        stats.record(task_id, outcome)
+        results[task_id] = outcome
+        if (
+            journal is not None
+            and not isinstance(outcome, BaseException)
+            and src_digest is not None
+        ):
+            journal.record(_get_journal_key(task_mapping[task_id]), src_digest)
+
+    first_task = task_mapping[task_ids[0]]
+    src_registry = configuration.registries[first_task.src]
+    src_image = _get_registry_image(
+        url=src_registry.url, image=first_task.src_path, tag=first_task.tag
+    )
+
+    def _is_known_missing(task_id: TaskID) -> bool:
+        dst_image = _get_dst_image(configuration, task_mapping[task_id])
+        return dst_image in known_digests and known_digests[dst_image] is None
+
+    src_digest: str | None = None
     try:
+        # NOTE: destinations known to be missing are copied without comparing,
+        # the source digest is only needed to journal them
+        if journal is not None or not all(
+            _is_known_missing(task_id) for task_id in task_ids
+        ):
+            with _timed(_Phase.SRC_DIGEST, task_ids):
+                src_digest = await _get_digest(
+                    task_ids, src_image, skip_tls_verify=src_registry.skip_tls_verify
+                )
+    except Exception as exc:  # pylint: disable=broad-except  # noqa: BLE001
+        for task_id in task_ids:
+            _record(task_id, exc)
+        return list(results.items())
+
+    to_copy: dict[TaskID, tuple[RegistryImage, bool]] = {}
+    for task_id in task_ids:
         sync_task = task_mapping[task_id]
-        src_registry = configuration.registries[sync_task.src]
         dst_registry = configuration.registries[sync_task.dst]
-
-        src_image = _get_registry_image(
-            url=src_registry.url, image=sync_task.src_path, tag=sync_task.tag
-        )
         dst_image = _get_registry_image(
             url=dst_registry.url, image=sync_task.dst_path, tag=sync_task.tag
         )
-
-        src_digest = await _crane.get_digest(
-            src_image, skip_tls_verify=src_registry.skip_tls_verify
-        )
-        dst_digest = await _crane.get_digest(
-            dst_image, skip_tls_verify=dst_registry.skip_tls_verify
-        )
+        try:
+            with _timed(_Phase.DST_DIGEST, [task_id]):
+                dst_digest = await _get_digest(
+                    [task_id], dst_image, skip_tls_verify=dst_registry.skip_tls_verify
+                )
+        except Exception as exc:  # pylint: disable=broad-except  # noqa: BLE001
+            _record(task_id, exc)
+            continue
 
         if (
             src_digest is not None
             and dst_digest is not None
             and src_digest == dst_digest
         ):
-            _logger.debug(
-                "⏭️  [%s] %s — same digest",
-                datetime.now(timezone.utc) - start_datetime,
-                task_id,
+            _record(task_id, CopyResult.SAME_DIGEST)
+        else:
+            to_copy[task_id] = (dst_image, dst_registry.skip_tls_verify)
+
+    async def _copy() -> dict[RegistryImage, BaseException]:
+        try:
+            if len(to_copy) == 1:
+                ((dst_image, dst_skip_tls_verify),) = to_copy.values()
+                await backend.copy(
+                    src_image,
+                    dst_image,
+                    src_skip_tls_verify=src_registry.skip_tls_verify,
+                    dst_skip_tls_verify=dst_skip_tls_verify,
+                )
+                return {}
+            return await backend.copy_to_many(
+                src_image,
+                dict(to_copy.values()),
+                src_skip_tls_verify=src_registry.skip_tls_verify,
             )
-            stats.record(task_id, CopyResult.SAME_DIGEST)
-            return task_id, CopyResult.SAME_DIGEST
-
-        await _crane.copy(
-            src_image,
-            dst_image,
-            src_skip_tls_verify=src_registry.skip_tls_verify,
-            dst_skip_tls_verify=dst_registry.skip_tls_verify,
-        )
-        _logger.info(
-            "✅ [%s] %s — copied",
-            datetime.now(timezone.utc) - start_datetime,
-            task_id,
+        except Exception as exc:  # pylint: disable=broad-except  # noqa: BLE001
+            return {dst_image: exc for dst_image, _ in to_copy.values()}
+
+    copy_retried: dict[TaskID, int] = {}
+    while to_copy:
+        with _timed(_Phase.COPY, list(to_copy)):
+            failures = await _copy()
+        retryable: dict[TaskID, BaseException] = {}
+        for task_id, (dst_image, _) in to_copy.items():
+            outcome = failures.get(dst_image, CopyResult.COPIED)
+            if isinstance(outcome, BaseException) and _can_retry(
+                copy_retried, task_id, outcome
+            ):
+                retryable[task_id] = outcome
+            else:
+                _record(task_id, outcome)
+        if retryable:
+            with _timed(_Phase.COPY, retryable):
+                await _before_retry(copy_retried, retryable)
+        # only destinations which failed with transient errors are copied again
+        to_copy = {task_id: to_copy[task_id] for task_id in retryable}
+    return list(results.items())
+
+
+async def _copy_image_on_worker(
+    configuration: Configuration,
+    work_queue: WorkQueue,
+    run_id: str,
+    task_mapping: dict[TaskID, _SyncTask],
+    task_ids: list[TaskID],
+    stats: "_RunStats",
+    known_digests: dict[RegistryImage, str | None],
+    journal: Journal | None,
+) -> list[tuple[TaskID, CopyResult | BaseException]]:
+    """Like ``_copy_image``, but publishes the tasks as one job for a worker
+    (see ``run_job``) and waits for its result. All tasks fail if the job
+    failed as a whole (see ``WorkQueue.claim``)."""
+    images = [
+        image
+        for task_id in task_ids
+        for image in (
+            _get_src_image(configuration, task_mapping[task_id]),
+            _get_dst_image(configuration, task_mapping[task_id]),
         )
-        stats.record(task_id, CopyResult.COPIED)
-        return task_id, CopyResult.COPIED
-    except Exception as exc:  # pylint: disable=broad-except  # noqa: BLE001
-        # Capture the exception and pair it with the task_id so the final
-        # summary can attribute the failure. Tracebacks are written to the
-        # mandatory ``--tracebacks-file`` (see ``_write_tracebacks_file``);
-        # the live log only carries a one-line summary so CI logs stay small.
-        _logger.error(
-            "❌ [%s] %s — error: %s: %s",
-            datetime.now(timezone.utc) - start_datetime,
-            task_id,
-            type(exc).__name__,
-            exc or repr(exc),
-        )
-        stats.record(task_id, exc)
-        return task_id, exc
-
-
-def _remove_duplicates(run_batches: list[set[TaskID]]) -> list[set[TaskID]]:
-    seen: set[TaskID] = set()
-    result: list[set[TaskID]] = []
-
-    for batch in run_batches:
-        new_batch = set()
-        for entry in batch:
-            if entry not in seen:
-                seen.add(entry)
-                new_batch.add(entry)
-        result.append(new_batch)
-
-    return result
-
-
-async def _run_coroutines(
-    coros: Coroutine, *, parallel_sync_tasks: NonNegativeInt
-) -> list[Any]:
-    # NOTE: run all coroutines on the current event loop, capping concurrency
-    # via a Semaphore. Previously this spawned a ThreadPoolExecutor that ran
-    # `asyncio.run` per coroutine, which created/destroyed an event loop per
-    # task and leaked subprocess transports, producing log spam such as
-    # "Loop ... is closed" warnings and "Event loop is closed" tracebacks.
-    semaphore = asyncio.Semaphore(parallel_sync_tasks)
-
-    async def _bounded(coro: Coroutine) -> Any:
-        async with semaphore:
-            return await coro
+    ]
+    job = {
+        "tasks": [asdict(task_mapping[task_id]) for task_id in task_ids],
+        "known_digests": {i: known_digests[i] for i in images if i in known_digests},
+    }
+    job_id = await asyncio.to_thread(work_queue.publish, run_id, job)
+    result = await work_queue.wait_for_result(job_id)
+
+    results: list[tuple[TaskID, CopyResult | BaseException]] = []
+    for task_id in task_ids:
+        if (job_error := result.get("error")) is not None:
+            _logger.error("❌ %s — job failed on %s", task_id, result["worker"])
+            stats.record(task_id, RemoteTaskError(job_error))
+            results.append((task_id, RemoteTaskError(job_error)))
+            continue
+
+        task_result = result["tasks"][task_id]
+        for error in task_result["retries"]:
+            stats.record_retry(task_id, RemoteTaskError(error))
+        task_timings = stats.get_timings(task_mapping[task_id])
+        for phase, seconds in task_result["timings"].items():
+            task_timings.add(_Phase(phase), seconds)
+
+        outcome: CopyResult | BaseException
+        if task_result["error"] is not None:
+            outcome = RemoteTaskError(task_result["error"])
+            _logger.error("❌ %s — failed on %s", task_id, result["worker"])
+        else:
+            outcome = CopyResult(task_result["outcome"])
+            if outcome == CopyResult.COPIED:
+                _logger.info("✅ %s — copied on %s", task_id, result["worker"])
+            if journal is not None and task_result["src_digest"] is not None:
+                journal.record(
+                    _get_journal_key(task_mapping[task_id]), task_result["src_digest"]
+                )
+        stats.record(task_id, outcome)
+        results.append((task_id, outcome))
+    return results
 
-    return await asyncio.gather(*(_bounded(coro) for coro in coros))
+
+async def run_job(
+    configuration: Configuration,
+    backend: RegistryBackend,
+    job: dict[str, Any],
+    retry_policy: RetryPolicy,
+    *,
+    worker: str,
+) -> dict[str, Any]:
+    """Runs the tasks of a job published by ``_copy_image_on_worker``, the
+    result holds their outcomes, source digests, retries and timings."""
+    task_mapping = {t["task_id"]: _SyncTask(**t) for t in job["tasks"]}
+    for sync_task in task_mapping.values():
+        # NOTE: other workers might have written these images meanwhile
+        await backend.invalidate(_get_src_image(configuration, sync_task))
+        await backend.invalidate(_get_dst_image(configuration, sync_task))
+
+    stats = _RunStats()
+    journal = Journal(None, resume=False)
+    results = await _copy_image(
+        configuration,
+        backend,
+        task_mapping,
+        list(task_mapping),
+        stats,
+        dict(job["known_digests"]),
+        retry_policy,
+        journal,
+    )
+    return {
+        "worker": worker,
+        "tasks": {
+            task_id: {
+                "outcome": None if isinstance(outcome, BaseException) else outcome,
+                "error": (
+                    _format_exception(outcome)
+                    if isinstance(outcome, BaseException)
+                    else None
+                ),
+                "src_digest": journal.entries.get(
+                    _get_journal_key(task_mapping[task_id])
+                ),
+                "retries": [
+                    _format_exception(e) for e in stats.retries.get(task_id, [])
+                ],
+                "timings": {
+                    phase.value: seconds
+                    for phase, seconds in stats.get_timings(
+                        task_mapping[task_id]
+                    ).seconds.items()
+                },
+            }
+            for task_id, outcome in results
+        },
+    }
+
+
+async def _run_dag(
+    predecessors: dict[TaskID, list[TaskID]],
+    run_tasks: Callable[[list[TaskID]], Awaitable[list[tuple[TaskID, Any]]]],
+    *,
+    parallel_sync_tasks: NonNegativeInt | None,
+    on_done: Callable[[TaskID, Any], Awaitable[bool]],
+    join_ids: set[TaskID],
+    group_of: Callable[[TaskID], Hashable],
+    continue_on_failure: bool = False,
+    on_skip: Callable[[TaskID], None] | None = None,
+    on_start: Callable[[TaskID, float], None] | None = None,
+    priority_of: Callable[[Hashable], float] | None = None,
+    bytes_of: Callable[[TaskID], int] | None = None,
+    max_in_flight_bytes: NonNegativeInt | None = None,
+) -> int:
+    """Runs every task as soon as all of its predecessors have finished.
+
+    Ready tasks with the same ``group_of`` key are handed to ``run_tasks``
+    together and take one of the ``parallel_sync_tasks`` slots (unlimited for
+    ``None``). Groups with
+    the highest ``priority_of`` start first, otherwise in the order they
+    became ready. With ``max_in_flight_bytes`` a group only starts while the
+    ``bytes_of`` its tasks fit next to the running ones (or nothing runs),
+    strictly by priority so that large groups are not starved. ``on_done``
+    is awaited with each result, when it returns ``False`` no further tasks
+    are started and only the ones already running are awaited. With
+    ``continue_on_failure`` only the tasks depending (also transitively) on
+    that one are not started, ``on_skip`` is called for each of them.
+    ``on_start`` is called with the seconds each task was ready before it started.
+    Nodes in ``join_ids`` are not run, they complete as soon as they are ready.
+    Returns the number of tasks which finished.
+    """
+    successors: dict[TaskID, list[TaskID]] = {task_id: [] for task_id in predecessors}
+    for task_id, requirements in predecessors.items():
+        for requirement in requirements:
+            successors[requirement].append(task_id)
+
+    pending_requirements: dict[TaskID, int] = {
+        task_id: len(requirements) for task_id, requirements in predecessors.items()
+    }
+    # NOTE: tasks of a group share their predecessors, they become ready together
+    ready: dict[Hashable, list[TaskID]] = {}
+    ready_order: list[tuple[float, int, Hashable]] = []
+    ready_counter = itertools.count()
+    ready_since: dict[TaskID, float] = {}
+    running: set[asyncio.Task] = set()
+    running_bytes: dict[asyncio.Task, int] = {}
+    in_flight_bytes = 0
+    max_running = (
+        len(predecessors)
+        if parallel_sync_tasks is None
+        else max(parallel_sync_tasks, 1)
+    )
+    keep_scheduling = True
+    skipped: set[TaskID] = set()
+    finished = 0
+
+    def _make_ready(task_id: TaskID) -> None:
+        if task_id in join_ids:
+            _complete(task_id)
+        else:
+            group = group_of(task_id)
+            if group not in ready:
+                priority = 0 if priority_of is None else priority_of(group)
+                # highest priority first, ties in the order they became ready
+                heapq.heappush(ready_order, (-priority, next(ready_counter), group))
+            ready.setdefault(group, []).append(task_id)
+            ready_since[task_id] = time.monotonic()
+
+    def _complete(task_id: TaskID) -> None:
+        for successor in successors[task_id]:
+            pending_requirements[successor] -= 1
+            if pending_requirements[successor] == 0 and successor not in skipped:
+                _make_ready(successor)
+
+    def _skip_dependents(task_id: TaskID) -> None:
+        to_visit = list(successors[task_id])
+        while to_visit:
+            dependent = to_visit.pop()
+            if dependent in skipped:
+                continue
+            skipped.add(dependent)
+            if dependent not in join_ids and on_skip is not None:
+                on_skip(dependent)
+            to_visit.extend(successors[dependent])
+
+    for task_id in [t for t, count in pending_requirements.items() if count == 0]:
+        _make_ready(task_id)
+
+    try:
+        while ready or running:
+            while keep_scheduling and ready and len(running) < max_running:
+                group = ready[ready_order[0][2]]
+                group_bytes = 0 if bytes_of is None else sum(map(bytes_of, group))
+                if (
+                    max_in_flight_bytes is not None
+                    and running
+                    and in_flight_bytes + group_bytes > max_in_flight_bytes
+                ):
+                    break
+                del ready[heapq.heappop(ready_order)[2]]
+                for task_id in group:
+                    waited = time.monotonic() - ready_since.pop(task_id)
+                    if on_start is not None:
+                        on_start(task_id, waited)
+                started = asyncio.create_task(run_tasks(group))
+                running.add(started)
+                running_bytes[started] = group_bytes
+                in_flight_bytes += group_bytes
+
+            if not running:
+                break
+
+            done, running = await asyncio.wait(
+                running, return_when=asyncio.FIRST_COMPLETED
+            )
+            for finished_task in done:
+                in_flight_bytes -= running_bytes.pop(finished_task)
+                for task_id, result in finished_task.result():
+                    finished += 1
+                    if await on_done(task_id, result):
+                        _complete(task_id)
+                    elif continue_on_failure:
+                        _skip_dependents(task_id)
+                    else:
+                        keep_scheduling = False
+                        _complete(task_id)
+    finally:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+    return finished
+
+
+def _get_priorities(
+    predecessors: dict[TaskID, list[TaskID]], costs: dict[TaskID, float]
+) -> dict[TaskID, float]:
+    """Cost of the most expensive path from each task to the end of the plan,
+    its own cost included (tasks without cost, like join nodes, are free).
+
+    Starting the tasks with the highest one first keeps the critical path
+    busy, among independent tasks the largest ones start first.
+    """
+    graph = DiGraph()
+    graph.add_nodes_from(predecessors)
+    for task_id, requirements in predecessors.items():
+        graph.add_edges_from((requirement, task_id) for requirement in requirements)
+
+    priorities: dict[TaskID, float] = {}
+    for task_id in reversed(list(topological_sort(graph))):
+        priorities[task_id] = costs.get(task_id, 0) + max(
+            (priorities[successor] for successor in graph.successors(task_id)),
+            default=0,
+        )
+    return priorities
 
 
 def _format_exception(exc: BaseException) -> str:
@@ -295,14 +1412,62 @@ def _format_exception(exc: BaseException) -> str:
     return repr(exc)
 
 
+@dataclass
+class _TaskTimings:
+    stage_id: StageID
+    # source and destination registry keys
+    registries: str
+    seconds: dict[_Phase, float] = field(default_factory=dict)
+
+    def add(self, phase: _Phase, seconds: float) -> None:
+        self.seconds[phase] = self.seconds.get(phase, 0) + seconds
+
+    @property
+    def total(self) -> float:
+        return sum(self.seconds.values())
+
+    @property
+    def running(self) -> float:
+        return self.total - self.seconds.get(_Phase.QUEUE_WAIT, 0)
+
+    def format(self) -> str:
+        return ", ".join(
+            f"{phase.value}={self.seconds.get(phase, 0):.2f}s" for phase in _Phase
+        )
+
+
+def _sum_timings(timings: Iterable[_TaskTimings]) -> dict[str, float | int]:
+    totals: dict[str, float | int] = {"tasks": 0, "total": 0.0}
+    totals.update({phase.value: 0.0 for phase in _Phase})
+    for task_timings in timings:
+        totals["tasks"] += 1
+        totals["total"] += task_timings.total
+        for phase, seconds in task_timings.seconds.items():
+            totals[phase.value] += seconds
+    return totals
+
+
 @dataclass
 class _RunStats:
     total: int = 0
     same_digest: int = 0
     copied: int = 0
     failed: int = 0
+    pruned: int = 0
+    resumed: int = 0
     copied_task_ids: list[TaskID] = field(default_factory=list)
+    # not run because a task they depend on failed
+    skipped_task_ids: list[TaskID] = field(default_factory=list)
     failures: list[tuple[TaskID, BaseException]] = field(default_factory=list)
+    # errors of the attempts which were retried, per task
+    retries: dict[TaskID, list[BaseException]] = field(default_factory=dict)
+    planning_duration: timedelta | None = None
+    cache: CacheStats = field(default_factory=CacheStats)
+    blobs: BlobStats | None = None
+    # time spent per phase, source digests are shared by the tasks of a group
+    timings: dict[TaskID, _TaskTimings] = field(default_factory=dict)
+    # part of the plan this process ran, when the sync is split
+    shard: Shard | None = None
 
     def record(self, task_id: TaskID, outcome: "CopyResult | BaseException") -> None:
         """Record a single task outcome as soon as it completes.
@@ -321,6 +1486,58 @@ class _RunStats:
             self.copied += 1
             self.copied_task_ids.append(task_id)
 
+    def get_timings(self, sync_task: "_SyncTask") -> _TaskTimings:
+        return self.timings.setdefault(
+            sync_task.task_id,
+            _TaskTimings(
+                stage_id=sync_task.stage_id,
+                registries=f"{sync_task.src} -> {sync_task.dst}",
+            ),
+        )
+
+    def get_slowest_tasks(self) -> list[tuple[TaskID, _TaskTimings]]:
+        return sorted(
+            self.timings.items(), key=lambda item: item[1].running, reverse=True
+        )[:_SLOWEST_TASKS]
+
+    def get_timings_report(self) -> dict[str, Any]:
+        stages: dict[StageID, list[_TaskTimings]] = {}
+        registries: dict[str, list[_TaskTimings]] = {}
+        for task_timings in self.timings.values():
+            stages.setdefault(task_timings.stage_id, []).append(task_timings)
+            registries.setdefault(task_timings.registries, []).append(task_timings)
+        return {
+            "shard": None if self.shard is None else f"{self.shard}",
+            "planning_seconds": (
+                None
+                if self.planning_duration is None
+                else self.planning_duration.total_seconds()
+            ),
+            "phases": _sum_timings(self.timings.values()),
+            "stages": {k: _sum_timings(v) for k, v in sorted(stages.items())},
+            "registries": {k: _sum_timings(v) for k, v in sorted(registries.items())},
+            "slowest_tasks": [
+                {
+                    "task_id": task_id,
+                    "stage_id": task_timings.stage_id,
+                    "registries": task_timings.registries,
+                    "total": task_timings.total,
+                    **{p.value: task_timings.seconds.get(p, 0) for p in _Phase},
+                }
+                for task_id, task_timings in self.get_slowest_tasks()
+            ],
+            "tasks": {
+                task_id: {p.value: task_timings.seconds.get(p, 0) for p in _Phase}
+                for task_id, task_timings in sorted(self.timings.items())
+            },
+        }
+
+    def record_skipped(self, task_id: TaskID) -> None:
+        self.skipped_task_ids.append(task_id)
+
+    def record_retry(self, task_id: TaskID, exc: BaseException) -> None:
+        self.retries.setdefault(task_id, []).append(exc)
+
     def update(self, batch_results: list[Any]) -> None:
         for task_id, outcome in batch_results:
             self.record(task_id, outcome)
@@ -335,6 +1552,7 @@ class _RunStats:
     def format(self, *, tracebacks_file: Path) -> str:
         copied_sorted = sorted(self.copied_task_ids)
         failed_sorted = sorted(tid for tid, _ in self.failures)
+        skipped_sorted = sorted(self.skipped_task_ids)
 
         copied_block = (
             "\n".join(f"  ✅ {t}" for t in copied_sorted)
@@ -346,27 +1564,90 @@ class _RunStats:
             if failed_sorted
             else "  (none)"
         )
+        skipped_block = (
+            "\n".join(f"  ⏭️ {t}" for t in skipped_sorted)
+            if skipped_sorted
+            else "  (none)"
+        )
+
+        phases = _sum_timings(self.timings.values())
+        phases_line = ", ".join(f"{p.value}={phases[p.value]:.2f}s" for p in _Phase)
+        registries: dict[str, list[_TaskTimings]] = {}
+        for task_timings in self.timings.values():
+            registries.setdefault(task_timings.registries, []).append(task_timings)
+        registries_block = (
+            "\n".join(
+                f"  {registry_pair}: "
+                + ", ".join(f"{p.value}={totals[p.value]:.2f}s" for p in _Phase)
+                for registry_pair, totals in (
+                    (k, _sum_timings(v)) for k, v in sorted(registries.items())
+                )
+            )
+            if registries
+            else "  (none)"
+        )
+        slowest = self.get_slowest_tasks()
+        slowest_block = (
+            "\n".join(
+                f"  🐢 {task_timings.running:.2f}s {task_id} ({task_timings.format()})"
+                for task_id, task_timings in slowest
+            )
+            if slowest
+            else "  (none)"
+        )
+
+        blobs_line = (
+            ""
+            if self.blobs is None
+            else (
+                f"Blob cache: bytes from cache={self.blobs.from_cache}, "
+                f"bytes from network={self.blobs.from_network}, "
+                f"bytes evicted={self.blobs.evicted}\n"
+            )
+        )
 
+        shard_note = "" if self.shard is None else f" (shard {self.shard})"
         return (
-            f"Run statistics: "
+            f"Run statistics{shard_note}: "
             f"total={self.total}, "
             f"copied={self.copied}, "
             f"same-digest={self.same_digest}, "
-            f"failed={self.failed}\n"
+            f"pruned={self.pruned}, "
+            f"resumed={self.resumed}, "
+            f"failed={self.failed}, "
+            f"skipped={len(self.skipped_task_ids)}\n"
+            f"Planning took: {self.planning_duration}\n"
+            f"Cache: hits={self.cache.hits}, "
+            f"misses={self.cache.misses}, "
+            f"evictions={self.cache.evictions}, "
+            f"coalesced={self.cache.coalesced}\n"
+            f"{blobs_line}"
+            f"Retries: {sum(len(e) for e in self.retries.values())} "
+            f"(tasks retried: {len(self.retries)})\n"
+            f"Time per phase: {phases_line}\n"
+            f"Time per registry:\n{registries_block}\n"
+            f"Slowest tasks (without queue-wait):\n{slowest_block}\n"
             f"Copied images ({self.copied}):\n{copied_block}\n"
             f"Failed images ({self.failed}):\n{failed_block}\n"
-            f"Tracebacks written to: {tracebacks_file} (sorted by task_id)"
+            f"Skipped images, a task they depend on failed "
+            f"({len(self.skipped_task_ids)}):\n{skipped_block}\n"
+            f"Tracebacks written to: {tracebacks_file} (sorted by task_id), "
+            f"timings to: {_get_timings_file(tracebacks_file, self.shard)}"
         )
 
 
 def _write_tracebacks_file(
-    tracebacks_file: Path, failures: list[tuple[TaskID, BaseException]]
+    tracebacks_file: Path,
+    failures: list[tuple[TaskID, BaseException]],
+    retries: dict[TaskID, list[BaseException]] | None = None,
 ) -> None:
     """Write a plain-text file with one section per failure, sorted by task_id.
 
     The file is always created (possibly empty) so artifact-upload steps in CI
-    pipelines can run unconditionally.
+    pipelines can run unconditionally. Errors of retried attempts (see
+    ``_RunStats.retries``) follow the final one.
     """
+    retries = retries or {}
     tracebacks_file.parent.mkdir(parents=True, exist_ok=True)
 
     if not failures:
@@ -378,9 +1659,28 @@ def _write_tracebacks_file(
         sections.append(
             f"=== {task_id} ===\n{_format_exception(exc).rstrip()}\n"
         )
+        for attempt, retried_exc in enumerate(retries.get(task_id, []), start=1):
+            sections.append(
+                f"--- {task_id} attempt {attempt} of "
+                f"{len(retries[task_id]) + 1} ---\n"
+                f"{_format_exception(retried_exc).rstrip()}\n"
+            )
     tracebacks_file.write_text("\n".join(sections))
 
 
+def _get_timings_file(tracebacks_file: Path, shard: Shard | None) -> Path:
+    timings_file = tracebacks_file.with_name(_TIMINGS_FILE_NAME)
+    return timings_file if shard is None else shard.get_file(timings_file)
+
+
+def _write_timings_file(tracebacks_file: Path, stats: _RunStats) -> Path:
+    """writes ``_RunStats.get_timings_report`` as JSON next to the tracebacks file"""
+    timings_file = _get_timings_file(tracebacks_file, stats.shard)
+    timings_file.parent.mkdir(parents=True, exist_ok=True)
+    timings_file.write_text(json.dumps(stats.get_timings_report(), indent=2))
+    return timings_file
+
+
 async def _progress_reporter(
     stats: _RunStats,
     *,
@@ -403,116 +1703,533 @@ async def _progress_reporter(
 
 async def _run_sync_tasks(
     configuration: Configuration,
+    backend: RegistryBackend,
     execution_plan: ExecutionPlan,
+    stats: _RunStats,
     *,
     parallel_sync_tasks: NonNegativeInt,
     tracebacks_file: Path,
+    known_digests: dict[RegistryImage, str | None] | None = None,
+    retry_policy: RetryPolicy | None = None,
+    journal: Journal | None = None,
+    continue_on_failure: bool = False,
+    image_sizes: dict[RegistryImage, int | None] | None = None,
+    max_in_flight_bytes: NonNegativeInt | None = None,
+    work_queue: WorkQueue | None = None,
+    run_id: str | None = None,
 ) -> None:
-    """given an execution plan:
-    - removes previous entries which have been ran in previous group
-    - runs each group of tasks in parallel till it finishes
+    """given an execution plan, starts each task as soon as the tasks it
+    depends on are done. On the first failure no new tasks are started,
+    unless ``continue_on_failure`` is set: then only the tasks depending on
+    the failed one are skipped and everything else still runs.
+
+    Tasks on the longest path through the plan start first, weighted by the
+    ``image_sizes`` of their sources when known. ``max_in_flight_bytes``
+    limits the bytes of the images being copied at once. With a ``work_queue``
+    ready tasks are published as jobs of ``run_id`` (started and finished by
+    the caller) and copied by workers (see ``run_job``) instead, all of them
+    right away: the workers limit how many run at once.
     """
-
-    # put together in which order the taska need to run
-    run_batches: list[set[TaskID]] = []
-
-    for _, requirements in execution_plan.predecessors.items():
-        if len(requirements) > 0:
-            run_batches.append(set(requirements))
-
-    remaning_tasks = {task_id for task_id in execution_plan.predecessors}
-    if len(remaning_tasks) > 0:
-        run_batches.append(remaning_tasks)
-
-    # due to the dependecy graph the same task can be scheduled multiple times
-    # ensure it is only ran once
-    no_duplicates_run_batches = _remove_duplicates(run_batches)
-
-    sync_oprations_count = sum([len(x) for x in no_duplicates_run_batches])
-    if len(execution_plan.task_mapping) != sync_oprations_count:
-        msg = (
-            "Internal inconsistency while building the execution plan: "
-            f"task_mapping has {len(execution_plan.task_mapping)} entries but "
-            f"the deduplicated run batches contain {sync_oprations_count} tasks "
-            f"across {len(no_duplicates_run_batches)} batch(es). "
-            "Every task should appear exactly once across all batches."
+    known_digests = {} if known_digests is None else known_digests
+    retry_policy = RetryPolicy() if retry_policy is None else retry_policy
+    planned_total = len(execution_plan.task_mapping)
+    image_sizes = {} if image_sizes is None else image_sizes
+    task_bytes: dict[TaskID, int] = {
+        task_id: image_sizes.get(_get_src_image(configuration, sync_task)) or 0
+        for task_id, sync_task in execution_plan.task_mapping.items()
+    }
+    priorities = _get_priorities(
+        execution_plan.predecessors,
+        {task_id: _TASK_OVERHEAD_BYTES + size for task_id, size in task_bytes.items()},
+    )
+    group_priorities: dict[Hashable, float] = {}
+    for task_id, sync_task in execution_plan.task_mapping.items():
+        group = _get_copy_group(sync_task)
+        group_priorities[group] = max(
+            group_priorities.get(group, 0), priorities[task_id]
         )
-        raise RuntimeError(msg)
-
-    stats = _RunStats()
+    initial_cache_stats = replace(backend.get_cache_stats())
+    initial_blob_stats = backend.get_blob_stats()
+    initial_blob_stats = (
+        None if initial_blob_stats is None else replace(initial_blob_stats)
+    )
 
     # Periodic heartbeat so CI logs show liveness even when most tasks are
     # skipped (same-digest is logged at DEBUG and otherwise invisible).
     reporter = asyncio.create_task(
-        _progress_reporter(stats, planned_total=sync_oprations_count)
+        _progress_reporter(stats, planned_total=planned_total)
     )
 
-    try:
-        # run sync batches in order
-        for batch_to_run in no_duplicates_run_batches:
-            sync_coros = [
-                _copy_image(
-                    configuration, execution_plan.task_mapping, task_id, stats
+    async def _run_tasks(
+        task_ids: list[TaskID],
+    ) -> list[tuple[TaskID, CopyResult | BaseException]]:
+        with _tracing.span("copy image", tasks=len(task_ids), task_ids=f"{task_ids}"):
+            if work_queue is not None:
+                assert run_id is not None  # nosec
+                return await _copy_image_on_worker(
+                    configuration,
+                    work_queue,
+                    run_id,
+                    execution_plan.task_mapping,
+                    task_ids,
+                    stats,
+                    known_digests,
+                    journal,
                 )
-                for task_id in batch_to_run
-            ]
-            # NOTE: results are recorded live by ``_copy_image`` via
-            # ``stats.record(...)``; do not call ``stats.update`` here or the
-            # counters would double-count.
-            await _run_coroutines(
-                sync_coros, parallel_sync_tasks=parallel_sync_tasks
+            return await _copy_image(
+                configuration,
+                backend,
+                execution_plan.task_mapping,
+                task_ids,
+                stats,
+                known_digests,
+                retry_policy,
+                journal,
             )
 
-            if stats.failures:
-                # NOTE: write the tracebacks file BEFORE exiting so that CI
-                # artifact upload steps always find it. Then log the summary
-                # and exit with a non-zero status. ``SystemExit`` propagates
-                # through ``asyncio.run`` and terminates the process without
-                # dumping an additional (and noisy) traceback for the
-                # orchestration layer.
-                _write_tracebacks_file(tracebacks_file, stats.failures)
-                _logger.error("%s", stats.format(tracebacks_file=tracebacks_file))
-                raise SystemExit(1)
-
-            # NOTE: image tags and digests are cached
-            # if after a batch something changes inside a source, due to th cahce
-            # it is not possible to figure it out
-            # safest approach is to remove the cache
-            await _crane.clear_cache()
+    async def _on_done(task_id: TaskID, result: CopyResult | BaseException) -> bool:
+        # NOTE: results are recorded live by ``_copy_image`` via
+        # ``stats.record(...)``; do not call ``stats.update`` here or the
+        # counters would double-count.
+        if isinstance(result, BaseException):
+            return False
+
+        if result == CopyResult.COPIED:
+            # NOTE: image tags and digests are cached, tasks depending on
+            # this one might read what was just written. Only the written
+            # destination is dropped, everything else keeps its cache entries
+            sync_task = execution_plan.task_mapping[task_id]
+            dst_image = _get_registry_image(
+                url=configuration.registries[sync_task.dst].url,
+                image=sync_task.dst_path,
+                tag=sync_task.tag,
+            )
+            known_digests.pop(dst_image, None)
+            await backend.invalidate(dst_image)
+        return True
+
+    def _on_start(task_id: TaskID, waited: float) -> None:
+        stats.get_timings(execution_plan.task_mapping[task_id]).add(
+            _Phase.QUEUE_WAIT, waited
+        )
+
+    def _on_skip(task_id: TaskID) -> None:
+        _logger.warning("⏭️ %s — skipped, a task it depends on failed", task_id)
+        stats.record_skipped(task_id)
+
+    try:
+        finished = await _run_dag(
+            execution_plan.predecessors,
+            _run_tasks,
+            parallel_sync_tasks=None if work_queue is not None else parallel_sync_tasks,
+            on_done=_on_done,
+            join_ids=execution_plan.join_ids,
+            group_of=lambda task_id: _get_copy_group(
+                execution_plan.task_mapping[task_id]
+            ),
+            continue_on_failure=continue_on_failure,
+            on_skip=_on_skip,
+            on_start=_on_start,
+            priority_of=group_priorities.__getitem__,
+            bytes_of=task_bytes.__getitem__,
+            max_in_flight_bytes=max_in_flight_bytes,
+        )
     finally:
         reporter.cancel()
         with contextlib.suppress(asyncio.CancelledError):
             await reporter
+        stats.cache = backend.get_cache_stats().since(initial_cache_stats)
+        if (blob_stats := backend.get_blob_stats()) is not None:
+            assert initial_blob_stats is not None  # nosec
+            stats.blobs = blob_stats.since(initial_blob_stats)
+
+    if stats.failures:
+        # NOTE: write the tracebacks file BEFORE exiting so that CI
+        # artifact upload steps always find it. Then log the summary
+        # and exit with a non-zero status. ``SystemExit`` propagates
+        # through ``asyncio.run`` and terminates the process without
+        # dumping an additional (and noisy) traceback for the
+        # orchestration layer.
+        _write_tracebacks_file(tracebacks_file, stats.failures, stats.retries)
+        _write_timings_file(tracebacks_file, stats)
+        _logger.error("%s", stats.format(tracebacks_file=tracebacks_file))
+        raise SystemExit(1)
+
+    if finished != planned_total:
+        msg = (
+            "Internal inconsistency while running the execution plan: "
+            f"task_mapping has {planned_total} entries but only {finished} "
+            "tasks were run. Every task should run exactly once."
+        )
+        raise RuntimeError(msg)
 
     # Always create the tracebacks file (empty on success) so the artifact
     # upload step in CI does not need a conditional check.
-    _write_tracebacks_file(tracebacks_file, stats.failures)
+    _write_tracebacks_file(tracebacks_file, stats.failures, stats.retries)
+    _write_timings_file(tracebacks_file, stats)
     _logger.info("%s", stats.format(tracebacks_file=tracebacks_file))
 
 
-async def run_sync_tasks(
+def _get_registry_backend(
+    configuration: Configuration,
+    backend: Backend,
+    *,
+    state_dir: Path | None,
+    digest_cache_ttl: NonNegativeFloat,
+    invalidate_registries: list[RegistryKey],
+    blob_cache_dir: Path | None,
+    blob_cache_max_bytes: NonNegativeInt,
+    metrics: Metrics | None = None,
+) -> RegistryBackend:
+    limiters: dict[str, RegistryLimiter] = {}
+    for registry in configuration.registries.values():
+        # NOTE: registries with the same url share the limits defined first
+        limiters.setdefault(
+            registry.url,
+            RegistryLimiter(
+                max_concurrent=registry.max_concurrent_operations,
+                requests_per_second=registry.requests_per_second,
+            ),
+        )
+    registry_backend: RegistryBackend = get_backend(backend)
+    if _tracing.is_enabled():
+        registry_backend = TracingBackend(registry_backend)
+    if metrics is not None:
+        # NOTE: innermost, waiting for a slot is not part of the durations
+        registry_backend = MeteredBackend(registry_backend, metrics)
+        metrics.backend = registry_backend
+        metrics.observe_limiters(limiters)
+        metrics.get_uploaded_bytes = (
+            _registry.get_uploaded_bytes if backend == Backend.NATIVE else None
+        )
+    registry_backend = RateLimitedBackend(registry_backend, limiters)
+    if blob_cache_dir is not None:
+        if backend != Backend.NATIVE:
+            msg = f"a blob cache requires {Backend.NATIVE=}, got {backend=}"
+            raise ValueError(msg)
+        _registry.use_blob_store(
+            BlobStore(blob_cache_dir, max_bytes=blob_cache_max_bytes)
+        )
+
+    if state_dir is None:
+        return registry_backend
+
+    for registry_key in invalidate_registries:
+        if registry_key not in configuration.registries:
+            msg = f"{registry_key=} must be any of {configuration.registries.keys()}"
+            raise ValueError(msg)
+
+    digest_cache = DigestCache(state_dir, ttl=digest_cache_ttl)
+    for registry_key in invalidate_registries:
+        removed = digest_cache.invalidate_registry(
+            configuration.registries[registry_key].url
+        )
+        _logger.info("Removed '%s' cached digests of '%s'", removed, registry_key)
+
+    return PersistentDigestBackend(registry_backend, digest_cache)
+
+
+async def _sync(
     configuration: Configuration,
+    registry_backend: RegistryBackend,
     *,
     use_explicit_tags: bool,
     parallel_sync_tasks: NonNegativeInt,
+    parallel_discovery_tasks: NonNegativeInt,
     tracebacks_file: Path,
+    journal: Journal | None,
+    retry_policy: RetryPolicy | None,
+    continue_on_failure: bool,
+    schedule_by_size: bool = False,
+    max_in_flight_bytes: NonNegativeInt | None = None,
+    shard: Shard | None = None,
+    work_queue: WorkQueue | None = None,
+    run_id: str | None = None,
+    sync_tasks: list[_SyncTask] | None = None,
 ) -> None:
-    await _login_into_all_registries(configuration)
+    """plans and runs the sync tasks of ``configuration`` on a logged in backend.
+
+    Tasks journaled with their current source digest are not run again.
+    With ``schedule_by_size`` (implied by ``max_in_flight_bytes``) the sizes
+    of the images to copy are looked up while planning. With a ``shard`` only
+    its part of the plan runs (see ``_shard_execution_plan``), balanced by
+    image sizes when they are looked up. Its tracebacks and timings are
+    written to files named after the shard. With a ``work_queue`` workers
+    copy the images as jobs of ``run_id``. Only the given ``sync_tasks`` (see
+    ``watch``) run, the tags of the stages are not discovered again.
+    """
+    planning_start = datetime.now(timezone.utc)
 
-    sync_tasks: list[_SyncTask] = await _get_sync_tasks(
-        configuration, use_explicit_tags=use_explicit_tags
-    )
+    if sync_tasks is None:
+        with _tracing.span("discover tags"):
+            sync_tasks = await _get_sync_tasks(
+                configuration,
+                registry_backend,
+                use_explicit_tags=use_explicit_tags,
+                parallel_discovery_tasks=parallel_discovery_tasks,
+            )
 
-    execution_plan = _get_execution_plan(configuration, sync_tasks)
+    with _tracing.span("plan", tasks=len(sync_tasks)):
+        execution_plan = _get_execution_plan(configuration, sync_tasks)
+        for task_id, duplicates in execution_plan.duplicates.items():
+            _logger.debug("🔗 %s — also copies %s", task_id, duplicates)
+        if execution_plan.duplicates:
+            _logger.info(
+                "Merged '%s' tasks declared by several stages",
+                sum(len(d) for d in execution_plan.duplicates.values()),
+            )
 
-    start_datetime = datetime.now(timezone.utc)
+        by_size = schedule_by_size or max_in_flight_bytes is not None
+        image_sizes: dict[RegistryImage, int | None] | None = None
+        if shard is not None:
+            planned_total = len(execution_plan.task_mapping)
+            execution_plan, image_sizes = await _get_shard_plan(
+                configuration,
+                registry_backend,
+                execution_plan,
+                shard,
+                by_size=by_size,
+                parallel_discovery_tasks=parallel_discovery_tasks,
+            )
+            sync_tasks = list(execution_plan.task_mapping.values())
+            _logger.info(
+                "Shard %s runs '%s' of '%s' tasks",
+                shard,
+                len(sync_tasks),
+                planned_total,
+            )
+            tracebacks_file = shard.get_file(tracebacks_file)
 
-    try:
-        await _run_sync_tasks(
+        # NOTE: copied, the journal is extended while the tasks run
+        journal_entries = {} if journal is None else dict(journal.entries)
+        known_digests, trusted = await _compare_images(
             configuration,
-            execution_plan,
-            parallel_sync_tasks=parallel_sync_tasks,
-            tracebacks_file=tracebacks_file,
+            registry_backend,
+            sync_tasks,
+            parallel_discovery_tasks=parallel_discovery_tasks,
+            journaled=journal_entries.keys(),
+        )
+        execution_plan, pruned, resumed = _prune_execution_plan(
+            configuration, execution_plan, known_digests, journal_entries, trusted
+        )
+        if by_size and image_sizes is None:
+            image_sizes = await _get_image_sizes(
+                configuration,
+                registry_backend,
+                execution_plan.task_mapping.values(),
+                parallel_discovery_tasks=parallel_discovery_tasks,
+            )
+    _logger.info(
+        "Pruned '%s' of '%s' tasks with same digest", len(pruned), len(sync_tasks)
+    )
+    if resumed:
+        _logger.info("Resumed '%s' tasks finished by a previous run", len(resumed))
+    if trusted:
+        _logger.info(
+            "Trusted '%s' immutable tags present in the destination", len(trusted)
         )
+    for task_id in pruned:
+        _logger.debug("⏭️  %s — same digest (pruned)", task_id)
+    if journal is not None:
+        # pruned tasks are finished as well, unless their digest was not needed
+        sync_task_mapping = {t.task_id: t for t in sync_tasks}
+        for task_id in pruned:
+            sync_task = sync_task_mapping[task_id]
+            src_image = _get_src_image(configuration, sync_task)
+            if (src_digest := known_digests.get(src_image)) is not None:
+                journal.record(_get_journal_key(sync_task), src_digest)
+
+    stats = _RunStats(
+        pruned=len(pruned),
+        resumed=len(resumed),
+        planning_duration=datetime.now(timezone.utc) - planning_start,
+        shard=shard,
+    )
+    _logger.info("Planning took: %s", stats.planning_duration)
+
+    start_datetime = datetime.now(timezone.utc)
+
+    try:
+        with _tracing.span("run", tasks=len(execution_plan.task_mapping)):
+            await _run_sync_tasks(
+                configuration,
+                registry_backend,
+                execution_plan,
+                stats,
+                parallel_sync_tasks=parallel_sync_tasks,
+                tracebacks_file=tracebacks_file,
+                known_digests=known_digests,
+                retry_policy=retry_policy,
+                journal=journal,
+                continue_on_failure=continue_on_failure,
+                image_sizes=image_sizes,
+                max_in_flight_bytes=max_in_flight_bytes,
+                work_queue=work_queue,
+                run_id=run_id,
+            )
     finally:
         _logger.info("Image sync took: %s", datetime.now(timezone.utc) - start_datetime)
+
+
+async def run_sync_tasks(
+    configuration: Configuration,
+    *,
+    backend: Backend,
+    use_explicit_tags: bool,
+    parallel_sync_tasks: NonNegativeInt,
+    parallel_discovery_tasks: NonNegativeInt,
+    tracebacks_file: Path,
+    state_dir: Path | None = None,
+    digest_cache_ttl: NonNegativeFloat = 0,
+    invalidate_registries: list[RegistryKey] | None = None,
+    blob_cache_dir: Path | None = None,
+    blob_cache_max_bytes: NonNegativeInt = DEFAULT_BLOB_CACHE_MAX_BYTES,
+    retry_policy: RetryPolicy | None = None,
+    resume: bool = False,
+    continue_on_failure: bool = False,
+    metrics_port: int | None = None,
+    metrics_file: Path | None = None,
+    schedule_by_size: bool = False,
+    max_in_flight_bytes: NonNegativeInt | None = None,
+    shard: Shard | None = None,
+    work_queue_file: Path | None = None,
+) -> None:
+    if resume and state_dir is None:
+        msg = "resuming requires a state_dir with the journal of the previous run"
+        raise ValueError(msg)
+    journal = None if state_dir is None else Journal(state_dir, resume=resume)
+    work_queue = (
+        None
+        if work_queue_file is None
+        else await asyncio.to_thread(WorkQueue, work_queue_file)
+    )
+    # NOTE: started before planning, workers waiting meanwhile keep waiting
+    run_id = (
+        None if work_queue is None else await asyncio.to_thread(work_queue.start_run)
+    )
+    metrics = None if metrics_port is None and metrics_file is None else Metrics()
+
+    registry_backend = _get_registry_backend(
+        configuration,
+        backend,
+        state_dir=state_dir,
+        digest_cache_ttl=digest_cache_ttl,
+        invalidate_registries=invalidate_registries or [],
+        blob_cache_dir=blob_cache_dir,
+        blob_cache_max_bytes=blob_cache_max_bytes,
+        metrics=metrics,
+    )
+    try:
+        async with (
+            contextlib.nullcontext()
+            if metrics is None
+            else export_metrics(metrics, port=metrics_port, metrics_file=metrics_file)
+        ):
+            with _tracing.span("sync"):
+                await _login_into_all_registries(
+                    configuration,
+                    registry_backend,
+                    parallel_discovery_tasks=parallel_discovery_tasks,
+                )
+                await _sync(
+                    configuration,
+                    registry_backend,
+                    use_explicit_tags=use_explicit_tags,
+                    parallel_sync_tasks=parallel_sync_tasks,
+                    parallel_discovery_tasks=parallel_discovery_tasks,
+                    tracebacks_file=tracebacks_file,
+                    journal=journal,
+                    retry_policy=retry_policy,
+                    continue_on_failure=continue_on_failure,
+                    schedule_by_size=schedule_by_size,
+                    max_in_flight_bytes=max_in_flight_bytes,
+                    shard=shard,
+                    work_queue=work_queue,
+                    run_id=run_id,
+                )
+    finally:
+        await registry_backend.close()
+        if journal is not None:
+            journal.close()
+        if work_queue is not None:
+            assert run_id is not None  # nosec
+            await asyncio.to_thread(work_queue.finish_run, run_id)
+            work_queue.close()
+
+
+async def plan_sync_tasks(
+    configuration: Configuration,
+    *,
+    backend: Backend,
+    use_explicit_tags: bool,
+    parallel_discovery_tasks: NonNegativeInt,
+    shard: Shard | None = None,
+    schedule_by_size: bool = False,
+) -> dict[str, Any]:
+    """Discovers tags and compares digests like a sync, without copying anything,
+    and returns what it would do (see ``_get_plan_report``).
+
+    Sizes are only looked up for source images which would be copied. With a
+    ``shard`` only its part of the plan is reported, split like a sync with
+    the same ``schedule_by_size`` would.
+    """
+    registry_backend = _get_registry_backend(
+        configuration,
+        backend,
+        state_dir=None,
+        digest_cache_ttl=0,
+        invalidate_registries=[],
+        blob_cache_dir=None,
+        blob_cache_max_bytes=DEFAULT_BLOB_CACHE_MAX_BYTES,
+    )
+    try:
+        with _tracing.span("plan"):
+            await _login_into_all_registries(
+                configuration,
+                registry_backend,
+                parallel_discovery_tasks=parallel_discovery_tasks,
+            )
+            sync_tasks = await _get_sync_tasks(
+                configuration,
+                registry_backend,
+                use_explicit_tags=use_explicit_tags,
+                parallel_discovery_tasks=parallel_discovery_tasks,
+            )
+            execution_plan = _get_execution_plan(configuration, sync_tasks)
+            image_sizes = None
+            if shard is not None:
+                execution_plan, image_sizes = await _get_shard_plan(
+                    configuration,
+                    registry_backend,
+                    execution_plan,
+                    shard,
+                    by_size=schedule_by_size,
+                    parallel_discovery_tasks=parallel_discovery_tasks,
+                )
+                sync_tasks = list(execution_plan.task_mapping.values())
+            known_digests, trusted = await _compare_images(
+                configuration,
+                registry_backend,
+                sync_tasks,
+                parallel_discovery_tasks=parallel_discovery_tasks,
+            )
+            pruned_plan, _, _ = _prune_execution_plan(
+                configuration, execution_plan, known_digests, trusted=trusted
+            )
+
+            if image_sizes is None:
+                image_sizes = await _get_image_sizes(
+                    configuration,
+                    registry_backend,
+                    pruned_plan.task_mapping.values(),
+                    parallel_discovery_tasks=parallel_discovery_tasks,
+                )
+    finally:
+        await registry_backend.close()
+
+    report = _get_plan_report(
+        configuration, execution_plan, pruned_plan, known_digests, image_sizes, trusted
+    )
+    if shard is not None:
+        report["shard"] = f"{shard}"
+    return report
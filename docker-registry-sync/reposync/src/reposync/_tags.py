@@ -0,0 +1,119 @@
+"""Selection of the tags to sync: regexes, semver constraints and newest versions."""
+
+import operator
+import re
+from dataclasses import dataclass
+from typing import Callable, Final, Iterable
+
+# `1.2.3`, `v1.2.3-rc.1`, `1.2.3+build.5`
+_SEMVER: Final[re.Pattern] = re.compile(
+    r"v?(?P<major>0|[1-9]\d*)\.(?P<minor>0|[1-9]\d*)\.(?P<patch>0|[1-9]\d*)"
+    r"(?:-(?P<prerelease>[0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*))?"
+    r"(?:\+[0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*)?"
+)
+# `>=1.2`, `<2`, `==1.2.3-rc.1`, versions in constraints may omit minor and patch
+_COMPARATOR: Final[re.Pattern] = re.compile(
+    r"\s*(?P<operator>>=|<=|==|!=|>|<)\s*"
+    r"v?(?P<major>\d+)(?:\.(?P<minor>\d+))?(?:\.(?P<patch>\d+))?"
+    r"(?:-(?P<prerelease>[0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*))?\s*"
+)
+# a release sorts after all of its pre-releases
+_RELEASE: Final[tuple[tuple[int, int | str], ...]] = ((2, 0),)
+_OPERATORS: Final[dict[str, Callable[[object, object], bool]]] = {
+    ">=": operator.ge,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    "<": operator.lt,
+}
+
+
+@dataclass(frozen=True, order=True)
+class Version:
+    """semver version, ordered by precedence (build metadata is ignored)"""
+
+    major: int
+    minor: int
+    patch: int
+    prerelease: tuple[tuple[int, int | str], ...] = _RELEASE
+
+
+def _parse_prerelease(prerelease: str | None) -> tuple[tuple[int, int | str], ...]:
+    if prerelease is None:
+        return _RELEASE
+    # numeric identifiers sort before alphanumeric ones
+    return tuple(
+        (0, int(identifier)) if identifier.isdigit() else (1, identifier)
+        for identifier in prerelease.split(".")
+    )
+
+
+def parse_version(tag: str) -> Version | None:
+    """``None`` for tags which are not a semver version"""
+    if (match := _SEMVER.fullmatch(tag)) is None:
+        return None
+    return Version(
+        int(match["major"]),
+        int(match["minor"]),
+        int(match["patch"]),
+        _parse_prerelease(match["prerelease"]),
+    )
+
+
+def parse_constraint(constraint: str) -> list[tuple[str, Version]]:
+    """``">=1.2, <2"`` -> comparators which all have to match.
+
+    Raises ``ValueError`` for anything else.
+    """
+    comparators: list[tuple[str, Version]] = []
+    for part in constraint.split(","):
+        if (match := _COMPARATOR.fullmatch(part)) is None:
+            msg = f"{part=} of {constraint=} must look like '>=1.2.3'"
+            raise ValueError(msg)
+        version = Version(
+            int(match["major"]),
+            int(match["minor"] or 0),
+            int(match["patch"] or 0),
+            _parse_prerelease(match["prerelease"]),
+        )
+        comparators.append((match["operator"], version))
+    return comparators
+
+
+def select_tags(
+    tags: Iterable[str],
+    *,
+    include: list[re.Pattern],
+    exclude: list[re.Pattern],
+    semver: str | None,
+    newest: int | None,
+) -> list[str]:
+    """Keeps tags (fully) matching any ``include`` (all without) and none of
+    ``exclude``, whose version satisfies ``semver``. Of those only the
+    ``newest`` versions are kept.
+
+    With ``semver`` or ``newest`` tags which are not a version are dropped.
+    """
+    selected = [
+        tag
+        for tag in tags
+        if (not include or any(p.fullmatch(tag) for p in include))
+        and not any(p.fullmatch(tag) for p in exclude)
+    ]
+    if semver is None and newest is None:
+        return selected
+
+    comparators = [] if semver is None else parse_constraint(semver)
+    versions: dict[str, Version] = {}
+    for tag in selected:
+        version = parse_version(tag)
+        if version is not None and all(
+            _OPERATORS[op](version, bound) for op, bound in comparators
+        ):
+            versions[tag] = version
+    if newest is not None:
+        # NOTE: `v1.0.0` and `1.0.0` are the same version, both are kept
+        newest_versions = set(sorted(set(versions.values()), reverse=True)[:newest])
+        versions = {t: v for t, v in versions.items() if v in newest_versions}
+    return [tag for tag in selected if tag in versions]
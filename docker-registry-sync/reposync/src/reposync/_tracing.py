@@ -0,0 +1,167 @@
+"""Spans of the sync written in the OTLP JSON format, viewable as traces."""
+
+import contextlib
+import json
+import secrets
+import sys
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Final, Iterator, TextIO
+
+# writes traces to stdout instead of a file
+CONSOLE: Final[Path] = Path("-")
+
+_SCOPE_NAME: Final[str] = "reposync"
+_SPANS_PER_LINE: Final[int] = 512
+# OTLP span kind and status codes
+_SPAN_KIND_INTERNAL: Final[int] = 1
+_STATUS_CODE_ERROR: Final[int] = 2
+
+
+@dataclass
+class _Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: str | None
+    attributes: dict[str, str | int | float | bool]
+    start_time: int = field(default_factory=time.time_ns)
+    end_time: int | None = None
+    error: str | None = None
+
+
+def _to_any_value(value: str | int | float | bool) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # NOTE: 64 bit integers are strings in OTLP JSON
+        return {"intValue": f"{value}"}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": f"{value}"}
+
+
+def _to_otlp(span: _Span) -> dict[str, Any]:
+    otlp_span: dict[str, Any] = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": _SPAN_KIND_INTERNAL,
+        "startTimeUnixNano": f"{span.start_time}",
+        "endTimeUnixNano": f"{span.end_time}",
+        "attributes": [
+            {"key": key, "value": _to_any_value(value)}
+            for key, value in span.attributes.items()
+        ],
+    }
+    if span.parent_span_id is not None:
+        otlp_span["parentSpanId"] = span.parent_span_id
+    if span.error is not None:
+        otlp_span["status"] = {"code": _STATUS_CODE_ERROR, "message": span.error}
+    return otlp_span
+
+
+class _Exporter:
+    """Writes finished spans as lines of OTLP ``ExportTraceServiceRequest`` JSON,
+    the format of the OpenTelemetry collector's file exporter."""
+
+    def __init__(self, file: TextIO):
+        self._file = file
+        self._spans: list[_Span] = []
+
+    def export(self, span: _Span) -> None:
+        self._spans.append(span)
+        if len(self._spans) >= _SPANS_PER_LINE:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._spans:
+            return
+        request = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": _to_any_value(_SCOPE_NAME),
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": _SCOPE_NAME},
+                            "spans": [_to_otlp(s) for s in self._spans],
+                        }
+                    ],
+                }
+            ]
+        }
+        self._spans.clear()
+        self._file.write(json.dumps(request))
+        self._file.write("\n")
+        self._file.flush()
+
+
+_exporter: _Exporter | None = None
+_current_span: ContextVar[_Span | None] = ContextVar("current_span", default=None)
+
+
+def is_enabled() -> bool:
+    return _exporter is not None
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes: str | int | float | bool) -> Iterator[None]:
+    """Records the enclosed code as a child of the current span (of this
+    asyncio task), a no-op unless tracing is enabled."""
+    exporter = _exporter
+    if exporter is None:
+        yield
+        return
+
+    parent = _current_span.get()
+    current = _Span(
+        name=name,
+        trace_id=secrets.token_hex(16) if parent is None else parent.trace_id,
+        span_id=secrets.token_hex(8),
+        parent_span_id=None if parent is None else parent.span_id,
+        attributes=attributes,
+    )
+    token = _current_span.set(current)
+    try:
+        yield
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_time = time.time_ns()
+        _current_span.reset(token)
+        exporter.export(current)
+
+
+@contextlib.contextmanager
+def tracing(
+    trace_file: Path | None, *, console: TextIO | None = None
+) -> Iterator[None]:
+    """Enables tracing into ``trace_file`` (or ``console``, stdout by default,
+    for ``CONSOLE``) while the context is active."""
+    global _exporter  # pylint: disable=global-statement
+    if trace_file is None:
+        yield
+        return
+
+    with contextlib.ExitStack() as stack:
+        if trace_file == CONSOLE:
+            file = sys.stdout if console is None else console
+        else:
+            trace_file.parent.mkdir(parents=True, exist_ok=True)
+            file = stack.enter_context(trace_file.open("w", encoding="utf-8"))
+        _exporter = _Exporter(file)
+        try:
+            yield
+        finally:
+            _exporter.flush()
+            _exporter = None
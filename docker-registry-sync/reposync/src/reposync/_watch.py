@@ -0,0 +1,318 @@
+"""Long-running mode which syncs again whenever source images change."""
+
+import asyncio
+import contextlib
+import json
+import logging
+from pathlib import Path
+from typing import Callable, Final
+
+from aiohttp import web
+from pydantic import NonNegativeFloat, NonNegativeInt, PositiveFloat
+
+from ._backend import Backend, RegistryBackend
+from ._journal import Journal
+from ._metrics import Metrics, export_metrics
+from ._models import Configuration, RegistryKey, Stage
+from ._retry import RetryPolicy
+from ._tracing import span
+from ._sync import (
+    DEFAULT_BLOB_CACHE_MAX_BYTES,
+    Shard,
+    _get_registry_backend,
+    _get_registry_image,
+    _get_src_image,
+    _get_sync_tasks,
+    _lists_all_tags,
+    _login_into_all_registries,
+    _sync,
+    _SyncTask,
+)
+
+WEBHOOK_PATH: Final[str] = "/notifications"
+
+_WAKEUP_KEY: Final[web.AppKey[asyncio.Event]] = web.AppKey("wakeup", asyncio.Event)
+_PUSHED_KEY: Final[web.AppKey[set[str]]] = web.AppKey("pushed", set)
+
+_logger = logging.getLogger(__name__)
+
+
+async def _handle_notifications(request: web.Request) -> web.Response:
+    """accepts registry notification envelopes, the repositories of push
+    events are queued for the next sync"""
+    try:
+        payload = await request.json()
+    except json.JSONDecodeError as e:
+        raise web.HTTPBadRequest(text="expected a JSON body") from e
+
+    events = payload.get("events", []) if isinstance(payload, dict) else []
+    pushed = {
+        event["target"]["repository"]
+        for event in events
+        if isinstance(event, dict)
+        and event.get("action") == "push"
+        and isinstance(event.get("target"), dict)
+        and isinstance(event["target"].get("repository"), str)
+    }
+    if pushed:
+        _logger.info("Notified about pushes to %s", sorted(pushed))
+        request.app[_PUSHED_KEY].update(pushed)
+        request.app[_WAKEUP_KEY].set()
+    return web.Response()
+
+
+def _make_webhook_app(wakeup: asyncio.Event, pushed: set[str]) -> web.Application:
+    app = web.Application()
+    app[_WAKEUP_KEY] = wakeup
+    app[_PUSHED_KEY] = pushed
+    app.router.add_post(WEBHOOK_PATH, _handle_notifications)
+    return app
+
+
+def _get_stages_reading(
+    configuration: Configuration, repositories: set[str]
+) -> list[Stage]:
+    """stages copying from one of ``repositories`` and the ones depending on them"""
+    stage_ids = {
+        stage.id
+        for stage in configuration.stages
+        if stage.from_entry.repository.strip("/") in repositories
+    }
+    while dependents := {
+        stage.id
+        for stage in configuration.stages
+        if stage.id not in stage_ids and stage_ids.intersection(stage.depends_on)
+    }:
+        stage_ids |= dependents
+    return [stage for stage in configuration.stages if stage.id in stage_ids]
+
+
+def _get_stages_listing_tags(
+    configuration: Configuration, *, use_explicit_tags: bool
+) -> list[Stage]:
+    """stages syncing tags listed from their source, which may have new ones"""
+    return [
+        stage
+        for stage in configuration.stages
+        if any(
+            _lists_all_tags(to_entry, use_explicit_tags=use_explicit_tags)
+            for to_entry in stage.to_entries
+        )
+    ]
+
+
+async def _invalidate_sources(
+    configuration: Configuration,
+    registry_backend: RegistryBackend,
+    sync_tasks: list[_SyncTask],
+) -> None:
+    for src_image in {_get_src_image(configuration, t) for t in sync_tasks}:
+        await registry_backend.invalidate(src_image)
+
+
+async def _plan_stages(
+    configuration: Configuration,
+    registry_backend: RegistryBackend,
+    stages: list[Stage],
+    *,
+    use_explicit_tags: bool,
+    parallel_discovery_tasks: NonNegativeInt,
+) -> list[_SyncTask]:
+    """the sync tasks of ``stages``, from freshly listed source tags"""
+    for stage in stages:
+        src_registry = configuration.registries[stage.from_entry.source]
+        await registry_backend.invalidate(
+            _get_registry_image(url=src_registry.url, image=stage.from_entry.repository)
+        )
+    sync_tasks = await _get_sync_tasks(
+        configuration.model_copy(update={"stages": stages}),
+        registry_backend,
+        use_explicit_tags=use_explicit_tags,
+        parallel_discovery_tasks=parallel_discovery_tasks,
+    )
+    await _invalidate_sources(configuration, registry_backend, sync_tasks)
+    return sync_tasks
+
+
+async def watch(
+    config_file: Path,
+    load_configuration: Callable[[Path], Configuration],
+    *,
+    backend: Backend,
+    interval: PositiveFloat,
+    webhook_port: NonNegativeInt | None,
+    use_explicit_tags: bool,
+    parallel_sync_tasks: NonNegativeInt,
+    parallel_discovery_tasks: NonNegativeInt,
+    tracebacks_file: Path,
+    state_dir: Path | None = None,
+    digest_cache_ttl: NonNegativeFloat = 0,
+    invalidate_registries: list[RegistryKey] | None = None,
+    blob_cache_dir: Path | None = None,
+    blob_cache_max_bytes: NonNegativeInt = DEFAULT_BLOB_CACHE_MAX_BYTES,
+    retry_policy: RetryPolicy | None = None,
+    continue_on_failure: bool = False,
+    metrics_port: int | None = None,
+    metrics_file: Path | None = None,
+    schedule_by_size: bool = False,
+    max_in_flight_bytes: NonNegativeInt | None = None,
+    shard: Shard | None = None,
+) -> None:
+    """Syncs every ``interval`` seconds (or when a registry notification is
+    posted to ``webhook_port``) until cancelled.
+
+    The backend and its caches are kept between syncs, copies keep the
+    destinations up to date (see ``_run_sync_tasks``). The tasks are planned
+    once and again when ``config_file`` is modified. After ``interval`` the
+    stages listing the tags of their source are planned again and the source
+    digests of all tasks are looked up again, a notification only plans and
+    syncs the stages reading the pushed repositories (and the ones depending
+    on them) again. Every synced task is journaled with its source
+    digest (in memory, or in ``state_dir``) and only runs again once that
+    digest changed, failed tasks are retried by the next sync.
+    """
+    configuration = load_configuration(config_file)
+    config_mtime = config_file.stat().st_mtime
+    # NOTE: picks up what previous runs synced into the same state_dir
+    journal = Journal(state_dir, resume=True)
+    registry_backend: RegistryBackend | None = None
+    invalidate_registries = invalidate_registries or []
+    metrics = None if metrics_port is None and metrics_file is None else Metrics()
+
+    # NOTE: planned from ``configuration`` by the next sync when ``None``
+    sync_tasks: list[_SyncTask] | None = None
+    wakeup = asyncio.Event()
+    pushed: set[str] = set()
+    runner: web.AppRunner | None = None
+    if webhook_port is not None:
+        runner = web.AppRunner(_make_webhook_app(wakeup, pushed))
+        await runner.setup()
+        await web.TCPSite(runner, port=webhook_port).start()
+        _logger.info("Listening for notifications on port %s", webhook_port)
+
+    try:
+        async with (
+            contextlib.nullcontext()
+            if metrics is None
+            else export_metrics(metrics, port=metrics_port, metrics_file=metrics_file)
+        ):
+            while True:
+                wakeup.clear()
+                repositories = set(pushed)
+                pushed.clear()
+
+                if (mtime := config_file.stat().st_mtime) != config_mtime:
+                    config_mtime = mtime
+                    try:
+                        with span("load configuration"):
+                            changed_configuration = load_configuration(config_file)
+                    except Exception:  # pylint: disable=broad-except  # noqa: BLE001
+                        _logger.exception("Keeping the previous configuration")
+                    else:
+                        _logger.info("Configuration changed, planning again")
+                        if (
+                            registry_backend is not None
+                            and changed_configuration.registries
+                            != configuration.registries
+                        ):
+                            await registry_backend.close()
+                            registry_backend = None
+                        configuration = changed_configuration
+                        sync_tasks = None
+
+                with span("sync"):
+                    if registry_backend is None:
+                        registry_backend = _get_registry_backend(
+                            configuration,
+                            backend,
+                            state_dir=state_dir,
+                            digest_cache_ttl=digest_cache_ttl,
+                            invalidate_registries=invalidate_registries,
+                            blob_cache_dir=blob_cache_dir,
+                            blob_cache_max_bytes=blob_cache_max_bytes,
+                            metrics=metrics,
+                        )
+                        # only the first backend drops the persisted digests
+                        invalidate_registries = []
+                        await _login_into_all_registries(
+                            configuration,
+                            registry_backend,
+                            parallel_discovery_tasks=parallel_discovery_tasks,
+                        )
+
+                    try:
+                        if sync_tasks is None:
+                            sync_tasks = selected = await _plan_stages(
+                                configuration,
+                                registry_backend,
+                                configuration.stages,
+                                use_explicit_tags=use_explicit_tags,
+                                parallel_discovery_tasks=parallel_discovery_tasks,
+                            )
+                        elif repositories:
+                            stages = _get_stages_reading(configuration, repositories)
+                            selected = await _plan_stages(
+                                configuration,
+                                registry_backend,
+                                stages,
+                                use_explicit_tags=use_explicit_tags,
+                                parallel_discovery_tasks=parallel_discovery_tasks,
+                            )
+                            stage_ids = {stage.id for stage in stages}
+                            sync_tasks = selected + [
+                                t for t in sync_tasks if t.stage_id not in stage_ids
+                            ]
+                        else:
+                            stages = _get_stages_listing_tags(
+                                configuration, use_explicit_tags=use_explicit_tags
+                            )
+                            stage_ids = {stage.id for stage in stages}
+                            kept = [
+                                t for t in sync_tasks if t.stage_id not in stage_ids
+                            ]
+                            await _invalidate_sources(
+                                configuration, registry_backend, kept
+                            )
+                            sync_tasks = selected = (
+                                await _plan_stages(
+                                    configuration,
+                                    registry_backend,
+                                    stages,
+                                    use_explicit_tags=use_explicit_tags,
+                                    parallel_discovery_tasks=parallel_discovery_tasks,
+                                )
+                                + kept
+                            )
+                        await _sync(
+                            configuration,
+                            registry_backend,
+                            use_explicit_tags=use_explicit_tags,
+                            parallel_sync_tasks=parallel_sync_tasks,
+                            parallel_discovery_tasks=parallel_discovery_tasks,
+                            tracebacks_file=tracebacks_file,
+                            journal=journal,
+                            retry_policy=retry_policy,
+                            continue_on_failure=continue_on_failure,
+                            schedule_by_size=schedule_by_size,
+                            max_in_flight_bytes=max_in_flight_bytes,
+                            shard=shard,
+                            sync_tasks=selected,
+                        )
+                    except SystemExit:
+                        # NOTE: raised once failures were reported, keep watching
+                        _logger.warning(
+                            "Failed images are synced again in %ss", interval
+                        )
+                    except Exception:  # pylint: disable=broad-except  # noqa: BLE001
+                        _logger.exception("Sync failed, trying again in %ss", interval)
+                        # NOTE: planned again by the next sync
+                        pushed.update(repositories)
+
+                with contextlib.suppress(TimeoutError):
+                    await asyncio.wait_for(wakeup.wait(), timeout=interval)
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+        if registry_backend is not None:
+            await registry_backend.close()
+        journal.close()
@@ -0,0 +1,235 @@
+"""Jobs shared by a coordinator and any number of workers through SQLite."""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Final
+
+from pydantic import NonNegativeFloat, PositiveFloat, PositiveInt
+
+_POLL_INTERVAL_SECONDS: Final[float] = 1.0
+# NOTE: a job whose workers keep dying is failed instead of claimed forever
+_MAX_ATTEMPTS: Final[int] = 3
+_MAX_PARAMETERS: Final[int] = 999
+
+
+class WorkQueue:
+    """SQLite database holding the jobs of coordinator runs.
+
+    All processes must run on the host whose local disk holds the database,
+    the locking of SQLite's WAL mode does not work over network filesystems.
+
+    A worker claims a job for ``lease`` seconds and renews the claim while
+    running it. Jobs whose claim expired, e.g. because the worker died, are
+    claimed again by the next worker asking, up to ``max_attempts`` times.
+    Only the worker holding the claim can complete a job, the coordinator
+    polls for its result. A failed job has a result with an ``"error"``.
+
+    One coordinator run at a time uses a queue, starting a run finishes the
+    ones a previous coordinator left behind. Runs are numbered, workers
+    wait for a run newer than the last one finished when they started.
+
+    Methods block up to 30s on a locked database, async code calls them with
+    ``asyncio.to_thread`` (they are serialized on the connection).
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        poll_interval: PositiveFloat = _POLL_INTERVAL_SECONDS,
+        max_attempts: PositiveInt = _MAX_ATTEMPTS,
+    ):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+
+        # results being waited for, fetched together by ``_poll_results``
+        self._waiting: dict[int, asyncio.Future[dict[str, Any]]] = {}
+        self._poller: asyncio.Task | None = None
+        self._lock = threading.Lock()
+
+        # NOTE: autocommit + WAL like the digest cache, claims use explicit
+        # transactions so that two workers never claim the same job
+        self._connection = sqlite3.connect(
+            self.path, isolation_level=None, timeout=30, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " generation INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " run_id TEXT NOT NULL UNIQUE,"
+            " finished INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " run_id TEXT NOT NULL,"
+            " job TEXT NOT NULL,"
+            " worker TEXT,"
+            " lease_until REAL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " result TEXT)"
+        )
+
+    def start_run(self) -> str:
+        """registers a run, before planning so that waiting workers stay"""
+        run_id = uuid.uuid4().hex
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                # NOTE: left running by a coordinator which died
+                self._connection.execute("UPDATE runs SET finished = 1")
+                self._connection.execute(
+                    "INSERT INTO runs (run_id) VALUES (?)", (run_id,)
+                )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return run_id
+
+    def finish_run(self, run_id: str) -> None:
+        """jobs of the run which are still open are not claimed anymore"""
+        with self._lock:
+            self._connection.execute(
+                "UPDATE runs SET finished = 1 WHERE run_id = ?", (run_id,)
+            )
+
+    def get_finished_generation(self) -> int:
+        """the generation of the newest finished run, 0 without any"""
+        with self._lock:
+            (generation,) = self._connection.execute(
+                "SELECT COALESCE(MAX(generation), 0) FROM runs WHERE finished = 1"
+            ).fetchone()
+        return generation
+
+    def is_finished(self, since: int) -> bool:
+        """``True`` once a run newer than generation ``since`` was started
+        and every run is finished"""
+        with self._lock:
+            newest, running = self._connection.execute(
+                "SELECT COALESCE(MAX(generation), 0),"
+                " COUNT(*) - COALESCE(SUM(finished), 0) FROM runs"
+            ).fetchone()
+        return newest > since and running == 0
+
+    def publish(self, run_id: str, job: dict[str, Any]) -> int:
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT INTO jobs (run_id, job) VALUES (?, ?)",
+                (run_id, json.dumps(job)),
+            )
+        assert cursor.lastrowid is not None  # nosec
+        return cursor.lastrowid
+
+    def claim(
+        self, worker: str, *, lease: NonNegativeFloat
+    ) -> tuple[int, dict[str, Any]] | None:
+        """the oldest open job of a running run, ``None`` if there is none.
+
+        Jobs claimed ``max_attempts`` times already are failed instead.
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                while (
+                    row := self._connection.execute(
+                        "SELECT job_id, job, worker, attempts"
+                        " FROM jobs JOIN runs USING (run_id)"
+                        " WHERE result IS NULL AND finished = 0"
+                        " AND (worker IS NULL OR lease_until < ?)"
+                        " ORDER BY job_id LIMIT 1",
+                        (now,),
+                    ).fetchone()
+                ) is not None and row[3] >= self.max_attempts:
+                    error = f"claimed {row[3]} times, the claim of '{row[2]}' expired"
+                    self._connection.execute(
+                        "UPDATE jobs SET result = ? WHERE job_id = ?",
+                        (json.dumps({"worker": row[2], "error": error}), row[0]),
+                    )
+                if row is not None:
+                    self._connection.execute(
+                        "UPDATE jobs SET worker = ?, lease_until = ?,"
+                        " attempts = attempts + 1 WHERE job_id = ?",
+                        (worker, now + lease, row[0]),
+                    )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return None if row is None else (row[0], json.loads(row[1]))
+
+    def renew(self, job_id: int, worker: str, *, lease: NonNegativeFloat) -> bool:
+        """``False`` if ``worker`` lost its claim meanwhile"""
+        with self._lock:
+            cursor = self._connection.execute(
+                "UPDATE jobs SET lease_until = ?"
+                " WHERE job_id = ? AND worker = ? AND result IS NULL",
+                (time.time() + lease, job_id, worker),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: int, worker: str, result: dict[str, Any]) -> bool:
+        """``False`` (and the result is dropped) if ``worker`` lost its claim"""
+        with self._lock:
+            cursor = self._connection.execute(
+                "UPDATE jobs SET result = ?"
+                " WHERE job_id = ? AND worker = ? AND result IS NULL",
+                (json.dumps(result), job_id, worker),
+            )
+        return cursor.rowcount == 1
+
+    def get_result(self, job_id: int) -> dict[str, Any] | None:
+        return self.get_results([job_id]).get(job_id)
+
+    def get_results(self, job_ids: list[int]) -> dict[int, dict[str, Any]]:
+        """the results of those ``job_ids`` which have one"""
+        rows = []
+        with self._lock:
+            # NOTE: older SQLite versions allow 999 parameters per statement
+            for start in range(0, len(job_ids), _MAX_PARAMETERS):
+                chunk = job_ids[start : start + _MAX_PARAMETERS]
+                rows += self._connection.execute(
+                    "SELECT job_id, result FROM jobs WHERE result IS NOT NULL"
+                    f" AND job_id IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+        return {job_id: json.loads(result) for job_id, result in rows}
+
+    async def wait_for_result(self, job_id: int) -> dict[str, Any]:
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[job_id] = future
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self._poll_results())
+        try:
+            return await future
+        finally:
+            self._waiting.pop(job_id, None)
+
+    async def _poll_results(self) -> None:
+        """fetches the results of all jobs being waited for every
+        ``poll_interval``, until none is waited for anymore"""
+        try:
+            while self._waiting:
+                results = await asyncio.to_thread(self.get_results, [*self._waiting])
+                for job_id, result in results.items():
+                    future = self._waiting.pop(job_id, None)
+                    if future is not None and not future.done():
+                        future.set_result(result)
+                if self._waiting:
+                    await asyncio.sleep(self.poll_interval)
+        except Exception as e:  # pylint: disable=broad-except  # noqa: BLE001
+            for future in self._waiting.values():
+                if not future.done():
+                    future.set_exception(e)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,135 @@
+"""Worker mode copying the images a coordinator publishes to a work queue."""
+
+import asyncio
+import contextlib
+import logging
+import os
+import socket
+import traceback
+from pathlib import Path
+from typing import Final
+
+from pydantic import NonNegativeInt, PositiveFloat
+
+from ._backend import Backend, RegistryBackend
+from ._models import Configuration
+from ._retry import RetryPolicy
+from ._sync import (
+    DEFAULT_BLOB_CACHE_MAX_BYTES,
+    _get_registry_backend,
+    _login_into_all_registries,
+    run_job,
+)
+from ._tracing import span
+from ._work_queue import WorkQueue
+
+# NOTE: a job of a worker which stopped renewing is claimed again after this
+_LEASE_SECONDS: Final[float] = 60.0
+
+_logger = logging.getLogger(__name__)
+
+
+async def _renew_claim(
+    work_queue: WorkQueue, job_id: int, worker: str, *, lease: PositiveFloat
+) -> None:
+    while True:
+        await asyncio.sleep(lease / 3)
+        if not await asyncio.to_thread(work_queue.renew, job_id, worker, lease=lease):
+            _logger.warning("Job '%s' was claimed by another worker", job_id)
+            return
+
+
+async def _consume(
+    configuration: Configuration,
+    registry_backend: RegistryBackend,
+    work_queue: WorkQueue,
+    retry_policy: RetryPolicy,
+    *,
+    worker: str,
+    lease: PositiveFloat,
+    since: int,
+) -> None:
+    while True:
+        claimed = await asyncio.to_thread(work_queue.claim, worker, lease=lease)
+        if claimed is None:
+            if await asyncio.to_thread(work_queue.is_finished, since):
+                return
+            await asyncio.sleep(work_queue.poll_interval)
+            continue
+
+        job_id, job = claimed
+        renewer = asyncio.create_task(
+            _renew_claim(work_queue, job_id, worker, lease=lease)
+        )
+        try:
+            with span("job", job_id=job_id, tasks=len(job["tasks"])):
+                result = await run_job(
+                    configuration, registry_backend, job, retry_policy, worker=worker
+                )
+        except Exception:  # pylint: disable=broad-except  # noqa: BLE001
+            _logger.exception("Job '%s' failed", job_id)
+            result = {"worker": worker, "error": traceback.format_exc()}
+        finally:
+            renewer.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await renewer
+        if not await asyncio.to_thread(work_queue.complete, job_id, worker, result):
+            _logger.warning("Dropped the result of job '%s', claimed again", job_id)
+
+
+async def work(
+    configuration: Configuration,
+    *,
+    backend: Backend,
+    work_queue_file: Path,
+    parallel_sync_tasks: NonNegativeInt,
+    parallel_discovery_tasks: NonNegativeInt,
+    blob_cache_dir: Path | None = None,
+    blob_cache_max_bytes: NonNegativeInt = DEFAULT_BLOB_CACHE_MAX_BYTES,
+    retry_policy: RetryPolicy | None = None,
+    lease: PositiveFloat = _LEASE_SECONDS,
+) -> None:
+    """Copies up to ``parallel_sync_tasks`` jobs of the coordinator publishing
+    to ``work_queue_file`` at once, until a run which had not finished when
+    the worker started (see ``WorkQueue``) finished.
+
+    A job is claimed for ``lease`` seconds, renewed while it runs. Jobs of a
+    worker which died are copied again by another one once its lease expired.
+    """
+    work_queue = await asyncio.to_thread(WorkQueue, work_queue_file)
+    since = await asyncio.to_thread(work_queue.get_finished_generation)
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    registry_backend = _get_registry_backend(
+        configuration,
+        backend,
+        state_dir=None,
+        digest_cache_ttl=0,
+        invalidate_registries=[],
+        blob_cache_dir=blob_cache_dir,
+        blob_cache_max_bytes=blob_cache_max_bytes,
+    )
+    try:
+        with span("work", worker=worker):
+            await _login_into_all_registries(
+                configuration,
+                registry_backend,
+                parallel_discovery_tasks=parallel_discovery_tasks,
+            )
+            _logger.info("Worker '%s' consuming jobs of '%s'", worker, work_queue_file)
+            await asyncio.gather(
+                *(
+                    _consume(
+                        configuration,
+                        registry_backend,
+                        work_queue,
+                        RetryPolicy() if retry_policy is None else retry_policy,
+                        worker=worker,
+                        lease=lease,
+                        since=since,
+                    )
+                    for _ in range(max(parallel_sync_tasks, 1))
+                )
+            )
+    finally:
+        await registry_backend.close()
+        work_queue.close()
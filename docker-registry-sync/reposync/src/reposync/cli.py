@@ -1,16 +1,29 @@
 import asyncio
+import json
 import logging
+import sys
 from pathlib import Path
 from pprint import pformat
 import yaml_include
 
 import typer
 import yaml
-from pydantic import NonNegativeInt, TypeAdapter
+from pydantic import NonNegativeFloat, NonNegativeInt, PositiveFloat, TypeAdapter
 from typing_extensions import Annotated
 
+from ._backend import Backend
+from ._metrics import METRICS_PATH
 from ._models import Configuration
-from ._sync import run_sync_tasks
+from ._retry import RetryPolicy
+from ._sync import (
+    DEFAULT_BLOB_CACHE_MAX_BYTES,
+    Shard,
+    plan_sync_tasks,
+    run_sync_tasks,
+)
+from ._tracing import span, tracing
+from ._watch import WEBHOOK_PATH, watch
+from ._worker import work
 
 _logger = logging.getLogger(__name__)
 
@@ -43,24 +56,124 @@ def _get_configuration(config_file: Path) -> Configuration:
 async def _repo_sync(
     config_file: Path,
     verify_only: bool,
+    plan: bool,
     parallel_sync_tasks: NonNegativeInt,
+    parallel_discovery_tasks: NonNegativeInt,
     use_explicit_tags: bool,
     debug: bool,
     tracebacks_file: Path,
+    backend: Backend,
+    state_dir: Path | None,
+    digest_cache_ttl: NonNegativeFloat,
+    invalidate_registries: list[str],
+    blob_cache_dir: Path | None,
+    blob_cache_max_bytes: NonNegativeInt,
+    retries: NonNegativeInt,
+    retry_initial_delay: NonNegativeFloat,
+    resume: bool,
+    continue_on_failure: bool,
+    watch_mode: bool,
+    watch_interval: PositiveFloat,
+    webhook_port: NonNegativeInt | None,
+    metrics_port: NonNegativeInt | None,
+    metrics_file: Path | None,
+    schedule_by_size: bool,
+    max_in_flight_bytes: NonNegativeInt | None,
+    shard: Shard | None,
+    work_queue: Path | None,
+    worker_mode: bool,
 ) -> None:
     _configure_logging(debug)
 
-    configuration = _get_configuration(config_file)
+    with span("load configuration"):
+        configuration = _get_configuration(config_file)
 
     if verify_only:
         _logger.info("Configuration is OK, closing gracefully.")
         return
 
+    if plan:
+        report = await plan_sync_tasks(
+            configuration,
+            backend=backend,
+            use_explicit_tags=use_explicit_tags,
+            parallel_discovery_tasks=parallel_discovery_tasks,
+            shard=shard,
+            schedule_by_size=schedule_by_size or max_in_flight_bytes is not None,
+        )
+        typer.echo(json.dumps(report, indent=2))
+        return
+
+    if worker_mode:
+        if work_queue is None:
+            msg = "a worker requires the `--work-queue` of its coordinator"
+            raise ValueError(msg)
+        await work(
+            configuration,
+            backend=backend,
+            work_queue_file=work_queue,
+            parallel_sync_tasks=parallel_sync_tasks,
+            parallel_discovery_tasks=parallel_discovery_tasks,
+            blob_cache_dir=blob_cache_dir,
+            blob_cache_max_bytes=blob_cache_max_bytes,
+            retry_policy=RetryPolicy(
+                retries=retries, initial_delay=retry_initial_delay
+            ),
+        )
+        return
+
+    if watch_mode:
+        if work_queue is not None:
+            msg = "`--work-queue` cannot be combined with `--watch`"
+            raise ValueError(msg)
+        await watch(
+            config_file,
+            _get_configuration,
+            backend=backend,
+            interval=watch_interval,
+            webhook_port=webhook_port,
+            use_explicit_tags=use_explicit_tags,
+            parallel_sync_tasks=parallel_sync_tasks,
+            parallel_discovery_tasks=parallel_discovery_tasks,
+            tracebacks_file=tracebacks_file,
+            state_dir=state_dir,
+            digest_cache_ttl=digest_cache_ttl,
+            invalidate_registries=invalidate_registries,
+            blob_cache_dir=blob_cache_dir,
+            blob_cache_max_bytes=blob_cache_max_bytes,
+            retry_policy=RetryPolicy(
+                retries=retries, initial_delay=retry_initial_delay
+            ),
+            continue_on_failure=continue_on_failure,
+            metrics_port=metrics_port,
+            metrics_file=metrics_file,
+            schedule_by_size=schedule_by_size,
+            max_in_flight_bytes=max_in_flight_bytes,
+            shard=shard,
+        )
+        return
+
     await run_sync_tasks(
         configuration,
+        backend=backend,
         use_explicit_tags=use_explicit_tags,
         parallel_sync_tasks=parallel_sync_tasks,
+        parallel_discovery_tasks=parallel_discovery_tasks,
         tracebacks_file=tracebacks_file,
+        state_dir=state_dir,
+        digest_cache_ttl=digest_cache_ttl,
+        invalidate_registries=invalidate_registries,
+        blob_cache_dir=blob_cache_dir,
+        blob_cache_max_bytes=blob_cache_max_bytes,
+        retry_policy=RetryPolicy(retries=retries, initial_delay=retry_initial_delay),
+        resume=resume,
+        continue_on_failure=continue_on_failure,
+        metrics_port=metrics_port,
+        metrics_file=metrics_file,
+        schedule_by_size=schedule_by_size,
+        max_in_flight_bytes=max_in_flight_bytes,
+        shard=shard,
+        work_queue_file=work_queue,
     )
 
 
@@ -88,12 +201,29 @@ def run_repo_sync(
     verify_only: Annotated[
         bool, typer.Option(help="check configuration file only", allow_dash=True)
     ] = False,
+    plan: Annotated[
+        bool,
+        typer.Option(
+            help=(
+                "only discover tags and compare digests, print the tasks a sync "
+                "would copy or skip (per stage, with the DAG depth and estimated "
+                "bytes to transfer) as JSON to stdout"
+            ),
+        ),
+    ] = False,
     parallel_sync_tasks: Annotated[
         NonNegativeInt,
         typer.Option(
             help="amount of parallel sync tasks to be run at once", allow_dash=True
         ),
     ] = 10,
+    parallel_discovery_tasks: Annotated[
+        NonNegativeInt,
+        typer.Option(
+            help="amount of parallel registry logins and tag listings while planning",
+            allow_dash=True,
+        ),
+    ] = 10,
     use_explicit_tags: Annotated[
         bool,
         typer.Option(
@@ -104,17 +234,256 @@ def run_repo_sync(
     debug: Annotated[
         bool, typer.Option(help="show additional information during sync")
     ] = False,
+    backend: Annotated[
+        Backend,
+        typer.Option(
+            help=(
+                "how registries are accessed: `crane` runs a subprocess per "
+                "operation, `native` uses an in-process HTTP client with "
+                "pooled connections"
+            ),
+        ),
+    ] = Backend.CRANE,
+    state_dir: Annotated[
+        Path | None,
+        typer.Option(
+            help=(
+                "directory where state is kept between runs, when set image "
+                "digests are cached there (see `--digest-cache-ttl`)"
+            ),
+            file_okay=False,
+            dir_okay=True,
+            writable=True,
+        ),
+    ] = None,
+    digest_cache_ttl: Annotated[
+        NonNegativeFloat,
+        typer.Option(
+            help="seconds after which digests cached in `--state-dir` are checked again",
+            allow_dash=True,
+        ),
+    ] = 3600,
+    invalidate_registries: Annotated[
+        list[str],
+        typer.Option(
+            "--invalidate-registry",
+            help=(
+                "registry key (from the configuration) for which all digests "
+                "cached in `--state-dir` are dropped before syncing, can be repeated"
+            ),
+        ),
+    ] = [],
+    blob_cache_dir: Annotated[
+        Path | None,
+        typer.Option(
+            help=(
+                "directory where image layers are kept between runs and read "
+                "from before pulling them from the source registry, requires "
+                "`--backend native`"
+            ),
+            file_okay=False,
+            dir_okay=True,
+            writable=True,
+        ),
+    ] = None,
+    blob_cache_max_bytes: Annotated[
+        NonNegativeInt,
+        typer.Option(
+            help="size of `--blob-cache-dir` after which least recently used layers are removed",
+            allow_dash=True,
+        ),
+    ] = DEFAULT_BLOB_CACHE_MAX_BYTES,
+    retries: Annotated[
+        NonNegativeInt,
+        typer.Option(
+            help=(
+                "how many times each step of a task (digest lookups, copy) is "
+                "retried after a transient error "
+                "(timeouts, 5xx, dropped connections), permanent errors "
+                "(not found, authentication) fail right away"
+            ),
+            allow_dash=True,
+        ),
+    ] = 3,
+    retry_initial_delay: Annotated[
+        NonNegativeFloat,
+        typer.Option(
+            help="seconds before the first retry, doubled for each following one (with jitter)",
+            allow_dash=True,
+        ),
+    ] = 1,
+    resume: Annotated[
+        bool,
+        typer.Option(
+            help=(
+                "skip tasks which the previous run (journaled in `--state-dir`) "
+                "finished, as long as their source digest did not change"
+            ),
+        ),
+    ] = False,
+    continue_on_failure: Annotated[
+        bool,
+        typer.Option(
+            help=(
+                "when a task fails, keep running every task which does not "
+                "depend on it instead of stopping; exits non-zero at the end"
+            ),
+        ),
+    ] = False,
+    watch_mode: Annotated[
+        bool,
+        typer.Option(
+            "--watch",
+            help=(
+                "keep running and sync again every `--watch-interval` seconds, "
+                "only images whose source digest changed are copied"
+            ),
+        ),
+    ] = False,
+    watch_interval: Annotated[
+        PositiveFloat,
+        typer.Option(help="seconds between two syncs in `--watch` mode"),
+    ] = 300,
+    webhook_port: Annotated[
+        int | None,
+        typer.Option(
+            help=(
+                f"in `--watch` mode, port accepting registry notifications "
+                f"(POST {WEBHOOK_PATH}), a push starts a sync right away"
+            ),
+        ),
+    ] = None,
+    metrics_port: Annotated[
+        int | None,
+        typer.Option(
+            help=(
+                f"port serving Prometheus metrics (GET {METRICS_PATH}) about "
+                "registry latencies, copies, slot waits and caches (bytes "
+                "pushed only with `--backend native`)"
+            ),
+        ),
+    ] = None,
+    metrics_file: Annotated[
+        Path | None,
+        typer.Option(
+            help=(
+                "file the metrics are written to periodically and at the end, "
+                "for node exporter's textfile collector (use a `.prom` suffix)"
+            ),
+            dir_okay=False,
+            file_okay=True,
+            writable=True,
+        ),
+    ] = None,
+    schedule_by_size: Annotated[
+        bool,
+        typer.Option(
+            help=(
+                "look up the size of every image to copy while planning, "
+                "so that the largest images and longest dependency chains "
+                "start first (by default chains are ranked by image count)"
+            ),
+        ),
+    ] = False,
+    max_in_flight_bytes: Annotated[
+        int | None,
+        typer.Option(
+            help=(
+                "limit the bytes of the images copied at once (per destination), "
+                "an image larger than this still runs alone; implies "
+                "`--schedule-by-size`"
+            ),
+        ),
+    ] = None,
+    shard: Annotated[
+        Shard | None,
+        typer.Option(
+            help=(
+                "`INDEX/COUNT` (e.g. `2/4`), only run this part of the sync so "
+                "that COUNT jobs share it: tasks depending on each other stay "
+                "together, parts are balanced by task count (image size with "
+                "`--schedule-by-size`). Tracebacks and timings files are named "
+                "after the shard"
+            ),
+            parser=Shard.parse,
+            metavar="INDEX/COUNT",
+        ),
+    ] = None,
+    work_queue: Annotated[
+        Path | None,
+        typer.Option(
+            help=(
+                "SQLite file (on a local disk of the host running the "
+                "workers, not a network filesystem) the images to copy are "
+                "published to: this process plans and schedules, `--worker` "
+                "processes copy"
+            ),
+            dir_okay=False,
+            file_okay=True,
+            writable=True,
+        ),
+    ] = None,
+    worker_mode: Annotated[
+        bool,
+        typer.Option(
+            "--worker",
+            help=(
+                "copy the images published to `--work-queue` (with the same "
+                "configuration) until the coordinator finished, a worker "
+                "which dies has its images copied by another one"
+            ),
+        ),
+    ] = False,
+    trace_file: Annotated[
+        Path | None,
+        typer.Option(
+            help=(
+                "file where spans of logins, tag discovery, planning, every "
+                "image copy and registry operation are written as OTLP JSON "
+                "(one request per line), `-` writes them to stdout (to stderr "
+                "with `--plan`)"
+            ),
+            dir_okay=False,
+            file_okay=True,
+            writable=True,
+            allow_dash=True,
+        ),
+    ] = None,
 ):
-    asyncio.run(
-        _repo_sync(
-            config_file,
-            verify_only,
-            parallel_sync_tasks,
-            use_explicit_tags,
-            debug,
-            tracebacks_file,
+    # NOTE: stdout only carries the JSON report of `--plan`
+    with tracing(trace_file, console=sys.stderr if plan else None):
+        asyncio.run(
+            _repo_sync(
+                config_file,
+                verify_only,
+                plan,
+                parallel_sync_tasks,
+                parallel_discovery_tasks,
+                use_explicit_tags,
+                debug,
+                tracebacks_file,
+                backend,
+                state_dir,
+                digest_cache_ttl,
+                invalidate_registries,
+                blob_cache_dir,
+                blob_cache_max_bytes,
+                retries,
+                retry_initial_delay,
+                resume,
+                continue_on_failure,
+                watch_mode,
+                watch_interval,
+                webhook_port,
+                metrics_port,
+                metrics_file,
+                schedule_by_size,
+                max_in_flight_bytes,
+                shard,
+                work_queue,
+                worker_mode,
+            )
         )
-    )
 
 
 def main() -> None:
@@ -2,11 +2,24 @@
 # pylint: disable=unused-argument
 
 import sys
+import asyncio
+import hashlib
+import json
 import logging
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Callable
+from uuid import uuid4
 
 import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from reposync import _registry
+from reposync._blob_store import BlobStats
+from reposync._cache import CacheStats
+from reposync._models import Configuration
 
 _CURRENT_DIR = (
     Path(sys.argv[0] if __name__ == "__main__" else __file__).resolve().parent
@@ -53,3 +66,379 @@ def caplog_debug(caplog: pytest.LogCaptureFixture) -> pytest.LogCaptureFixture:
     caplog.clear()
     caplog.set_level(logging.DEBUG)
     return caplog
+
+
+_OCI_INDEX = "application/vnd.oci.image.index.v1+json"
+_OCI_MANIFEST = "application/vnd.oci.image.manifest.v1+json"
+_OCI_LAYER = "application/vnd.oci.image.layer.v1.tar"
+
+
+def _digest(data: bytes) -> str:
+    return f"sha256:{hashlib.sha256(data).hexdigest()}"
+
+
+@dataclass
+class FakeRegistry:
+    """Minimal in-process OCI distribution registry used to test the native backend"""
+
+    tags_page_size: int = 2
+    manifests: dict[tuple[str, str], tuple[bytes, str]] = field(default_factory=dict)
+    blobs: dict[str, bytes] = field(default_factory=dict)
+    requests: list[tuple[str, str]] = field(default_factory=list)
+    peers: set[tuple[str, int]] = field(default_factory=set)
+    url: str = ""
+    _uploads: dict[str, str] = field(default_factory=dict)
+
+    def _put_manifest(
+        self, repository: str, reference: str, body: bytes, media_type: str
+    ) -> str:
+        digest = _digest(body)
+        self.manifests[(repository, reference)] = (body, media_type)
+        self.manifests[(repository, digest)] = (body, media_type)
+        return digest
+
+    def _put_image(
+        self, repository: str, reference: str, layers: list[bytes]
+    ) -> tuple[str, int]:
+        config = json.dumps({"layers": len(layers), "id": f"{uuid4()}"}).encode()
+        descriptors = []
+        for blob in [config, *layers]:
+            self.blobs[_digest(blob)] = blob
+            descriptors.append(
+                {"mediaType": _OCI_LAYER, "digest": _digest(blob), "size": len(blob)}
+            )
+        body = json.dumps(
+            {
+                "schemaVersion": 2,
+                "mediaType": _OCI_MANIFEST,
+                "config": descriptors[0],
+                "layers": descriptors[1:],
+            }
+        ).encode()
+        return self._put_manifest(repository, reference, body, _OCI_MANIFEST), len(body)
+
+    def add_image(
+        self, repository: str, tag: str, layers: list[bytes], *, platforms: int = 0
+    ) -> str:
+        """stores an image (or an index with ``platforms`` children), returns its digest"""
+        if platforms == 0:
+            digest, _ = self._put_image(repository, tag, layers)
+            return digest
+
+        children = []
+        for platform in range(platforms):
+            digest, size = self._put_image(
+                repository, f"{tag}-{platform}", [*layers, f"{platform}".encode()]
+            )
+            children.append(
+                {"mediaType": _OCI_MANIFEST, "digest": digest, "size": size}
+            )
+        body = json.dumps(
+            {"schemaVersion": 2, "mediaType": _OCI_INDEX, "manifests": children}
+        ).encode()
+        return self._put_manifest(repository, tag, body, _OCI_INDEX)
+
+    def tags(self, repository: str) -> list[str]:
+        return sorted(
+            ref
+            for repo, ref in self.manifests
+            if repo == repository and not ref.startswith("sha256:")
+        )
+
+    def count(self, method: str, path_fragment: str) -> int:
+        return len([1 for m, p in self.requests if m == method and path_fragment in p])
+
+    @web.middleware
+    async def _track(self, request: web.Request, handler):
+        self.requests.append((request.method, request.path_qs))
+        self.peers.add(request.transport.get_extra_info("peername"))
+        return await handler(request)
+
+    async def _ping(self, request: web.Request) -> web.Response:
+        return web.Response()
+
+    async def _tags_list(self, request: web.Request) -> web.Response:
+        name = request.match_info["name"]
+        tags = self.tags(name)
+        if not tags:
+            raise web.HTTPNotFound()
+        size = int(request.query.get("n", self.tags_page_size))
+        size = min(size, self.tags_page_size)
+        last = request.query.get("last")
+        remaining = [t for t in tags if last is None or t > last]
+        page = remaining[:size]
+        headers = {}
+        if len(remaining) > size:
+            headers["Link"] = (
+                f'</v2/{name}/tags/list?n={size}&last={page[-1]}>; rel="next"'
+            )
+        return web.json_response({"name": name, "tags": page}, headers=headers)
+
+    async def _hub_tags(self, request: web.Request) -> web.Response:
+        """tags with their digest, paginated like the Docker Hub API"""
+        name = request.match_info["name"]
+        tags = self.tags(name)
+        size = min(int(request.query["page_size"]), self.tags_page_size)
+        page = int(request.query.get("page", 1))
+        results = [
+            {"name": tag, "digest": _digest(self.manifests[(name, tag)][0])}
+            for tag in tags[(page - 1) * size : page * size]
+        ]
+        next_page = (
+            f"{request.url.update_query(page=page + 1)}"
+            if page * size < len(tags)
+            else None
+        )
+        return web.json_response(
+            {"count": len(tags), "next": next_page, "results": results}
+        )
+
+    async def _get_manifest(self, request: web.Request) -> web.Response:
+        key = (request.match_info["name"], request.match_info["reference"])
+        if key not in self.manifests:
+            raise web.HTTPNotFound()
+        body, media_type = self.manifests[key]
+        headers = {"Docker-Content-Digest": _digest(body), "Content-Type": media_type}
+        if request.method == "HEAD":
+            return web.Response(headers={**headers, "Content-Length": f"{len(body)}"})
+        return web.Response(body=body, headers=headers)
+
+    async def _put_manifest_handler(self, request: web.Request) -> web.Response:
+        name = request.match_info["name"]
+        body = await request.read()
+        manifest = json.loads(body)
+        referenced = [m["digest"] for m in manifest.get("manifests", [])]
+        missing_manifests = [d for d in referenced if (name, d) not in self.manifests]
+        blobs = (
+            [manifest["config"], *manifest["layers"]] if "config" in manifest else []
+        )
+        missing_blobs = [b["digest"] for b in blobs if b["digest"] not in self.blobs]
+        if missing_manifests or missing_blobs:
+            raise web.HTTPBadRequest(text=f"{missing_manifests=} {missing_blobs=}")
+        self._put_manifest(
+            name, request.match_info["reference"], body, request.content_type
+        )
+        return web.Response(status=201)
+
+    async def _get_blob(self, request: web.Request) -> web.Response:
+        digest = request.match_info["digest"]
+        if digest not in self.blobs:
+            raise web.HTTPNotFound()
+        if request.method == "HEAD":
+            return web.Response(
+                headers={"Content-Length": f"{len(self.blobs[digest])}"}
+            )
+        return web.Response(body=self.blobs[digest])
+
+    async def _start_upload(self, request: web.Request) -> web.Response:
+        name = request.match_info["name"]
+        if (mount := request.query.get("mount")) and mount in self.blobs:
+            return web.Response(status=201)
+        upload_id = f"{uuid4()}"
+        self._uploads[upload_id] = name
+        return web.Response(
+            status=202, headers={"Location": f"/v2/{name}/blobs/uploads/{upload_id}"}
+        )
+
+    async def _finish_upload(self, request: web.Request) -> web.Response:
+        upload_id = request.match_info["upload_id"]
+        if self._uploads.pop(upload_id, None) is None:
+            raise web.HTTPNotFound()
+        body = await request.read()
+        if _digest(body) != request.query["digest"]:
+            raise web.HTTPBadRequest(text="digest mismatch")
+        self.blobs[_digest(body)] = body
+        return web.Response(status=201)
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._track])
+        name = "{name:.+}"
+        app.router.add_get("/v2/", self._ping)
+        app.router.add_get(f"/v2/{name}/tags/list", self._tags_list)
+        app.router.add_get(f"/hub/repositories/{name}/tags/", self._hub_tags)
+        app.router.add_get(f"/v2/{name}/manifests/{{reference}}", self._get_manifest)
+        app.router.add_put(
+            f"/v2/{name}/manifests/{{reference}}", self._put_manifest_handler
+        )
+        app.router.add_get(
+            f"/v2/{name}/blobs/{{digest:sha256:[a-f0-9]+}}", self._get_blob
+        )
+        app.router.add_post(f"/v2/{name}/blobs/uploads/", self._start_upload)
+        app.router.add_put(
+            f"/v2/{name}/blobs/uploads/{{upload_id}}", self._finish_upload
+        )
+        return app
+
+
+async def _start_fake_registry() -> AsyncIterator[FakeRegistry]:
+    registry = FakeRegistry()
+    server = TestServer(registry.make_app(), host="127.0.0.1")
+    await server.start_server()
+    registry.url = f"127.0.0.1:{server.port}"
+    try:
+        yield registry
+    finally:
+        await _registry.close()
+        await _registry.clear_cache()
+        await server.close()
+
+
+@pytest_asyncio.fixture
+async def fake_registry() -> AsyncIterator[FakeRegistry]:
+    async for registry in _start_fake_registry():
+        yield registry
+
+
+@pytest_asyncio.fixture
+async def other_fake_registry() -> AsyncIterator[FakeRegistry]:
+    async for registry in _start_fake_registry():
+        yield registry
+
+
+@dataclass
+class FakeBackend:
+    """In-memory ``RegistryBackend`` recording every call it receives.
+
+    ``digests`` maps registry images (``url/repo:tag``) to their digest,
+    ``copy`` makes the destination digest match the source one after
+    sleeping ``copy_delays[source]`` seconds. Images without an entry in
+    ``sizes`` have 0 bytes.
+    """
+
+    tags: dict[str, list[str]] = field(default_factory=dict)
+    digests: dict[str, str] = field(default_factory=dict)
+    copy_delays: dict[str, float] = field(default_factory=dict)
+    sizes: dict[str, int] = field(default_factory=dict)
+    failing: set[str] = field(default_factory=set)
+    calls: list[tuple[str, str]] = field(default_factory=list)
+    events: list[tuple[str, str]] = field(default_factory=list)
+
+    async def login(self, registry_url: str, username: str, password) -> None:
+        self.calls.append(("login", registry_url))
+
+    async def get_digest(self, image: str, *, skip_tls_verify: bool) -> str | None:
+        self.calls.append(("get_digest", image))
+        return self.digests.get(image)
+
+    async def get_digests(
+        self, repository: str, tags: list[str], *, skip_tls_verify: bool
+    ) -> dict[str, str | None]:
+        self.calls.append(("get_digests", repository))
+        return {
+            f"{repository}:{tag}": self.digests.get(f"{repository}:{tag}")
+            for tag in tags
+        }
+
+    async def get_image_tags(self, image: str, *, skip_tls_verify: bool) -> list[str]:
+        self.calls.append(("get_image_tags", image))
+        return self.tags[image]
+
+    async def get_image_size(self, image: str, *, skip_tls_verify: bool) -> int | None:
+        self.calls.append(("get_image_size", image))
+        if image not in self.digests:
+            return None
+        return self.sizes.get(image, 0)
+
+    async def copy(
+        self,
+        source: str,
+        destination: str,
+        *,
+        src_skip_tls_verify: bool,
+        dst_skip_tls_verify: bool,
+    ) -> None:
+        self.calls.append(("copy", f"{source} -> {destination}"))
+        self.events.append(("start", source))
+        await asyncio.sleep(self.copy_delays.get(source, 0))
+        if source in self.failing:
+            msg = f"failed to copy {source}"
+            raise RuntimeError(msg)
+        self.digests[destination] = self.digests.get(source, f"sha256:{source}")
+        self.events.append(("end", source))
+
+    async def copy_to_many(
+        self,
+        source: str,
+        destinations: dict[str, bool],
+        *,
+        src_skip_tls_verify: bool,
+    ) -> dict[str, BaseException]:
+        self.calls.append(("copy_to_many", f"{source} -> {sorted(destinations)}"))
+        self.events.append(("start", source))
+        await asyncio.sleep(self.copy_delays.get(source, 0))
+        failures: dict[str, BaseException] = {}
+        for destination in destinations:
+            if destination in self.failing:
+                failures[destination] = RuntimeError(f"failed to copy {destination}")
+            else:
+                self.digests[destination] = self.digests.get(source, f"sha256:{source}")
+        self.events.append(("end", source))
+        return failures
+
+    async def clear_cache(self) -> None:
+        self.calls.append(("clear_cache", ""))
+
+    async def invalidate(self, image: str) -> None:
+        self.calls.append(("invalidate", image))
+
+    def get_cache_stats(self) -> CacheStats:
+        return CacheStats()
+
+    def get_blob_stats(self) -> BlobStats | None:
+        return None
+
+    async def close(self) -> None:
+        self.calls.append(("close", ""))
+
+    def count(self, operation: str) -> int:
+        return len([1 for name, _ in self.calls if name == operation])
+
+
+@pytest.fixture
+def fake_backend() -> FakeBackend:
+    return FakeBackend()
+
+
+def make_configuration(stages: list[dict]) -> Configuration:
+    """configuration with registries ``first`` and ``second`` (urls equal to their keys)"""
+    return Configuration.model_validate(
+        {
+            "registries": {
+                "first": {
+                    "url": "first",
+                    "env_user": "ENV_VAR_FIRST_USER",
+                    "env_password": "ENV_VAR_FIRST_PASSWORD",
+                },
+                "second": {
+                    "url": "second",
+                    "env_user": "ENV_VAR_SECOND_USER",
+                    "env_password": "ENV_VAR_SECOND_PASSWORD",
+                },
+            },
+            "stages": stages,
+        }
+    )
+
+
+def make_stage(
+    stage_id: str,
+    repository: str,
+    tags: list[str],
+    *,
+    source: str = "first",
+    destination: str = "second",
+    dst_repository: str | None = None,
+    depends_on: list[str] | None = None,
+) -> dict:
+    return {
+        "id": stage_id,
+        "from": {"source": source, "repository": repository},
+        "to": [
+            {
+                "destination": destination,
+                "repository": dst_repository or repository,
+                "tags": tags,
+            }
+        ],
+        "depends_on": depends_on or [],
+    }
@@ -0,0 +1,89 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=unused-argument
+
+import hashlib
+import os
+from pathlib import Path
+from typing import AsyncIterator
+
+import pytest
+from reposync._blob_store import BlobDigestMismatchError, BlobStore
+
+
+def _digest(content: bytes) -> str:
+    return f"sha256:{hashlib.sha256(content).hexdigest()}"
+
+
+def _fetch(content: bytes, fetched: list[bytes]):
+    async def _chunks() -> AsyncIterator[bytes]:
+        fetched.append(content)
+        yield content
+
+    return _chunks
+
+
+async def _store(blob_store: BlobStore, content: bytes, fetched: list[bytes]) -> bytes:
+    async with blob_store.blob(_digest(content), _fetch(content, fetched)) as path:
+        return path.read_bytes()
+
+
+@pytest.mark.asyncio
+async def test_blob_store_fetches_once_and_persists(tmp_path: Path):
+    fetched: list[bytes] = []
+    blob_store = BlobStore(tmp_path, max_bytes=100)
+
+    assert await _store(blob_store, b"layer", fetched) == b"layer"
+    assert await _store(blob_store, b"layer", fetched) == b"layer"
+    assert (
+        await _store(BlobStore(tmp_path, max_bytes=100), b"layer", fetched) == b"layer"
+    )
+
+    assert fetched == [b"layer"]
+    assert blob_store.stats.from_network == 5
+    assert blob_store.stats.from_cache == 5
+
+
+@pytest.mark.asyncio
+async def test_blob_store_evicts_least_recently_used(tmp_path: Path):
+    fetched: list[bytes] = []
+    blob_store = BlobStore(tmp_path, max_bytes=10)
+
+    await _store(blob_store, b"aaaa", fetched)
+    await _store(blob_store, b"bbbb", fetched)
+    await _store(blob_store, b"aaaa", fetched)
+    await _store(blob_store, b"cccc", fetched)
+
+    assert blob_store.size == 8
+    assert blob_store.stats.evicted == 4
+    await _store(blob_store, b"aaaa", fetched)
+    await _store(blob_store, b"bbbb", fetched)
+    assert fetched == [b"aaaa", b"bbbb", b"cccc", b"bbbb"]
+
+
+@pytest.mark.asyncio
+async def test_blob_store_restores_usage_order(tmp_path: Path):
+    blob_store = BlobStore(tmp_path, max_bytes=10)
+    await _store(blob_store, b"aaaa", [])
+    await _store(blob_store, b"bbbb", [])
+    # make `aaaa` the most recently used one
+    os.utime(blob_store.directory / _digest(b"aaaa").replace(":", "-"))
+    os.utime(blob_store.directory / _digest(b"bbbb").replace(":", "-"), times=(0, 0))
+
+    fetched: list[bytes] = []
+    blob_store = BlobStore(tmp_path, max_bytes=10)
+    await _store(blob_store, b"cccc", fetched)
+    await _store(blob_store, b"aaaa", fetched)
+
+    assert fetched == [b"cccc"]
+
+
+@pytest.mark.asyncio
+async def test_blob_store_rejects_wrong_content(tmp_path: Path):
+    blob_store = BlobStore(tmp_path, max_bytes=100)
+
+    with pytest.raises(BlobDigestMismatchError):
+        async with blob_store.blob(_digest(b"expected"), _fetch(b"received", [])):
+            pass
+
+    assert blob_store.size == 0
+    assert list(blob_store.directory.iterdir()) == []
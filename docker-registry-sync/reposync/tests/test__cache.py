@@ -0,0 +1,72 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=unused-argument
+
+import asyncio
+from collections.abc import AsyncIterator
+from unittest.mock import AsyncMock
+
+import pytest
+import pytest_asyncio
+from pytest_mock.plugin import MockerFixture
+from reposync import _crane
+from reposync._cache import CacheStats, get_repository
+
+
+@pytest.mark.parametrize(
+    "image,expected",
+    [
+        pytest.param("first/some/repo:1.0", "first/some/repo"),
+        pytest.param("first:5000/some/repo:1.0", "first:5000/some/repo"),
+        pytest.param("first:5000/some/repo", "first:5000/some/repo"),
+    ],
+)
+def test_get_repository(image: str, expected: str):
+    assert get_repository(image) == expected
+
+
+@pytest_asyncio.fixture
+async def mock_execute_command(mocker: MockerFixture) -> AsyncIterator[AsyncMock]:
+    await _crane.clear_cache()
+    yield mocker.patch("reposync._crane._execute_command", return_value="sha256:digest")
+    await _crane.clear_cache()
+
+
+@pytest.mark.asyncio
+async def test_invalidate_only_drops_written_image(mock_execute_command: AsyncMock):
+    initial_stats = CacheStats(**vars(_crane.get_cache_stats()))
+
+    for image in ["first/written:1", "first/untouched:1"]:
+        await _crane.get_digest(image, skip_tls_verify=False)
+    await _crane.get_image_tags("first/written", skip_tls_verify=False)
+
+    await _crane.invalidate("first/written:1")
+
+    for image in ["first/written:1", "first/untouched:1"]:
+        await _crane.get_digest(image, skip_tls_verify=False)
+    await _crane.get_image_tags("first/written", skip_tls_verify=False)
+
+    # written digest and tags are fetched again, untouched digest is a hit
+    assert mock_execute_command.await_count == 5
+    assert _crane.get_cache_stats().since(initial_stats) == CacheStats(
+        hits=1, misses=5, evictions=2
+    )
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_command(mock_execute_command: AsyncMock):
+    initial_stats = CacheStats(**vars(_crane.get_cache_stats()))
+
+    async def _slow_digest(command: list[str]) -> str:
+        await asyncio.sleep(0.01)
+        return "sha256:digest"
+
+    mock_execute_command.side_effect = _slow_digest
+
+    digests = await asyncio.gather(
+        *(_crane.get_digest("first/repo:1", skip_tls_verify=False) for _ in range(5)),
+        _crane.get_digest("first/other:1", skip_tls_verify=False),
+    )
+
+    assert digests == ["sha256:digest"] * 6
+    assert mock_execute_command.await_count == 2
+    assert _crane.get_cache_stats().since(initial_stats).coalesced == 4
@@ -0,0 +1,86 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=unused-argument
+
+from pathlib import Path
+
+import pytest
+from conftest import FakeBackend, make_configuration, make_stage
+from reposync._digest_cache import DigestCache, PersistentDigestBackend
+from reposync._sync import (
+    _RunStats,
+    _get_execution_plan,
+    _get_sync_tasks,
+    _run_sync_tasks,
+)
+
+
+def test_digest_cache_persists_between_instances(tmp_path: Path):
+    digest_cache = DigestCache(tmp_path, ttl=60)
+    digest_cache.set("first/repo:1", "sha256:1")
+    digest_cache.close()
+
+    assert DigestCache(tmp_path, ttl=60).get("first/repo:1") == "sha256:1"
+
+
+def test_digest_cache_entries_expire(tmp_path: Path):
+    digest_cache = DigestCache(tmp_path, ttl=60)
+    digest_cache.set("first/repo:1", "sha256:1")
+
+    digest_cache.ttl = -1
+
+    assert digest_cache.get("first/repo:1") is None
+
+
+def test_digest_cache_invalidate_registry(tmp_path: Path):
+    digest_cache = DigestCache(tmp_path, ttl=60)
+    digest_cache.set("first/repo:1", "sha256:1")
+    digest_cache.set("first/other/repo:1", "sha256:1")
+    digest_cache.set("second/repo:1", "sha256:1")
+
+    assert digest_cache.invalidate_registry("first") == 2
+
+    assert digest_cache.get("first/repo:1") is None
+    assert digest_cache.get("second/repo:1") == "sha256:1"
+
+
+async def _run(backend: FakeBackend, tmp_path: Path) -> None:
+    configuration = make_configuration(
+        [make_stage("a", "repo", [f"{i}" for i in range(5)])]
+    )
+    persistent_backend = PersistentDigestBackend(
+        backend, DigestCache(tmp_path / "state", ttl=60)
+    )
+    sync_tasks = await _get_sync_tasks(
+        configuration,
+        persistent_backend,
+        use_explicit_tags=True,
+        parallel_discovery_tasks=10,
+    )
+    try:
+        await _run_sync_tasks(
+            configuration,
+            persistent_backend,
+            _get_execution_plan(configuration, sync_tasks),
+            _RunStats(),
+            parallel_sync_tasks=10,
+            tracebacks_file=tmp_path / "tb.txt",
+        )
+    finally:
+        await persistent_backend.close()
+
+
+@pytest.mark.asyncio
+async def test_unchanged_rerun_makes_no_digest_calls(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    for i in range(5):
+        fake_backend.digests[f"first/repo:{i}"] = f"sha256:{i}"
+
+    await _run(fake_backend, tmp_path)
+    assert fake_backend.count("copy") == 5
+
+    fake_backend.calls.clear()
+    await _run(fake_backend, tmp_path)
+
+    assert fake_backend.count("get_digest") == 0
+    assert fake_backend.count("copy") == 0
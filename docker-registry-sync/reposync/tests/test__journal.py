@@ -0,0 +1,202 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=unused-argument
+
+from pathlib import Path
+
+import pytest
+from conftest import FakeBackend, make_configuration, make_stage
+from reposync._journal import Journal
+from reposync._sync import (
+    _RunStats,
+    _compare_images,
+    _get_execution_plan,
+    _get_journal_key,
+    _get_sync_tasks,
+    _prune_execution_plan,
+    _resolve_digests,
+    _run_sync_tasks,
+)
+
+
+def test_journal_is_read_when_resuming(tmp_path: Path):
+    journal = Journal(tmp_path, resume=False)
+    journal.record("a", "sha256:a")
+    journal.record("b", "sha256:b")
+    journal.close()
+    with journal.path.open("a") as file:
+        # interrupted while writing
+        file.write('{"task_id": "c", "src_')
+
+    journal = Journal(tmp_path, resume=True)
+    journal.record("d", "sha256:d")
+    journal.close()
+
+    assert journal.entries == {"a": "sha256:a", "b": "sha256:b", "d": "sha256:d"}
+    assert Journal(tmp_path, resume=True).entries == {
+        "a": "sha256:a",
+        "b": "sha256:b",
+        "d": "sha256:d",
+    }
+    assert Journal(tmp_path, resume=False).entries == {}
+    assert journal.path.read_text() == ""
+
+
+@pytest.mark.asyncio
+async def test_resume_skips_tasks_with_unchanged_source(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    configuration = make_configuration([make_stage("a", "repo", ["1", "2", "3"])])
+    for tag in ["1", "2", "3"]:
+        fake_backend.digests[f"first/repo:{tag}"] = f"sha256:{tag}"
+    sync_tasks = await _get_sync_tasks(
+        configuration, fake_backend, use_explicit_tags=True, parallel_discovery_tasks=10
+    )
+    task_ids = sorted(t.task_id for t in sync_tasks)
+    sync_task_mapping = {t.task_id: t for t in sync_tasks}
+
+    # the first run copies one image before it is interrupted
+    journal = Journal(tmp_path, resume=False)
+    first_plan = _get_execution_plan(configuration, sync_tasks)
+    first_plan.task_mapping = {task_ids[0]: first_plan.task_mapping[task_ids[0]]}
+    first_plan.predecessors = {task_ids[0]: []}
+    await _run_sync_tasks(
+        configuration,
+        fake_backend,
+        first_plan,
+        _RunStats(),
+        parallel_sync_tasks=10,
+        tracebacks_file=tmp_path / "tb.txt",
+        journal=journal,
+    )
+    journal.close()
+    # the source of the second one changes before resuming
+    fake_backend.digests["first/repo:2"] = "sha256:new"
+    Journal(tmp_path, resume=True).record(
+        _get_journal_key(sync_task_mapping[task_ids[1]]), "sha256:2"
+    )
+
+    journal = Journal(tmp_path, resume=True)
+    fake_backend.calls.clear()
+    known_digests = await _resolve_digests(
+        configuration,
+        fake_backend,
+        sync_tasks,
+        parallel_discovery_tasks=10,
+        journaled=journal.entries.keys(),
+    )
+    execution_plan, pruned, resumed = _prune_execution_plan(
+        configuration,
+        _get_execution_plan(configuration, sync_tasks),
+        known_digests,
+        journal.entries,
+    )
+
+    assert resumed == [task_ids[0]]
+    assert pruned == []
+    assert sorted(execution_plan.task_mapping) == task_ids[1:]
+    # destinations of journaled tasks are not looked up
+    assert "second/repo:1" not in known_digests
+    assert "second/repo:3" in known_digests
+
+
+@pytest.mark.asyncio
+async def test_resume_matches_stages_without_id(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    stage = make_stage("a", "repo", ["1", "2"])
+    del stage["id"]
+    fake_backend.digests["first/repo:1"] = "sha256:1"
+    fake_backend.digests["first/repo:2"] = "sha256:2"
+
+    async def _run(journal: Journal) -> tuple[list[str], list[str]]:
+        # NOTE: every run generates a new id for the stage
+        configuration = make_configuration([stage])
+        sync_tasks = await _get_sync_tasks(
+            configuration,
+            fake_backend,
+            use_explicit_tags=True,
+            parallel_discovery_tasks=10,
+        )
+        known_digests = await _resolve_digests(
+            configuration,
+            fake_backend,
+            sync_tasks,
+            parallel_discovery_tasks=10,
+            journaled=journal.entries.keys(),
+        )
+        execution_plan, _, resumed = _prune_execution_plan(
+            configuration,
+            _get_execution_plan(configuration, sync_tasks),
+            known_digests,
+            journal.entries,
+        )
+        await _run_sync_tasks(
+            configuration,
+            fake_backend,
+            execution_plan,
+            _RunStats(),
+            parallel_sync_tasks=10,
+            tracebacks_file=tmp_path / "tb.txt",
+            journal=journal,
+        )
+        journal.close()
+        return sorted(execution_plan.task_mapping), sorted(resumed)
+
+    copied, resumed = await _run(Journal(tmp_path, resume=False))
+    assert len(copied) == 2
+    assert resumed == []
+
+    copied, resumed = await _run(Journal(tmp_path, resume=True))
+    assert copied == []
+    assert len(resumed) == 2
+
+
+@pytest.mark.asyncio
+async def test_resume_skips_copies_to_missing_destinations(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    configuration = make_configuration([make_stage("a", "repo", ["1"])])
+    fake_backend.tags = {"second/repo": []}
+    fake_backend.digests["first/repo:1"] = "sha256:1"
+    sync_tasks = await _get_sync_tasks(
+        configuration, fake_backend, use_explicit_tags=True, parallel_discovery_tasks=10
+    )
+
+    # the destination tag is missing, its digests are not compared
+    journal = Journal(tmp_path, resume=False)
+    known_digests, _ = await _compare_images(
+        configuration, fake_backend, sync_tasks, parallel_discovery_tasks=10
+    )
+    assert known_digests == {"second/repo:1": None}
+    await _run_sync_tasks(
+        configuration,
+        fake_backend,
+        _get_execution_plan(configuration, sync_tasks),
+        _RunStats(),
+        parallel_sync_tasks=10,
+        tracebacks_file=tmp_path / "tb.txt",
+        known_digests=known_digests,
+        journal=journal,
+    )
+    journal.close()
+    assert journal.entries == {_get_journal_key(sync_tasks[0]): "sha256:1"}
+
+    fake_backend.tags = {"second/repo": ["1"]}
+    journal = Journal(tmp_path, resume=True)
+    known_digests, trusted = await _compare_images(
+        configuration,
+        fake_backend,
+        sync_tasks,
+        parallel_discovery_tasks=10,
+        journaled=journal.entries.keys(),
+    )
+    _, pruned, resumed = _prune_execution_plan(
+        configuration,
+        _get_execution_plan(configuration, sync_tasks),
+        known_digests,
+        journal.entries,
+        trusted,
+    )
+
+    assert pruned == []
+    assert resumed == [sync_tasks[0].task_id]
@@ -0,0 +1,102 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=unused-argument
+
+from pathlib import Path
+
+import aiohttp
+import pytest
+from conftest import FakeBackend, make_configuration, make_stage
+from reposync._metrics import METRICS_PATH, MeteredBackend, Metrics, export_metrics
+from reposync._rate_limit import RegistryLimiter
+from reposync._sync import (
+    _get_execution_plan,
+    _get_sync_tasks,
+    _run_sync_tasks,
+    _RunStats,
+)
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = Metrics()
+    for seconds in [0.003, 0.2, 0.2, 1000]:
+        metrics.copy_duration.observe(seconds, source="a", destination="b")
+
+    lines = metrics.copy_duration.render()
+
+    labels = 'destination="b",source="a"'
+    assert f'reposync_copy_duration_seconds_bucket{{{labels},le="0.005"}} 1' in lines
+    assert f'reposync_copy_duration_seconds_bucket{{{labels},le="0.25"}} 3' in lines
+    assert f'reposync_copy_duration_seconds_bucket{{{labels},le="300"}} 3' in lines
+    assert f'reposync_copy_duration_seconds_bucket{{{labels},le="+Inf"}} 4' in lines
+    assert f"reposync_copy_duration_seconds_count{{{labels}}} 4" in lines
+
+
+@pytest.mark.asyncio
+async def test_metered_backend_observes_registry_operations(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    configuration = make_configuration([make_stage("a", "repo", ["1", "2"])])
+    metrics = Metrics()
+    backend = MeteredBackend(fake_backend, metrics)
+    metrics.backend = backend
+
+    sync_tasks = await _get_sync_tasks(
+        configuration, backend, use_explicit_tags=True, parallel_discovery_tasks=2
+    )
+    await _run_sync_tasks(
+        configuration,
+        backend,
+        _get_execution_plan(configuration, sync_tasks),
+        _RunStats(),
+        parallel_sync_tasks=2,
+        tracebacks_file=tmp_path / "tb.txt",
+    )
+
+    rendered = metrics.render()
+    assert (
+        'reposync_registry_request_duration_seconds_count{operation="get_digest",'
+        'registry="first"} 2'
+    ) in rendered
+    assert (
+        'reposync_copy_duration_seconds_count{destination="second",source="first"} 2'
+        in rendered
+    )
+    assert "reposync_copies_in_flight 0" in rendered
+    assert "reposync_cache_hit_ratio 0" in rendered
+    # pushed bytes are only counted by the native backend
+    assert "reposync_uploaded_bytes_total" not in rendered
+
+
+@pytest.mark.asyncio
+async def test_limiter_reports_slot_waits():
+    metrics = Metrics()
+    limiter = RegistryLimiter(max_concurrent=1, requests_per_second=None)
+    metrics.observe_limiters({"registry": limiter})
+
+    async with limiter.slot():
+        pass
+
+    assert 'reposync_registry_slot_wait_seconds_count{registry="registry"} 1' in (
+        metrics.render()
+    )
+
+
+@pytest.mark.asyncio
+async def test_export_metrics_serves_and_writes_file(
+    tmp_path: Path, unused_tcp_port: int
+):
+    metrics = Metrics()
+    metrics_file = tmp_path / "metrics" / "reposync.prom"
+
+    async with export_metrics(metrics, port=unused_tcp_port, metrics_file=metrics_file):
+        metrics.copies_in_flight = 3
+        async with aiohttp.ClientSession() as session:
+            async with session.get(
+                f"http://127.0.0.1:{unused_tcp_port}{METRICS_PATH}"
+            ) as response:
+                assert response.status == 200
+                assert "reposync_copies_in_flight 3" in await response.text()
+        metrics.copies_in_flight = 0
+
+    assert "reposync_copies_in_flight 0" in metrics_file.read_text()
+    assert list(metrics_file.parent.iterdir()) == [metrics_file]
@@ -0,0 +1,76 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=unused-argument
+
+import logging
+import time
+
+import pytest
+from conftest import FakeBackend, make_configuration, make_stage
+from reposync._sync import _get_execution_plan, _get_sync_tasks
+
+_TOTAL_TASKS = 100_000
+
+_logger = logging.getLogger(__name__)
+
+
+def _synthetic_stages(shape: str, *, stages_count: int) -> list[dict]:
+    tags = [f"{i}" for i in range(_TOTAL_TASKS // stages_count)]
+
+    def _depends_on(index: int) -> list[str]:
+        if index == 0:
+            return []
+        if shape == "chain":
+            return [f"stage-{index - 1}"]
+        # fan-in: every stage waits for all previous ones
+        return [f"stage-{i}" for i in range(index)]
+
+    return [
+        make_stage(f"stage-{i}", f"repo-{i}", tags, depends_on=_depends_on(i))
+        for i in range(stages_count)
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "shape,stages_count",
+    [
+        pytest.param("chain", 50, id="chain-of-50-stages"),
+        pytest.param("fan-in", 2, id="2-stages-of-50k-tasks"),
+        pytest.param("fan-in", 20, id="fan-in-of-20-stages"),
+    ],
+)
+async def test_planner_benchmark_100k_tasks(
+    environment: None, fake_backend: FakeBackend, shape: str, stages_count: int
+):
+    configuration = make_configuration(
+        _synthetic_stages(shape, stages_count=stages_count)
+    )
+    sync_tasks = await _get_sync_tasks(
+        configuration,
+        fake_backend,
+        use_explicit_tags=True,
+        parallel_discovery_tasks=10,
+    )
+    assert len(sync_tasks) == _TOTAL_TASKS
+
+    start = time.perf_counter()
+    execution_plan = _get_execution_plan(configuration, sync_tasks)
+    elapsed = time.perf_counter() - start
+
+    nodes = len(execution_plan.predecessors)
+    edges = sum(len(p) for p in execution_plan.predecessors.values())
+    _logger.warning(
+        "planned %s tasks (%s): %s nodes, %s edges in %.3fs",
+        _TOTAL_TASKS,
+        shape,
+        nodes,
+        edges,
+        elapsed,
+    )
+
+    # one join node per stage which is depended on
+    assert nodes <= _TOTAL_TASKS + stages_count
+    # every task is attached to its own join node and to the join nodes
+    # of the stages it depends on, never to every task of those stages
+    max_depends_on = max(len(s.depends_on) for s in configuration.stages)
+    assert edges <= _TOTAL_TASKS * (1 + max_depends_on)
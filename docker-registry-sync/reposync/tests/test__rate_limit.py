@@ -0,0 +1,195 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=unused-argument
+
+import asyncio
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+from conftest import FakeBackend
+from reposync import _crane
+from reposync._backend import RateLimitedBackend
+from reposync._cache import get_digests_concurrently
+from reposync._rate_limit import (
+    RegistryLimiter,
+    RegistryRateLimitedError,
+    parse_retry_after,
+    run_limited,
+)
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [
+        pytest.param(None, None),
+        pytest.param("", None),
+        pytest.param("3", 3),
+        pytest.param("-3", 0),
+        pytest.param("not a date", None),
+    ],
+)
+def test_parse_retry_after(value: str | None, expected: float | None):
+    assert parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_date():
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+
+    retry_after = parse_retry_after(format_datetime(retry_at, usegmt=True))
+
+    assert retry_after is not None
+    assert 25 < retry_after <= 30
+
+
+@pytest.mark.asyncio
+async def test_registry_limiter_bounds_concurrency():
+    limiter = RegistryLimiter(max_concurrent=2, requests_per_second=None)
+    running: list[int] = [0]
+    peak: list[int] = [0]
+
+    async def _operation() -> None:
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+
+    await asyncio.gather(*(run_limited([limiter], _operation) for _ in range(10)))
+
+    assert peak[0] == 2
+
+
+@pytest.mark.asyncio
+async def test_run_limited_backs_off_when_throttled():
+    limiter = RegistryLimiter(max_concurrent=4, requests_per_second=None)
+    attempts: list[float] = []
+
+    async def _operation() -> str:
+        attempts.append(asyncio.get_running_loop().time())
+        if len(attempts) == 1:
+            error = RegistryRateLimitedError("429 Too Many Requests")
+            error.retry_after = 0.2
+            raise error
+        return "done"
+
+    assert await run_limited([limiter], _operation) == "done"
+
+    assert attempts[1] - attempts[0] >= 0.2
+    assert limiter.throttled == 1
+    # halved on throttling, raised again by the successful attempt
+    assert limiter.limit == 3
+
+
+@dataclass
+class _ThrottlingBackend(FakeBackend):
+    """throttles a copy to each of the ``throttled`` destinations once"""
+
+    throttled: set[str] = field(default_factory=set)
+
+    async def copy_to_many(
+        self,
+        source: str,
+        destinations: dict[str, bool],
+        *,
+        src_skip_tls_verify: bool,
+    ) -> dict[str, BaseException]:
+        failures = await super().copy_to_many(
+            source, destinations, src_skip_tls_verify=src_skip_tls_verify
+        )
+        for destination in self.throttled & destinations.keys():
+            self.throttled.remove(destination)
+            error = RegistryRateLimitedError(f"throttled {destination}")
+            error.retry_after = 0
+            failures[destination] = error
+        return failures
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_backend_copies_throttled_destinations_again():
+    backend = _ThrottlingBackend(throttled={"second/b:1"}, failing={"second/c:1"})
+    limiters = {
+        "first": RegistryLimiter(max_concurrent=None, requests_per_second=None),
+        "second": RegistryLimiter(max_concurrent=None, requests_per_second=None),
+    }
+
+    failures = await RateLimitedBackend(backend, limiters).copy_to_many(
+        "first/a:1",
+        {"second/a:1": False, "second/b:1": False, "second/c:1": False},
+        src_skip_tls_verify=False,
+    )
+
+    assert list(failures) == ["second/c:1"]
+    assert [i for n, i in backend.calls if n == "copy_to_many"] == [
+        "first/a:1 -> ['second/a:1', 'second/b:1', 'second/c:1']",
+        "first/a:1 -> ['second/b:1']",
+    ]
+    assert limiters["second"].throttled == 1
+
+
+@dataclass
+class _SlowDigestBackend(FakeBackend):
+    """``get_digest`` takes a while, throttled once for each of ``throttled``"""
+
+    throttled: set[str] = field(default_factory=set)
+    running: int = 0
+    peak: int = 0
+
+    async def get_digest(self, image: str, *, skip_tls_verify: bool) -> str | None:
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(0.01)
+            if image in self.throttled:
+                self.throttled.remove(image)
+                error = RegistryRateLimitedError(f"throttled {image}")
+                error.retry_after = 0
+                raise error
+            return await super().get_digest(image, skip_tls_verify=skip_tls_verify)
+        finally:
+            self.running -= 1
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_backend_limits_each_digest_of_bulk_lookups():
+    backend = _SlowDigestBackend(
+        digests={f"first/repo:{i}": f"sha256:{i}" for i in range(5)},
+        throttled={"first/repo:2"},
+    )
+    limiter = RegistryLimiter(max_concurrent=2, requests_per_second=None)
+
+    digests = await RateLimitedBackend(backend, {"first": limiter}).get_digests(
+        "first/repo", [f"{i}" for i in range(5)], skip_tls_verify=False
+    )
+
+    assert digests == {f"first/repo:{i}": f"sha256:{i}" for i in range(5)}
+    assert backend.peak == 2
+    # the throttled lookup was repeated after backing off
+    assert limiter.throttled == 1
+    assert backend.count("get_digest") == 5
+
+
+@pytest.mark.asyncio
+async def test_get_digests_concurrently_raises_throttling():
+    backend = _SlowDigestBackend(throttled={"first/repo:1"})
+
+    with pytest.raises(RegistryRateLimitedError, match="throttled first/repo:1"):
+        await get_digests_concurrently(
+            backend.get_digest,
+            "first/repo",
+            ["1", "2"],
+            skip_tls_verify=False,
+            limit=2,
+        )
+
+
+@pytest.mark.asyncio
+async def test_crane_reports_throttling():
+    with pytest.raises(_crane.CraneCommandRateLimitedError):
+        await _crane._execute_command(  # noqa: SLF001
+            [
+                "sh",
+                "-c",
+                "echo 'GET https://index.docker.io/v2/: unexpected status code"
+                " 429 Too Many Requests'; exit 1",
+            ]
+        )
@@ -0,0 +1,316 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=unused-argument
+
+from pathlib import Path
+
+import pytest
+from conftest import FakeRegistry
+from reposync import _registry
+from reposync._backend import Backend
+from reposync._blob_store import BlobStore
+from reposync._models import Configuration
+from reposync._registry import _ImageReference, _parse_image
+from reposync._sync import run_sync_tasks
+from yarl import URL
+
+
+@pytest.mark.parametrize(
+    "image,expected",
+    [
+        pytest.param(
+            "master:5000/some/repo:1.0.0",
+            _ImageReference("master:5000", "some/repo", "1.0.0"),
+        ),
+        pytest.param(
+            "master:5000/some/repo",
+            _ImageReference("master:5000", "some/repo", "latest"),
+        ),
+        pytest.param(
+            "master:5000/some/repo@sha256:abc",
+            _ImageReference("master:5000", "some/repo", "sha256:abc"),
+        ),
+        pytest.param(
+            "index.docker.io/ubuntu:22.04",
+            _ImageReference("registry-1.docker.io", "library/ubuntu", "22.04"),
+        ),
+        pytest.param(
+            "index.docker.io/itisfoundation/sleeper:1.0.0",
+            _ImageReference("registry-1.docker.io", "itisfoundation/sleeper", "1.0.0"),
+        ),
+    ],
+)
+def test__parse_image(image: str, expected: _ImageReference):
+    assert _parse_image(image) == expected
+
+
+@pytest.mark.asyncio
+async def test_get_digest(fake_registry: FakeRegistry):
+    digest = fake_registry.add_image("some/repo", "1.0.0", [b"layer"])
+
+    assert (
+        await _registry.get_digest(
+            f"{fake_registry.url}/some/repo:1.0.0", skip_tls_verify=False
+        )
+        == digest
+    )
+    assert (
+        await _registry.get_digest(
+            f"{fake_registry.url}/some/repo:missing", skip_tls_verify=False
+        )
+        is None
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_image_size_counts_shared_blobs_once(fake_registry: FakeRegistry):
+    fake_registry.add_image("some/repo", "1.0.0", [b"base", b"app"], platforms=2)
+
+    # both platforms share "base" and "app"
+    assert await _registry.get_image_size(
+        f"{fake_registry.url}/some/repo:1.0.0", skip_tls_verify=False
+    ) == sum(len(blob) for blob in fake_registry.blobs.values())
+    assert (
+        await _registry.get_image_size(
+            f"{fake_registry.url}/some/repo:missing", skip_tls_verify=False
+        )
+        is None
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_digests_fills_digest_cache(fake_registry: FakeRegistry):
+    digests = {
+        f"{fake_registry.url}/some/repo:{i}": fake_registry.add_image(
+            "some/repo", f"{i}", [f"{i}".encode()]
+        )
+        for i in range(5)
+    }
+
+    assert await _registry.get_digests(
+        f"{fake_registry.url}/some/repo",
+        [*(f"{i}" for i in range(5)), "missing"],
+        skip_tls_verify=False,
+    ) == {**digests, f"{fake_registry.url}/some/repo:missing": None}
+    for image, digest in digests.items():
+        assert await _registry.get_digest(image, skip_tls_verify=False) == digest
+
+    assert fake_registry.count("HEAD", "/manifests/") == 6
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "tag_count,pages,heads",
+    [
+        pytest.param(1, 0, 1, id="fewer-tags-than-pages"),
+        # the last tag is cheaper to look up than the last page
+        pytest.param(5, 2, 1, id="more-tags-than-pages"),
+    ],
+)
+async def test_get_digests_lists_docker_hub_tags_when_cheaper(
+    fake_registry: FakeRegistry,
+    monkeypatch: pytest.MonkeyPatch,
+    tag_count: int,
+    pages: int,
+    heads: int,
+):
+    monkeypatch.setattr(_registry, "_DOCKER_HUB_API_HOST", fake_registry.url)
+    monkeypatch.setattr(
+        _registry,
+        "_DOCKER_HUB_REPOSITORIES_URL",
+        URL(f"http://{fake_registry.url}/hub/repositories"),
+    )
+    monkeypatch.setattr(
+        _registry, "_DOCKER_HUB_PAGE_SIZE", fake_registry.tags_page_size
+    )
+    digests = {
+        f"{fake_registry.url}/some/repo:{i}": fake_registry.add_image(
+            "some/repo", f"{i}", [f"{i}".encode()]
+        )
+        for i in range(5)
+    }
+
+    assert await _registry.get_digests(
+        f"{fake_registry.url}/some/repo",
+        [f"{i}" for i in range(tag_count)],
+        skip_tls_verify=False,
+    ) == dict(list(digests.items())[:tag_count])
+    assert fake_registry.count("GET", "/hub/") == pages
+    assert fake_registry.count("HEAD", "/manifests/") == heads
+
+
+@pytest.mark.asyncio
+async def test_get_image_tags_follows_pagination(fake_registry: FakeRegistry):
+    expected_tags = [f"1.0.{i}" for i in range(5)]
+    for tag in expected_tags:
+        fake_registry.add_image("some/repo", tag, [tag.encode()])
+    fake_registry.add_image("some/repo", "sha256-abc.sig", [b"signature"])
+
+    tags = await _registry.get_image_tags(
+        f"{fake_registry.url}/some/repo", skip_tls_verify=False
+    )
+
+    assert tags == expected_tags
+    # page size of the fake registry is 2
+    assert fake_registry.count("GET", "/tags/list") == 3
+
+
+@pytest.mark.asyncio
+async def test_connections_are_reused(fake_registry: FakeRegistry):
+    for i in range(10):
+        fake_registry.add_image("some/repo", f"{i}", [f"{i}".encode()])
+
+    for i in range(10):
+        await _registry.get_digest(
+            f"{fake_registry.url}/some/repo:{i}", skip_tls_verify=False
+        )
+
+    assert fake_registry.count("HEAD", "/manifests/") == 10
+    assert len(fake_registry.peers) == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("platforms", [0, 3])
+async def test_copy_between_registries(
+    fake_registry: FakeRegistry, other_fake_registry: FakeRegistry, platforms: int
+):
+    digest = fake_registry.add_image(
+        "some/repo", "1.0.0", [b"base", b"app"], platforms=platforms
+    )
+
+    await _registry.copy(
+        f"{fake_registry.url}/some/repo:1.0.0",
+        f"{other_fake_registry.url}/other/repo:1.0.0",
+        src_skip_tls_verify=False,
+        dst_skip_tls_verify=False,
+    )
+
+    assert (
+        await _registry.get_digest(
+            f"{other_fake_registry.url}/other/repo:1.0.0", skip_tls_verify=False
+        )
+        == digest
+    )
+    assert set(other_fake_registry.blobs) == set(fake_registry.blobs)
+
+
+@pytest.mark.asyncio
+async def test_copy_within_registry_mounts_blobs(fake_registry: FakeRegistry):
+    digest = fake_registry.add_image("some/repo", "1.0.0", [b"base", b"app"])
+
+    await _registry.copy(
+        f"{fake_registry.url}/some/repo:1.0.0",
+        f"{fake_registry.url}/other/repo:1.0.0",
+        src_skip_tls_verify=False,
+        dst_skip_tls_verify=False,
+    )
+
+    assert fake_registry.manifests[("other/repo", "1.0.0")] == (
+        fake_registry.manifests[("some/repo", digest)]
+    )
+    assert fake_registry.count("GET", "/blobs/") == 0
+
+
+@pytest.mark.asyncio
+async def test_run_sync_tasks_with_native_backend(
+    fake_registry: FakeRegistry,
+    other_fake_registry: FakeRegistry,
+    environment: None,
+    tmp_path: Path,
+):
+    for tag in ["1.0.0", "1.0.1", "2.0.0"]:
+        fake_registry.add_image("some/repo", tag, [tag.encode()])
+
+    configuration = Configuration.model_validate(
+        {
+            "registries": {
+                "first": {
+                    "url": fake_registry.url,
+                    "env_user": "ENV_VAR_FIRST_USER",
+                    "env_password": "ENV_VAR_FIRST_PASSWORD",
+                },
+                "second": {
+                    "url": other_fake_registry.url,
+                    "env_user": "ENV_VAR_SECOND_USER",
+                    "env_password": "ENV_VAR_SECOND_PASSWORD",
+                },
+            },
+            "stages": [
+                {
+                    "from": {"source": "first", "repository": "some/repo"},
+                    "to": [
+                        {"destination": "second", "repository": "all/repo", "tags": []}
+                    ],
+                },
+            ],
+        }
+    )
+
+    await run_sync_tasks(
+        configuration,
+        backend=Backend.NATIVE,
+        use_explicit_tags=False,
+        parallel_sync_tasks=2,
+        parallel_discovery_tasks=2,
+        tracebacks_file=tmp_path / "tracebacks.txt",
+    )
+
+    assert other_fake_registry.tags("all/repo") == ["1.0.0", "1.0.1", "2.0.0"]
+    assert (tmp_path / "tracebacks.txt").read_text() == ""
+
+
+@pytest.mark.asyncio
+async def test_copy_to_many_pulls_each_blob_once(
+    fake_registry: FakeRegistry, other_fake_registry: FakeRegistry
+):
+    digest = fake_registry.add_image(
+        "some/repo", "1.0.0", [b"base", b"app"], platforms=2
+    )
+    destinations = {
+        f"{other_fake_registry.url}/{repository}:1.0.0": False
+        for repository in ["a/repo", "b/repo", "c/repo"]
+    }
+
+    failures = await _registry.copy_to_many(
+        f"{fake_registry.url}/some/repo:1.0.0",
+        destinations,
+        src_skip_tls_verify=False,
+    )
+
+    assert failures == {}
+    for destination in destinations:
+        assert await _registry.get_digest(destination, skip_tls_verify=False) == digest
+    assert fake_registry.count("GET", "/blobs/") == len(fake_registry.blobs)
+
+
+@pytest.mark.asyncio
+async def test_copy_reads_blobs_from_blob_store(
+    fake_registry: FakeRegistry, other_fake_registry: FakeRegistry, tmp_path: Path
+):
+    fake_registry.add_image("some/repo", "1.0.0", [b"base", b"app"])
+    fake_registry.add_image("some/repo", "2.0.0", [b"base", b"other-app"])
+    blob_store = BlobStore(tmp_path, max_bytes=1024)
+    _registry.use_blob_store(blob_store)
+
+    for tag in ["1.0.0", "2.0.0"]:
+        await _registry.copy(
+            f"{fake_registry.url}/some/repo:{tag}",
+            f"{other_fake_registry.url}/some/repo:{tag}",
+            src_skip_tls_verify=False,
+            dst_skip_tls_verify=False,
+        )
+    # the destination lost its blobs, they are pushed again from the store
+    other_fake_registry.blobs.clear()
+    await _registry.copy(
+        f"{fake_registry.url}/some/repo:2.0.0",
+        f"{other_fake_registry.url}/some/repo:2.0.0",
+        src_skip_tls_verify=False,
+        dst_skip_tls_verify=False,
+    )
+
+    assert fake_registry.count("GET", "/blobs/") == len(fake_registry.blobs)
+    assert len(other_fake_registry.blobs) == 3  # config, base and other-app
+    assert _registry.get_blob_stats() == blob_store.stats
+    assert blob_store.stats.from_network == sum(
+        len(blob) for blob in fake_registry.blobs.values()
+    )
+    assert blob_store.stats.from_cache > 0
@@ -0,0 +1,43 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=unused-argument
+
+import aiohttp
+import pytest
+from reposync._crane import CraneCommandError, CraneCommandTimeoutError
+from reposync._registry import RegistryRequestError
+from reposync._retry import RetryPolicy, is_retryable
+
+
+@pytest.mark.parametrize(
+    "exc,expected",
+    [
+        pytest.param(CraneCommandTimeoutError(["crane"], 30), True),
+        pytest.param(
+            CraneCommandError(["crane"], "unexpected status code 502 Bad Gateway"),
+            True,
+        ),
+        pytest.param(
+            CraneCommandError(["crane"], "read: connection reset by peer"), True
+        ),
+        pytest.param(
+            CraneCommandError(["crane"], "unexpected status code 404 Not Found"),
+            False,
+        ),
+        pytest.param(CraneCommandError(["crane"], "UNAUTHORIZED"), False),
+        pytest.param(RegistryRequestError("GET", "url", 503, ""), True),
+        pytest.param(RegistryRequestError("GET", "url", 401, ""), False),
+        pytest.param(RegistryRequestError("GET", "url", 404, ""), False),
+        pytest.param(aiohttp.ServerDisconnectedError(), True),
+        pytest.param(TimeoutError(), True),
+        pytest.param(ValueError("bad input"), False),
+    ],
+)
+def test_is_retryable(exc: BaseException, expected: bool):
+    assert is_retryable(exc) is expected
+
+
+def test_retry_policy_delay_is_capped():
+    retry_policy = RetryPolicy(retries=10, initial_delay=1, max_delay=5)
+
+    assert all(0 <= retry_policy.get_delay(0) <= 1 for _ in range(100))
+    assert all(0 <= retry_policy.get_delay(8) <= 5 for _ in range(100))
@@ -1,13 +1,35 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=unused-argument
+
+import json
+from dataclasses import dataclass, field
+from datetime import timedelta
 from pathlib import Path
 
+from conftest import FakeBackend, make_configuration, make_stage
 from reposync._sync import (
     CopyResult,
+    Shard,
     _RunStats,
+    _SyncTask,
+    _compare_images,
+    _get_execution_plan,
+    _get_priorities,
     _get_registry_image,
+    _get_sync_tasks,
+    plan_sync_tasks,
+    _prune_execution_plan,
+    _resolve_digests,
+    _run_sync_tasks,
+    _shard_execution_plan,
     _write_tracebacks_file,
 )
-from reposync._models import RegistryImage, DockerImage, DockerTag
+from reposync._crane import CraneCommandTimeoutError
+from reposync._backend import Backend
+from reposync._retry import RetryPolicy
+from reposync._models import Configuration, RegistryImage, DockerImage, DockerTag
 import pytest
+from reposync import _sync
 
 
 @pytest.mark.parametrize(
@@ -105,3 +127,874 @@ def test__run_stats_progress_line():
     assert "failed=1" in line
     assert "3/10" in line
     assert line.startswith("⏳")
+
+
+async def _run(
+    configuration: Configuration,
+    backend: FakeBackend,
+    tmp_path: Path,
+    *,
+    parallel_sync_tasks: int = 10,
+    stats: _RunStats | None = None,
+    continue_on_failure: bool = False,
+    image_sizes: dict[RegistryImage, int | None] | None = None,
+    max_in_flight_bytes: int | None = None,
+) -> None:
+    sync_tasks = await _get_sync_tasks(
+        configuration, backend, use_explicit_tags=True, parallel_discovery_tasks=10
+    )
+    await _run_sync_tasks(
+        configuration,
+        backend,
+        _get_execution_plan(configuration, sync_tasks),
+        _RunStats() if stats is None else stats,
+        parallel_sync_tasks=parallel_sync_tasks,
+        tracebacks_file=tmp_path / "tb.txt",
+        continue_on_failure=continue_on_failure,
+        image_sizes=image_sizes,
+        max_in_flight_bytes=max_in_flight_bytes,
+    )
+
+
+@pytest.mark.asyncio
+async def test__run_sync_tasks_respects_long_dependency_chains(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    # stages are listed in reverse order of execution on purpose
+    configuration = make_configuration(
+        [
+            make_stage("c", "repo-c", ["1"], depends_on=["b"]),
+            make_stage("b", "repo-b", ["1"], depends_on=["a"]),
+            make_stage("a", "repo-a", ["1"]),
+        ]
+    )
+
+    await _run(configuration, fake_backend, tmp_path)
+
+    assert [s for e, s in fake_backend.events if e == "start"] == [
+        "first/repo-a:1",
+        "first/repo-b:1",
+        "first/repo-c:1",
+    ]
+
+
+@pytest.mark.asyncio
+async def test__run_sync_tasks_does_not_wait_for_unrelated_tasks(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    configuration = make_configuration(
+        [
+            make_stage("slow", "repo-slow", ["1"]),
+            make_stage("after-slow", "repo-after-slow", ["1"], depends_on=["slow"]),
+            make_stage("fast", "repo-fast", ["1"]),
+            make_stage("after-fast", "repo-after-fast", ["1"], depends_on=["fast"]),
+        ]
+    )
+    fake_backend.copy_delays["first/repo-slow:1"] = 0.5
+
+    await _run(configuration, fake_backend, tmp_path)
+
+    assert fake_backend.events.index(
+        ("start", "first/repo-after-fast:1")
+    ) < fake_backend.events.index(("end", "first/repo-slow:1"))
+    assert fake_backend.events[-1] == ("end", "first/repo-after-slow:1")
+
+
+@pytest.mark.asyncio
+async def test__run_sync_tasks_caps_parallel_tasks(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    configuration = make_configuration(
+        [make_stage("a", "repo", [f"{i}" for i in range(10)])]
+    )
+    for i in range(10):
+        fake_backend.copy_delays[f"first/repo:{i}"] = 0.01
+
+    await _run(configuration, fake_backend, tmp_path, parallel_sync_tasks=3)
+
+    running = 0
+    max_running = 0
+    for event, _ in fake_backend.events:
+        running += 1 if event == "start" else -1
+        max_running = max(max_running, running)
+    assert max_running == 3
+
+
+def test__get_priorities_follows_the_most_expensive_path():
+    predecessors = {
+        "a": [],
+        "b": ["a"],
+        "#done": ["b"],
+        "c": ["#done"],
+        "large": [],
+    }
+
+    priorities = _get_priorities(predecessors, {"a": 1, "b": 1, "c": 1, "large": 2})
+
+    assert priorities == {"a": 3, "b": 2, "#done": 1, "c": 1, "large": 2}
+
+
+@pytest.mark.asyncio
+async def test__run_sync_tasks_starts_critical_path_and_large_images_first(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    configuration = make_configuration(
+        [
+            make_stage("small", "repo-small", ["1"]),
+            make_stage("chain-1", "repo-chain-1", ["1"]),
+            make_stage("chain-2", "repo-chain-2", ["1"], depends_on=["chain-1"]),
+            make_stage("large", "repo-large", ["1"]),
+        ]
+    )
+
+    await _run(
+        configuration,
+        fake_backend,
+        tmp_path,
+        parallel_sync_tasks=1,
+        image_sizes={"first/repo-large:1": 1024**3},
+    )
+
+    assert [s for e, s in fake_backend.events if e == "start"] == [
+        "first/repo-large:1",
+        "first/repo-chain-1:1",
+        # same priority, started in the order they became ready
+        "first/repo-small:1",
+        "first/repo-chain-2:1",
+    ]
+
+
+@pytest.mark.asyncio
+async def test__run_sync_tasks_limits_in_flight_bytes(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    configuration = make_configuration(
+        [make_stage(f"{i}", f"repo-{i}", ["1"]) for i in range(3)]
+    )
+    image_sizes = {"first/repo-0:1": 60, "first/repo-1:1": 60, "first/repo-2:1": 30}
+    for image in image_sizes:
+        fake_backend.copy_delays[image] = 0.01
+
+    await _run(
+        configuration,
+        fake_backend,
+        tmp_path,
+        image_sizes=image_sizes,
+        max_in_flight_bytes=100,
+    )
+
+    in_flight = 0
+    max_in_flight = 0
+    for event, image in fake_backend.events:
+        in_flight += image_sizes[image] if event == "start" else -image_sizes[image]
+        max_in_flight = max(max_in_flight, in_flight)
+    # the larger images never run together, the smallest one runs next to one
+    assert max_in_flight == 90
+
+
+@pytest.mark.asyncio
+async def test__run_sync_tasks_copies_image_declared_by_several_stages_once(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    configuration = make_configuration(
+        [
+            make_stage("a", "repo", ["1"]),
+            make_stage("b", "repo", ["1"]),
+            make_stage("after-b", "other-repo", ["1"], depends_on=["b"]),
+        ]
+    )
+
+    await _run(configuration, fake_backend, tmp_path)
+
+    assert fake_backend.events == [
+        ("start", "first/repo:1"),
+        ("end", "first/repo:1"),
+        ("start", "first/other-repo:1"),
+        ("end", "first/other-repo:1"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test__get_execution_plan_keeps_duplicates_of_dependent_stages(
+    environment: None, fake_backend: FakeBackend
+):
+    configuration = make_configuration(
+        [
+            make_stage("a", "repo", ["1"]),
+            make_stage("b", "repo", ["1"]),
+            make_stage("after-a", "repo", ["1"], depends_on=["a"]),
+        ]
+    )
+    sync_tasks = await _get_sync_tasks(
+        configuration, fake_backend, use_explicit_tags=True, parallel_discovery_tasks=1
+    )
+
+    execution_plan = _get_execution_plan(configuration, sync_tasks)
+
+    # "after-a" waits for "a", merging them would be a cycle
+    assert sorted(execution_plan.task_mapping) == [
+        "first/repo:1 --> second/repo:1 #a",
+        "first/repo:1 --> second/repo:1 #after-a",
+    ]
+    assert execution_plan.duplicates == {
+        "first/repo:1 --> second/repo:1 #after-a": ["first/repo:1 --> second/repo:1 #b"]
+    }
+    assert execution_plan.predecessors["#a done"] == [
+        "first/repo:1 --> second/repo:1 #a"
+    ]
+
+    # the tasks still copying keep their duplicates
+    pruned_plan, _, _ = _prune_execution_plan(
+        configuration,
+        execution_plan,
+        {"first/repo:1": "sha256:1", "second/repo:1": "sha256:old"},
+    )
+    assert pruned_plan.duplicates == execution_plan.duplicates
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [
+        pytest.param("1/1", Shard(1, 1), id="single"),
+        pytest.param("2/4", Shard(2, 4), id="second-of-four"),
+        pytest.param("0/4", None, id="counted-from-one"),
+        pytest.param("5/4", None, id="index-above-count"),
+        pytest.param("2", None, id="no-count"),
+        pytest.param("a/b", None, id="not-a-number"),
+    ],
+)
+def test_shard_parse(value: str, expected: Shard | None):
+    if expected is None:
+        with pytest.raises(ValueError, match="INDEX/COUNT"):
+            Shard.parse(value)
+    else:
+        assert Shard.parse(value) == expected
+
+
+@pytest.mark.asyncio
+async def test__shard_execution_plan_keeps_dependent_tasks_together(
+    environment: None, fake_backend: FakeBackend
+):
+    configuration = make_configuration(
+        [
+            make_stage("a", "repo", ["1", "2", "3"]),
+            make_stage(
+                "after-a", "repo", ["1"], dst_repository="copy", depends_on=["a"]
+            ),
+            make_stage("b", "other", ["1", "2", "3", "4"]),
+        ]
+    )
+    sync_tasks = await _get_sync_tasks(
+        configuration, fake_backend, use_explicit_tags=True, parallel_discovery_tasks=1
+    )
+    execution_plan = _get_execution_plan(configuration, sync_tasks)
+
+    shards = [_shard_execution_plan(execution_plan, Shard(i, 2)) for i in (1, 2)]
+
+    # every task runs on exactly one shard, 4 tasks each
+    assert sorted(t for s in shards for t in s.task_mapping) == sorted(
+        execution_plan.task_mapping
+    )
+    assert [len(s.task_mapping) for s in shards] == [4, 4]
+    # stage "after-a" waits for all of "a", they are one component
+    assert {t.stage_id for t in shards[0].task_mapping.values()} == {"a", "after-a"}
+    assert shards[0].predecessors["#a done"] == [
+        f"first/repo:{tag} --> second/repo:{tag} #a" for tag in ("1", "2", "3")
+    ]
+    assert shards[1].join_ids == set()
+
+
+@pytest.mark.asyncio
+async def test__shard_execution_plan_balances_by_costs(
+    environment: None, fake_backend: FakeBackend
+):
+    configuration = make_configuration([make_stage("a", "repo", ["1", "2", "3", "4"])])
+    sync_tasks = await _get_sync_tasks(
+        configuration, fake_backend, use_explicit_tags=True, parallel_discovery_tasks=1
+    )
+    execution_plan = _get_execution_plan(configuration, sync_tasks)
+    costs = {
+        f"first/repo:{tag} --> second/repo:{tag} #a": cost
+        for tag, cost in (("1", 10), ("2", 1), ("3", 1), ("4", 1))
+    }
+
+    shards = [_shard_execution_plan(execution_plan, Shard(i, 2), costs) for i in (1, 2)]
+
+    assert list(shards[0].task_mapping) == ["first/repo:1 --> second/repo:1 #a"]
+    assert len(shards[1].task_mapping) == 3
+
+
+@pytest.mark.asyncio
+async def test__sync_with_shard_writes_files_named_after_it(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    configuration = make_configuration(
+        [make_stage("a", "repo", ["1"]), make_stage("b", "other", ["1"])]
+    )
+
+    await _sync._sync(
+        configuration,
+        fake_backend,
+        use_explicit_tags=True,
+        parallel_sync_tasks=1,
+        parallel_discovery_tasks=1,
+        tracebacks_file=tmp_path / "tracebacks.txt",
+        journal=None,
+        retry_policy=None,
+        continue_on_failure=False,
+        shard=Shard(2, 2),
+    )
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "timings.shard-2-of-2.json",
+        "tracebacks.shard-2-of-2.txt",
+    ]
+    report = json.loads((tmp_path / "timings.shard-2-of-2.json").read_text())
+    assert report["shard"] == "2/2"
+    assert len(report["tasks"]) == 1
+
+
+@pytest.mark.asyncio
+async def test__run_sync_tasks_stops_scheduling_after_failure(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    configuration = make_configuration(
+        [
+            make_stage("a", "repo-a", ["1"]),
+            make_stage("b", "repo-b", ["1"], depends_on=["a"]),
+        ]
+    )
+    fake_backend.failing.add("first/repo-a:1")
+
+    with pytest.raises(SystemExit):
+        await _run(configuration, fake_backend, tmp_path)
+
+    assert fake_backend.count("copy") == 1
+    assert (
+        "=== first/repo-a:1 --> second/repo-a:1 #a ==="
+        in (tmp_path / "tb.txt").read_text()
+    )
+
+
+@pytest.mark.asyncio
+async def test__run_sync_tasks_continue_on_failure_skips_only_dependents(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    configuration = make_configuration(
+        [
+            make_stage("a", "repo-a", ["1"]),
+            make_stage("b", "repo-b", ["1"], depends_on=["a"]),
+            make_stage("c", "repo-c", ["1"], depends_on=["b"]),
+            make_stage("d", "repo-d", ["1"]),
+            make_stage("e", "repo-e", ["1"], depends_on=["d"]),
+        ]
+    )
+    fake_backend.failing.add("first/repo-a:1")
+    stats = _RunStats()
+
+    with pytest.raises(SystemExit):
+        await _run(
+            configuration,
+            fake_backend,
+            tmp_path,
+            stats=stats,
+            continue_on_failure=True,
+        )
+
+    assert sorted(stats.copied_task_ids) == [
+        "first/repo-d:1 --> second/repo-d:1 #d",
+        "first/repo-e:1 --> second/repo-e:1 #e",
+    ]
+    assert [t for t, _ in stats.failures] == ["first/repo-a:1 --> second/repo-a:1 #a"]
+    assert sorted(stats.skipped_task_ids) == [
+        "first/repo-b:1 --> second/repo-b:1 #b",
+        "first/repo-c:1 --> second/repo-c:1 #c",
+    ]
+    summary = stats.format(tracebacks_file=tmp_path / "tb.txt")
+    assert "failed=1, skipped=2" in summary
+    assert "⏭️ first/repo-c:1 --> second/repo-c:1 #c" in summary
+
+
+@pytest.mark.asyncio
+async def test__run_sync_tasks_reports_time_per_phase(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    configuration = make_configuration(
+        [
+            make_stage("a", "repo-a", ["1", "2"]),
+            make_stage("b", "repo-b", ["1"], destination="first"),
+        ]
+    )
+    fake_backend.copy_delays["first/repo-a:2"] = 0.2
+    stats = _RunStats()
+
+    await _run(
+        configuration, fake_backend, tmp_path, parallel_sync_tasks=1, stats=stats
+    )
+
+    report = json.loads((tmp_path / "timings.json").read_text())
+    slowest = report["slowest_tasks"][0]
+    assert slowest["task_id"] == "first/repo-a:2 --> second/repo-a:2 #a"
+    assert slowest["copy"] >= 0.2
+    # a single slot, the other tasks waited for the slow copy
+    assert report["phases"]["queue-wait"] >= 0.2
+    assert report["stages"]["a"]["tasks"] == 2
+    assert report["stages"]["b"]["tasks"] == 1
+    assert set(report["registries"]) == {"first -> second", "first -> first"}
+    assert "🐢" in stats.format(tracebacks_file=tmp_path / "tb.txt")
+
+
+@pytest.mark.asyncio
+async def test__get_sync_tasks_lists_each_source_repository_once(
+    environment: None, fake_backend: FakeBackend
+):
+    configuration = make_configuration(
+        [
+            make_stage("a", "repo", [], dst_repository="copy-a"),
+            make_stage("b", "repo", [], dst_repository="copy-b"),
+            make_stage("c", "other-repo", []),
+        ]
+    )
+    fake_backend.tags = {"first/repo": ["1", "2"], "first/other-repo": ["3"]}
+
+    sync_tasks = await _get_sync_tasks(
+        configuration,
+        fake_backend,
+        use_explicit_tags=False,
+        parallel_discovery_tasks=10,
+    )
+
+    assert len(sync_tasks) == 5
+    assert sorted(i for n, i in fake_backend.calls if n == "get_image_tags") == [
+        "first/other-repo",
+        "first/repo",
+    ]
+
+
+@pytest.mark.asyncio
+async def test__get_sync_tasks_applies_tag_selectors(
+    environment: None, fake_backend: FakeBackend
+):
+    selected = make_stage("a", "repo", [])
+    selected["to"][0] |= {"exclude": [".*-rc.*"], "semver": "<2", "newest": 2}
+    explicit = make_stage("b", "repo", ["1.0.0", "latest"], dst_repository="other")
+    explicit["to"][0] |= {"include": ["latest"]}
+    configuration = make_configuration([selected, explicit])
+    fake_backend.tags = {
+        "first/repo": ["latest", "1.0.0", "1.1.0", "1.2.0-rc1", "2.0.0"]
+    }
+
+    sync_tasks = await _get_sync_tasks(
+        configuration,
+        fake_backend,
+        use_explicit_tags=True,
+        parallel_discovery_tasks=10,
+    )
+
+    # selectors are explicit enough to list `tags: []` with `use_explicit_tags`
+    assert sorted(f"{t.dst_path}:{t.tag}" for t in sync_tasks) == [
+        "other:latest",
+        "repo:1.0.0",
+        "repo:1.1.0",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_plan_sync_tasks_reports_without_copying(
+    environment: None, fake_backend: FakeBackend, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(
+        _sync, "_get_registry_backend", lambda *args, **kwargs: fake_backend
+    )
+    configuration = make_configuration(
+        [
+            make_stage("a", "repo", ["1", "2"]),
+            # reads what stage "a" writes
+            make_stage(
+                "b",
+                "repo",
+                ["2"],
+                source="second",
+                dst_repository="copy",
+                depends_on=["a"],
+            ),
+        ]
+    )
+    fake_backend.digests = {
+        "first/repo:1": "sha256:1",
+        "second/repo:1": "sha256:1",
+        "first/repo:2": "sha256:2",
+    }
+    fake_backend.sizes = {"first/repo:2": 100}
+
+    report = await plan_sync_tasks(
+        configuration,
+        backend=Backend.CRANE,
+        use_explicit_tags=False,
+        parallel_discovery_tasks=10,
+    )
+
+    assert not [n for n, _ in fake_backend.calls if n in ("copy", "copy_to_many")]
+    assert {t["task_id"]: (t["action"], t["reason"]) for t in report["tasks"]} == {
+        "first/repo:1 --> second/repo:1 #a": ("skip", "same-digest"),
+        "first/repo:2 --> second/repo:2 #a": ("copy", "missing"),
+        "second/repo:2 --> second/copy:2 #b": ("copy", "source-written-by-sync"),
+    }
+    assert (report["total"], report["copy"], report["skip"]) == (3, 2, 1)
+    assert report["depth"] == 2
+    # the source of stage "b" does not exist yet, its size is unknown
+    assert report["estimated_bytes"] == 100
+    assert report["stages"]["a"] == {"total": 2, "copy": 1, "skip": 1, "bytes": 100}
+    json.dumps(report)
+
+
+def test__run_stats_format_reports_planning_duration(tmp_path: Path):
+    stats = _RunStats(planning_duration=timedelta(seconds=3))
+
+    output = stats.format(tracebacks_file=tmp_path / "tb.txt")
+
+    assert "Planning took: 0:00:03" in output
+
+
+@pytest.mark.asyncio
+async def test__run_sync_tasks_invalidates_written_destinations_only(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    configuration = make_configuration(
+        [
+            make_stage("a", "repo-a", ["1"]),
+            make_stage("b", "repo-b", ["1"], depends_on=["a"]),
+        ]
+    )
+    fake_backend.digests["first/repo-b:1"] = "sha256:b"
+    fake_backend.digests["second/repo-b:1"] = "sha256:b"
+
+    await _run(configuration, fake_backend, tmp_path)
+
+    assert fake_backend.count("clear_cache") == 0
+    assert [i for n, i in fake_backend.calls if n == "invalidate"] == [
+        "second/repo-a:1"
+    ]
+
+
+@pytest.mark.asyncio
+async def test__run_sync_tasks_pulls_once_for_all_destinations(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    stage = make_stage("a", "repo", ["1"], dst_repository="copy-a")
+    stage["to"] += [
+        {"destination": "second", "repository": "copy-b", "tags": ["1"]},
+        {"destination": "second", "repository": "copy-c", "tags": ["1"]},
+        {"destination": "second", "repository": "up-to-date", "tags": ["1"]},
+    ]
+    configuration = make_configuration([stage])
+    fake_backend.digests["first/repo:1"] = "sha256:1"
+    fake_backend.digests["second/up-to-date:1"] = "sha256:1"
+    fake_backend.failing.add("second/copy-c:1")
+
+    with pytest.raises(SystemExit):
+        await _run(configuration, fake_backend, tmp_path)
+
+    assert fake_backend.count("copy") == 0
+    assert [i for n, i in fake_backend.calls if n == "copy_to_many"] == [
+        "first/repo:1 -> ['second/copy-a:1', 'second/copy-b:1', 'second/copy-c:1']"
+    ]
+    # the source digest is only resolved once for the whole group
+    assert fake_backend.calls.count(("get_digest", "first/repo:1")) == 1
+    assert fake_backend.digests["second/copy-b:1"] == "sha256:1"
+    assert "second/copy-c:1" not in fake_backend.digests
+    assert "copy-c" in (tmp_path / "tb.txt").read_text()
+
+
+@pytest.mark.asyncio
+async def test__run_sync_tasks_uses_resolved_digests(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    configuration = make_configuration(
+        [
+            make_stage("a", "repo", ["1", "2", "3"]),
+            # reads what stage `a` writes
+            make_stage(
+                "b",
+                "repo",
+                ["1"],
+                source="second",
+                destination="first",
+                dst_repository="copy",
+                depends_on=["a"],
+            ),
+        ]
+    )
+    for tag in ["1", "2", "3"]:
+        fake_backend.digests[f"first/repo:{tag}"] = f"sha256:{tag}"
+    fake_backend.digests["second/repo:2"] = "sha256:2"
+    # outdated, digests have to be compared
+    fake_backend.digests["first/copy:1"] = "sha256:old"
+    sync_tasks = await _get_sync_tasks(
+        configuration, fake_backend, use_explicit_tags=True, parallel_discovery_tasks=10
+    )
+
+    known_digests = await _resolve_digests(
+        configuration, fake_backend, sync_tasks, parallel_discovery_tasks=10
+    )
+    await _run_sync_tasks(
+        configuration,
+        fake_backend,
+        _get_execution_plan(configuration, sync_tasks),
+        _RunStats(),
+        parallel_sync_tasks=10,
+        tracebacks_file=tmp_path / "tb.txt",
+        known_digests=known_digests,
+    )
+
+    assert sorted(i for n, i in fake_backend.calls if n == "get_digests") == [
+        "first/copy",
+        "first/repo",
+        "second/repo",
+    ]
+    # only the image written by stage `a` and read by stage `b` is looked up again
+    assert [i for n, i in fake_backend.calls if n == "get_digest"] == ["second/repo:1"]
+    assert fake_backend.digests["first/copy:1"] == "sha256:1"
+
+
+@pytest.mark.asyncio
+async def test__compare_images_diffs_destination_tags_first(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    stage = make_stage("a", "repo", ["1", "2", "latest"])
+    stage["to"][0]["immutable-tags"] = r"\d+"
+    configuration = make_configuration([stage])
+    fake_backend.tags = {"second/repo": ["1", "latest"]}
+    fake_backend.digests = {
+        "first/repo:1": "sha256:1",
+        "first/repo:2": "sha256:2",
+        "first/repo:latest": "sha256:new",
+        "second/repo:1": "sha256:1",
+        "second/repo:latest": "sha256:old",
+    }
+    sync_tasks = await _get_sync_tasks(
+        configuration, fake_backend, use_explicit_tags=True, parallel_discovery_tasks=10
+    )
+
+    known_digests, trusted = await _compare_images(
+        configuration, fake_backend, sync_tasks, parallel_discovery_tasks=10
+    )
+    # only the mutable tag present in the destination is compared
+    assert known_digests == {
+        "first/repo:latest": "sha256:new",
+        "second/repo:latest": "sha256:old",
+        "second/repo:2": None,
+    }
+    execution_plan, pruned, _ = _prune_execution_plan(
+        configuration,
+        _get_execution_plan(configuration, sync_tasks),
+        known_digests,
+        trusted=trusted,
+    )
+    await _run_sync_tasks(
+        configuration,
+        fake_backend,
+        execution_plan,
+        _RunStats(),
+        parallel_sync_tasks=10,
+        tracebacks_file=tmp_path / "tb.txt",
+        known_digests=known_digests,
+    )
+
+    assert pruned == sorted(trusted) == ["first/repo:1 --> second/repo:1 #a"]
+    assert not [n for n, _ in fake_backend.calls if n == "get_digest"]
+    assert sorted(i for n, i in fake_backend.calls if n == "copy") == [
+        "first/repo:2 -> second/repo:2",
+        "first/repo:latest -> second/repo:latest",
+    ]
+
+
+def test__prune_execution_plan_keeps_tasks_reading_written_images(
+    environment: None,
+):
+    configuration = make_configuration(
+        [
+            make_stage("a", "repo", ["1", "2"]),
+            make_stage(
+                "b",
+                "repo",
+                ["1", "2"],
+                source="second",
+                destination="first",
+                dst_repository="copy",
+                depends_on=["a"],
+            ),
+        ]
+    )
+    sync_tasks = [
+        _SyncTask(
+            task_id=f"{stage_id}:{tag}",
+            stage_id=stage_id,
+            src=src,
+            dst=dst,
+            src_path="repo",
+            dst_path=dst_path,
+            tag=tag,
+        )
+        for stage_id, src, dst, dst_path in [
+            # listed in reverse order of execution on purpose
+            ("b", "second", "first", "copy"),
+            ("a", "first", "second", "repo"),
+        ]
+        for tag in ["1", "2"]
+    ]
+    known_digests: dict[str, str | None] = {
+        "first/repo:1": "sha256:1",
+        "second/repo:1": "sha256:1",
+        "first/copy:1": "sha256:1",
+        "first/repo:2": "sha256:2",
+        "second/repo:2": "sha256:old",
+        "first/copy:2": "sha256:old",
+    }
+
+    execution_plan, pruned, resumed = _prune_execution_plan(
+        configuration, _get_execution_plan(configuration, sync_tasks), known_digests
+    )
+
+    assert pruned == ["a:1", "b:1"]
+    assert resumed == []
+    assert sorted(execution_plan.task_mapping) == ["a:2", "b:2"]
+    assert execution_plan.predecessors == {
+        "#a done": ["a:2"],
+        "a:2": [],
+        "b:2": ["#a done"],
+    }
+
+
+@dataclass
+class _FlakyBackend(FakeBackend):
+    """``copy`` of ``source`` times out ``timeouts[source]`` times before working"""
+
+    timeouts: dict[str, int] = field(default_factory=dict)
+
+    async def copy(
+        self,
+        source: str,
+        destination: str,
+        *,
+        src_skip_tls_verify: bool,
+        dst_skip_tls_verify: bool,
+    ) -> None:
+        if self.timeouts.get(source, 0) > 0:
+            self.timeouts[source] -= 1
+            self.calls.append(("copy", f"{source} -> {destination}"))
+            raise CraneCommandTimeoutError(["crane", "copy"], 0)
+        await super().copy(
+            source,
+            destination,
+            src_skip_tls_verify=src_skip_tls_verify,
+            dst_skip_tls_verify=dst_skip_tls_verify,
+        )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("timeouts,failed", [(2, False), (3, True)])
+async def test__run_sync_tasks_retries_transient_errors(
+    environment: None, tmp_path: Path, timeouts: int, failed: bool
+):
+    configuration = make_configuration([make_stage("a", "repo", ["1"])])
+    backend = _FlakyBackend(timeouts={"first/repo:1": timeouts})
+    sync_tasks = await _get_sync_tasks(
+        configuration, backend, use_explicit_tags=True, parallel_discovery_tasks=10
+    )
+    stats = _RunStats()
+
+    async def _run() -> None:
+        await _run_sync_tasks(
+            configuration,
+            backend,
+            _get_execution_plan(configuration, sync_tasks),
+            stats,
+            parallel_sync_tasks=10,
+            tracebacks_file=tmp_path / "tb.txt",
+            retry_policy=RetryPolicy(retries=2, initial_delay=0),
+        )
+
+    if failed:
+        with pytest.raises(SystemExit):
+            await _run()
+    else:
+        await _run()
+
+    assert backend.count("copy") == 3
+    assert stats.failed == int(failed)
+    assert [len(e) for e in stats.retries.values()] == [2]
+    tracebacks = (tmp_path / "tb.txt").read_text()
+    assert ("attempt 2 of 3" in tracebacks) is failed
+
+
+@pytest.mark.asyncio
+async def test__run_sync_tasks_does_not_retry_permanent_errors(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    configuration = make_configuration([make_stage("a", "repo", ["1"])])
+    fake_backend.failing.add("first/repo:1")
+    sync_tasks = await _get_sync_tasks(
+        configuration, fake_backend, use_explicit_tags=True, parallel_discovery_tasks=10
+    )
+    stats = _RunStats()
+
+    with pytest.raises(SystemExit):
+        await _run_sync_tasks(
+            configuration,
+            fake_backend,
+            _get_execution_plan(configuration, sync_tasks),
+            stats,
+            parallel_sync_tasks=10,
+            tracebacks_file=tmp_path / "tb.txt",
+            retry_policy=RetryPolicy(retries=2, initial_delay=0),
+        )
+
+    assert fake_backend.count("copy") == 1
+    assert stats.retries == {}
+
+
+@dataclass
+class _FlakyDigestBackend(FakeBackend):
+    """``get_digest`` of ``image`` times out ``timeouts[image]`` times before working"""
+
+    timeouts: dict[str, int] = field(default_factory=dict)
+
+    async def get_digest(self, image: str, *, skip_tls_verify: bool) -> str | None:
+        if self.timeouts.get(image, 0) > 0:
+            self.timeouts[image] -= 1
+            self.calls.append(("get_digest", image))
+            raise CraneCommandTimeoutError(["crane", "digest"], 0)
+        return await super().get_digest(image, skip_tls_verify=skip_tls_verify)
+
+
+@pytest.mark.asyncio
+async def test__run_sync_tasks_retries_each_destination_on_its_own(
+    environment: None, tmp_path: Path
+):
+    stage = make_stage("a", "repo", ["1"])
+    stage["to"].append({"destination": "second", "repository": "copy", "tags": ["1"]})
+    configuration = make_configuration([stage])
+    backend = _FlakyDigestBackend(
+        digests={"first/repo:1": "sha256:1"},
+        timeouts={"second/repo:1": 2, "second/copy:1": 2},
+    )
+    sync_tasks = await _get_sync_tasks(
+        configuration, backend, use_explicit_tags=True, parallel_discovery_tasks=10
+    )
+    stats = _RunStats()
+
+    await _run_sync_tasks(
+        configuration,
+        backend,
+        _get_execution_plan(configuration, sync_tasks),
+        stats,
+        parallel_sync_tasks=10,
+        tracebacks_file=tmp_path / "tb.txt",
+        retry_policy=RetryPolicy(retries=2, initial_delay=0),
+    )
+
+    # both destinations were copied together after using up their own retries
+    assert backend.count("copy_to_many") == 1
+    assert stats.failed == 0
+    assert [len(e) for e in stats.retries.values()] == [2, 2]
@@ -0,0 +1,75 @@
+import re
+
+import pytest
+from reposync._tags import Version, parse_constraint, parse_version, select_tags
+
+_TAGS = [
+    "latest",
+    "1.0.0",
+    "1.2.0-rc.1",
+    "1.2.0",
+    "v1.10.0",
+    "2.0.0",
+    "pr-123",
+    "pr-124",
+    "sha-abcdef",
+]
+
+
+@pytest.mark.parametrize(
+    "tag,expected",
+    [
+        pytest.param("1.2.3", Version(1, 2, 3), id="release"),
+        pytest.param("v1.2.3+build.7", Version(1, 2, 3), id="prefix-and-build"),
+        pytest.param("latest", None, id="not-a-version"),
+        pytest.param("1.2", None, id="incomplete"),
+        pytest.param("01.2.3", None, id="leading-zero"),
+    ],
+)
+def test_parse_version(tag: str, expected: Version | None):
+    assert parse_version(tag) == expected
+
+
+def test_versions_are_ordered_by_precedence():
+    ordered = ["1.0.0-alpha", "1.0.0-alpha.1", "1.0.0-alpha.beta", "1.0.0-beta.2"]
+    ordered += ["1.0.0-beta.11", "1.0.0-rc.1", "1.0.0", "1.0.10", "1.10.0"]
+
+    assert sorted(ordered, key=parse_version) == ordered
+
+
+@pytest.mark.parametrize(
+    "selectors,expected",
+    [
+        pytest.param({}, _TAGS, id="nothing-selected"),
+        pytest.param({"include": [r"pr-\d+"]}, ["pr-123", "pr-124"], id="include"),
+        pytest.param(
+            {"exclude": [r"pr-.*", r"sha-.*"]},
+            ["latest", "1.0.0", "1.2.0-rc.1", "1.2.0", "v1.10.0", "2.0.0"],
+            id="exclude",
+        ),
+        pytest.param(
+            {"semver": ">=1.1, <2"},
+            ["1.2.0-rc.1", "1.2.0", "v1.10.0"],
+            id="semver-range",
+        ),
+        pytest.param({"newest": 2}, ["v1.10.0", "2.0.0"], id="newest"),
+        pytest.param(
+            {"exclude": [r".*-rc\..*"], "semver": "<2", "newest": 2},
+            ["1.2.0", "v1.10.0"],
+            id="combined",
+        ),
+    ],
+)
+def test_select_tags(selectors: dict, expected: list[str]):
+    arguments = {"include": [], "exclude": [], "semver": None, "newest": None}
+    arguments.update(selectors)
+    arguments["include"] = [re.compile(p) for p in arguments["include"]]
+    arguments["exclude"] = [re.compile(p) for p in arguments["exclude"]]
+
+    assert select_tags(_TAGS, **arguments) == expected
+
+
+@pytest.mark.parametrize("constraint", ["1.2.3", ">=1.2,", "~1.2", ">= latest"])
+def test_parse_constraint_rejects_invalid(constraint: str):
+    with pytest.raises(ValueError, match="must look like"):
+        parse_constraint(constraint)
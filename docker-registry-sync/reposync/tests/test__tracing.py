@@ -0,0 +1,107 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=unused-argument
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+from typing import Any
+
+import pytest
+from conftest import FakeBackend, make_configuration, make_stage
+from reposync._backend import TracingBackend
+from reposync._sync import (
+    _get_execution_plan,
+    _get_sync_tasks,
+    _run_sync_tasks,
+    _RunStats,
+)
+from reposync._tracing import CONSOLE, is_enabled, span, tracing
+
+
+def _read_spans(trace_file: Path) -> dict[str, dict[str, Any]]:
+    spans: dict[str, dict[str, Any]] = {}
+    for line in trace_file.read_text().splitlines():
+        for resource_spans in json.loads(line)["resourceSpans"]:
+            for scope_spans in resource_spans["scopeSpans"]:
+                for otlp_span in scope_spans["spans"]:
+                    spans[otlp_span["spanId"]] = otlp_span
+    return spans
+
+
+def _get_parent_name(spans: dict[str, dict[str, Any]], otlp_span: dict) -> str:
+    return spans[otlp_span["parentSpanId"]]["name"]
+
+
+@pytest.mark.asyncio
+async def test_spans_of_concurrent_tasks_share_their_parent(tmp_path: Path):
+    trace_file = tmp_path / "trace.jsonl"
+
+    async def _child(name: str) -> None:
+        with span(name, index=1):
+            await asyncio.sleep(0)
+
+    with tracing(trace_file):
+        assert is_enabled()
+        with span("root"):
+            await asyncio.gather(_child("a"), _child("b"))
+        with pytest.raises(RuntimeError), span("failing"):
+            msg = "broken"
+            raise RuntimeError(msg)
+    assert not is_enabled()
+
+    spans = {s["name"]: s for s in _read_spans(trace_file).values()}
+    assert spans["a"]["parentSpanId"] == spans["root"]["spanId"]
+    assert spans["b"]["parentSpanId"] == spans["root"]["spanId"]
+    assert spans["a"]["traceId"] == spans["root"]["traceId"]
+    assert "parentSpanId" not in spans["root"]
+    assert spans["a"]["attributes"] == [{"key": "index", "value": {"intValue": "1"}}]
+    assert spans["failing"]["traceId"] != spans["root"]["traceId"]
+    assert spans["failing"]["status"] == {
+        "code": 2,
+        "message": "RuntimeError: broken",
+    }
+
+
+def test_spans_are_not_recorded_without_tracing(tmp_path: Path):
+    with tracing(None), span("ignored"):
+        assert not is_enabled()
+
+
+def test_console_spans_are_written_to_the_given_stream(
+    capsys: pytest.CaptureFixture[str],
+):
+    # NOTE: `--plan` prints its report to stdout
+    with tracing(CONSOLE, console=sys.stderr), span("planned"):
+        pass
+
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert json.loads(captured.err)["resourceSpans"]
+
+
+@pytest.mark.asyncio
+async def test_registry_operations_are_children_of_their_copy(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    configuration = make_configuration([make_stage("a", "repo", ["1", "2"])])
+    trace_file = tmp_path / "trace.jsonl"
+
+    with tracing(trace_file):
+        backend = TracingBackend(fake_backend)
+        sync_tasks = await _get_sync_tasks(
+            configuration, backend, use_explicit_tags=True, parallel_discovery_tasks=2
+        )
+        await _run_sync_tasks(
+            configuration,
+            backend,
+            _get_execution_plan(configuration, sync_tasks),
+            _RunStats(),
+            parallel_sync_tasks=2,
+            tracebacks_file=tmp_path / "tb.txt",
+        )
+
+    spans = _read_spans(trace_file)
+    copies = [s for s in spans.values() if s["name"] == "registry copy"]
+    assert len(copies) == 2
+    assert {_get_parent_name(spans, s) for s in copies} == {"copy image"}
@@ -0,0 +1,292 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=unused-argument
+
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Callable
+
+import aiohttp
+import pytest
+from aiohttp.test_utils import TestClient, TestServer, unused_port
+from conftest import FakeBackend, make_configuration, make_stage
+from reposync import _watch
+from reposync._backend import Backend
+from reposync._digest_cache import DigestCache, PersistentDigestBackend
+from reposync._models import Configuration
+from reposync._watch import WEBHOOK_PATH, _make_webhook_app, watch
+
+
+def _load_configuration(config_file: Path) -> Configuration:
+    return make_configuration(json.loads(config_file.read_text()))
+
+
+def _write_configuration(config_file: Path, stages: list[dict]) -> None:
+    config_file.write_text(json.dumps(stages))
+    # mtime resolution of some filesystems is too coarse to notice the change
+    stat = config_file.stat()
+    os.utime(config_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+async def _wait_for(condition: Callable[[], bool]) -> None:
+    async with asyncio.timeout(5):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def config_file(tmp_path: Path) -> Path:
+    config_file = tmp_path / "config.json"
+    _write_configuration(config_file, [make_stage("a", "repo", ["1", "2"])])
+    return config_file
+
+
+@pytest.mark.asyncio
+async def test_watch_copies_only_changed_images(
+    environment: None,
+    fake_backend: FakeBackend,
+    config_file: Path,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(
+        _watch, "_get_registry_backend", lambda *args, **kwargs: fake_backend
+    )
+    fake_backend.digests["first/repo:1"] = "sha256:1"
+    fake_backend.digests["first/repo:2"] = "sha256:2"
+
+    task = asyncio.create_task(
+        watch(
+            config_file,
+            _load_configuration,
+            backend=Backend.CRANE,
+            interval=0.01,
+            webhook_port=None,
+            use_explicit_tags=True,
+            parallel_sync_tasks=2,
+            parallel_discovery_tasks=2,
+            tracebacks_file=tmp_path / "tb.txt",
+        )
+    )
+    try:
+        await _wait_for(lambda: fake_backend.count("copy") == 2)
+
+        fake_backend.digests["first/repo:2"] = "sha256:2-changed"
+        await _wait_for(
+            lambda: fake_backend.digests["second/repo:2"] == "sha256:2-changed"
+        )
+        assert fake_backend.count("copy") == 3
+
+        _write_configuration(
+            config_file,
+            [make_stage("a", "repo", ["1", "2"]), make_stage("b", "other", ["1"])],
+        )
+        await _wait_for(lambda: "second/other:1" in fake_backend.digests)
+        assert fake_backend.count("copy") == 4
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    # logged in once, the backend and its caches are kept between syncs
+    assert fake_backend.count("login") == 2
+    assert fake_backend.count("clear_cache") == 0
+    assert fake_backend.count("close") == 1
+
+
+@pytest.mark.asyncio
+async def test_watch_looks_up_persisted_source_digests_again(
+    environment: None,
+    fake_backend: FakeBackend,
+    config_file: Path,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    state_dir = tmp_path / "state"
+    monkeypatch.setattr(
+        _watch,
+        "_get_registry_backend",
+        lambda *args, **kwargs: PersistentDigestBackend(
+            fake_backend, DigestCache(kwargs["state_dir"], ttl=3600)
+        ),
+    )
+    fake_backend.digests["first/repo:1"] = "sha256:1"
+    fake_backend.digests["first/repo:2"] = "sha256:2"
+
+    task = asyncio.create_task(
+        watch(
+            config_file,
+            _load_configuration,
+            backend=Backend.CRANE,
+            interval=0.01,
+            webhook_port=None,
+            use_explicit_tags=True,
+            parallel_sync_tasks=2,
+            parallel_discovery_tasks=2,
+            tracebacks_file=tmp_path / "tb.txt",
+            state_dir=state_dir,
+            digest_cache_ttl=3600,
+        )
+    )
+    try:
+        await _wait_for(lambda: fake_backend.count("copy") == 2)
+
+        # NOTE: the persisted digest has not expired yet
+        fake_backend.digests["first/repo:2"] = "sha256:2-changed"
+        await _wait_for(
+            lambda: fake_backend.digests["second/repo:2"] == "sha256:2-changed"
+        )
+        assert fake_backend.count("copy") == 3
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+
+@pytest.mark.asyncio
+async def test_watch_plans_again_when_the_configuration_changes(
+    environment: None,
+    fake_backend: FakeBackend,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(
+        _watch, "_get_registry_backend", lambda *args, **kwargs: fake_backend
+    )
+    config_file = tmp_path / "config.json"
+    # NOTE: all tags of the source of "a" are listed
+    _write_configuration(
+        config_file, [make_stage("a", "repo", []), make_stage("b", "other", ["1"])]
+    )
+    fake_backend.tags = {"first/repo": ["1"]}
+    fake_backend.digests["first/repo:1"] = "sha256:1"
+    fake_backend.digests["first/other:1"] = "sha256:1"
+
+    def _count_listings(repository: str) -> int:
+        return len(
+            [1 for c in fake_backend.calls if c == ("get_image_tags", repository)]
+        )
+
+    task = asyncio.create_task(
+        watch(
+            config_file,
+            _load_configuration,
+            backend=Backend.CRANE,
+            interval=0.01,
+            webhook_port=None,
+            use_explicit_tags=False,
+            parallel_sync_tasks=2,
+            parallel_discovery_tasks=2,
+            tracebacks_file=tmp_path / "tb.txt",
+        )
+    )
+    try:
+        await _wait_for(lambda: fake_backend.count("copy") == 2)
+        # new tags of listed sources are picked up by the following syncs
+        fake_backend.tags["first/repo"] = ["1", "2"]
+        fake_backend.digests["first/repo:2"] = "sha256:2"
+        await _wait_for(lambda: "second/repo:2" in fake_backend.digests)
+        assert fake_backend.count("copy") == 3
+        assert _count_listings("first/repo") > 1
+        # explicit tags are planned once
+        assert _count_listings("first/other") == 0
+
+        _write_configuration(
+            config_file,
+            [
+                make_stage("a", "repo", []),
+                make_stage("b", "other", ["1"]),
+                make_stage("c", "third", ["1"]),
+            ],
+        )
+        fake_backend.digests["first/third:1"] = "sha256:1"
+        await _wait_for(lambda: "second/third:1" in fake_backend.digests)
+        assert fake_backend.count("copy") == 4
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+
+@pytest.mark.asyncio
+async def test_watch_syncs_stages_reading_pushed_repositories(
+    environment: None,
+    fake_backend: FakeBackend,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(
+        _watch, "_get_registry_backend", lambda *args, **kwargs: fake_backend
+    )
+    config_file = tmp_path / "config.json"
+    _write_configuration(
+        config_file,
+        [
+            make_stage("a", "repo", ["1"]),
+            make_stage("b", "other", ["1"]),
+            make_stage("c", "third", ["1"], depends_on=["a"]),
+        ],
+    )
+    for repository in ["repo", "other", "third"]:
+        fake_backend.digests[f"first/{repository}:1"] = "sha256:1"
+    webhook_port = unused_port()
+
+    task = asyncio.create_task(
+        watch(
+            config_file,
+            _load_configuration,
+            backend=Backend.CRANE,
+            # NOTE: only notifications start a sync
+            interval=60,
+            webhook_port=webhook_port,
+            use_explicit_tags=True,
+            parallel_sync_tasks=2,
+            parallel_discovery_tasks=2,
+            tracebacks_file=tmp_path / "tb.txt",
+        )
+    )
+    try:
+        await _wait_for(lambda: fake_backend.count("copy") == 3)
+        for repository in ["repo", "other", "third"]:
+            fake_backend.digests[f"first/{repository}:1"] = "sha256:new"
+        fake_backend.calls.clear()
+
+        push = {"events": [{"action": "push", "target": {"repository": "repo"}}]}
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                f"http://localhost:{webhook_port}{WEBHOOK_PATH}", json=push
+            ) as response:
+                assert response.status == 200
+        await _wait_for(lambda: fake_backend.count("copy") == 2)
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    # stage `c` depends on the one reading the pushed repository
+    assert fake_backend.digests["second/repo:1"] == "sha256:new"
+    assert fake_backend.digests["second/third:1"] == "sha256:new"
+    assert fake_backend.digests["second/other:1"] == "sha256:1"
+    assert not [c for c in fake_backend.calls if "/other" in c[1]]
+
+
+@pytest.mark.asyncio
+async def test_webhook_wakes_up_on_push_events():
+    wakeup = asyncio.Event()
+    pushed: set[str] = set()
+    async with TestClient(TestServer(_make_webhook_app(wakeup, pushed))) as client:
+        response = await client.post(WEBHOOK_PATH, data="not json")
+        assert response.status == 400
+
+        pull = {"events": [{"action": "pull", "target": {"repository": "repo"}}]}
+        response = await client.post(WEBHOOK_PATH, json=pull)
+        assert response.status == 200
+        assert not wakeup.is_set()
+        assert pushed == set()
+
+        push = {"events": [{"action": "push", "target": {"repository": "repo"}}]}
+        response = await client.post(WEBHOOK_PATH, json=push)
+        assert response.status == 200
+        assert wakeup.is_set()
+        assert pushed == {"repo"}
@@ -0,0 +1,324 @@
+# pylint: disable=redefined-outer-name
+# pylint: disable=unused-argument
+
+import asyncio
+import contextlib
+from pathlib import Path
+
+import pytest
+from conftest import FakeBackend, make_configuration, make_stage
+from reposync._models import Configuration
+from reposync._retry import RetryPolicy
+from reposync._sync import (
+    _RunStats,
+    _get_execution_plan,
+    _get_sync_tasks,
+    _run_sync_tasks,
+)
+from reposync._work_queue import WorkQueue
+from reposync import _worker
+
+
+def test_work_queue_claims_each_job_once(tmp_path: Path):
+    coordinator = WorkQueue(tmp_path / "queue.sqlite")
+    worker = WorkQueue(tmp_path / "queue.sqlite")
+    run_id = coordinator.start_run()
+    job_id = coordinator.publish(run_id, {"tasks": []})
+
+    assert worker.claim("first", lease=60) == (job_id, {"tasks": []})
+    assert worker.claim("second", lease=60) is None
+    assert worker.complete(job_id, "first", {"worker": "first"})
+    assert coordinator.get_result(job_id) == {"worker": "first"}
+
+
+def test_work_queue_claims_jobs_of_dead_workers_again(tmp_path: Path):
+    work_queue = WorkQueue(tmp_path / "queue.sqlite")
+    job_id = work_queue.publish(work_queue.start_run(), {"tasks": []})
+    # the lease expires right away, as if "dead" stopped renewing it
+    assert work_queue.claim("dead", lease=-1) is not None
+
+    assert work_queue.claim("alive", lease=60) == (job_id, {"tasks": []})
+    assert not work_queue.renew(job_id, "dead", lease=60)
+    assert not work_queue.complete(job_id, "dead", {"worker": "dead"})
+    assert work_queue.complete(job_id, "alive", {"worker": "alive"})
+    assert work_queue.get_result(job_id) == {"worker": "alive"}
+
+
+def test_work_queue_fails_jobs_claimed_too_often(tmp_path: Path):
+    work_queue = WorkQueue(tmp_path / "queue.sqlite", max_attempts=2)
+    job_id = work_queue.publish(work_queue.start_run(), {"tasks": []})
+    for worker in ("dead", "dead-again"):
+        assert work_queue.claim(worker, lease=-1) is not None
+
+    assert work_queue.claim("alive", lease=60) is None
+    result = work_queue.get_result(job_id)
+    assert result is not None
+    assert result["worker"] == "dead-again"
+    assert "claimed 2 times" in result["error"]
+
+
+@pytest.mark.asyncio
+async def test__consume_fails_a_job_which_raises_and_keeps_consuming(
+    environment: None,
+    fake_backend: FakeBackend,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    async def _run_job(configuration, backend, job, retry_policy, *, worker):
+        if job["tasks"] == ["bad"]:
+            msg = "unexpected job"
+            raise RuntimeError(msg)
+        return {"worker": worker, "tasks": {}}
+
+    monkeypatch.setattr(_worker, "run_job", _run_job)
+    work_queue = WorkQueue(tmp_path / "queue.sqlite", poll_interval=0.01)
+    run_id = work_queue.start_run()
+    bad_job_id = work_queue.publish(run_id, {"tasks": ["bad"]})
+    good_job_id = work_queue.publish(run_id, {"tasks": []})
+
+    consumer = asyncio.create_task(
+        _worker._consume(
+            make_configuration([]),
+            fake_backend,
+            work_queue,
+            RetryPolicy(),
+            worker="worker",
+            lease=60,
+            since=0,
+        )
+    )
+    good_result = await asyncio.wait_for(
+        work_queue.wait_for_result(good_job_id), timeout=5
+    )
+    work_queue.finish_run(run_id)
+    await asyncio.wait_for(consumer, timeout=5)
+
+    assert good_result == {"worker": "worker", "tasks": {}}
+    bad_result = work_queue.get_result(bad_job_id)
+    assert bad_result is not None
+    assert "RuntimeError: unexpected job" in bad_result["error"]
+
+
+def test_work_queue_is_finished_once_a_newer_run_finished(tmp_path: Path):
+    work_queue = WorkQueue(tmp_path / "queue.sqlite")
+    work_queue.finish_run(work_queue.start_run())
+    # workers started now wait for the next run
+    since = work_queue.get_finished_generation()
+    assert not work_queue.is_finished(since)
+
+    run_id = work_queue.start_run()
+    work_queue.publish(run_id, {"tasks": []})
+    assert not work_queue.is_finished(since)
+
+    work_queue.finish_run(run_id)
+    assert work_queue.is_finished(since)
+    # open jobs of finished runs are not claimed anymore
+    assert work_queue.claim("worker", lease=60) is None
+
+
+def test_work_queue_start_run_finishes_abandoned_runs(tmp_path: Path):
+    work_queue = WorkQueue(tmp_path / "queue.sqlite")
+    abandoned = work_queue.start_run()
+    work_queue.publish(abandoned, {"tasks": ["abandoned"]})
+
+    run_id = work_queue.start_run()
+    job_id = work_queue.publish(run_id, {"tasks": []})
+
+    assert work_queue.claim("worker", lease=60) == (job_id, {"tasks": []})
+    work_queue.finish_run(run_id)
+    assert work_queue.is_finished(0)
+
+
+async def _coordinate(
+    configuration: Configuration,
+    backend: FakeBackend,
+    work_queue_file: Path,
+    tmp_path: Path,
+    stats: _RunStats,
+    *,
+    start_delay: float = 0,
+    parallel_sync_tasks: int = 10,
+) -> None:
+    """runs the sync like ``run_sync_tasks`` with a work queue"""
+    await asyncio.sleep(start_delay)
+    work_queue = WorkQueue(work_queue_file, poll_interval=0.01)
+    run_id = work_queue.start_run()
+    sync_tasks = await _get_sync_tasks(
+        configuration, backend, use_explicit_tags=True, parallel_discovery_tasks=1
+    )
+    try:
+        # NOTE: raised inside a task `SystemExit` would stop the event loop
+        with contextlib.suppress(SystemExit):
+            await _run_sync_tasks(
+                configuration,
+                backend,
+                _get_execution_plan(configuration, sync_tasks),
+                stats,
+                parallel_sync_tasks=parallel_sync_tasks,
+                tracebacks_file=tmp_path / "tb.txt",
+                continue_on_failure=True,
+                work_queue=work_queue,
+                run_id=run_id,
+            )
+    finally:
+        work_queue.finish_run(run_id)
+
+
+@pytest.mark.asyncio
+async def test__run_sync_tasks_with_work_queue_copies_on_workers(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    configuration = make_configuration(
+        [
+            make_stage("a", "repo", ["1"]),
+            make_stage(
+                "b",
+                "repo",
+                ["1"],
+                source="second",
+                dst_repository="copy",
+                depends_on=["a"],
+            ),
+            make_stage("c", "other", ["1"]),
+        ]
+    )
+    fake_backend.digests = {"first/repo:1": "sha256:1"}
+    fake_backend.failing.add("first/other:1")
+    work_queue_file = tmp_path / "queue.sqlite"
+    stats = _RunStats()
+
+    workers = [
+        _worker._consume(
+            configuration,
+            fake_backend,
+            WorkQueue(work_queue_file, poll_interval=0.01),
+            RetryPolicy(retries=0),
+            worker=f"worker-{i}",
+            lease=60,
+            since=0,
+        )
+        for i in range(2)
+    ]
+    await asyncio.wait_for(
+        asyncio.gather(
+            _coordinate(configuration, fake_backend, work_queue_file, tmp_path, stats),
+            *workers,
+        ),
+        timeout=10,
+    )
+
+    assert (stats.copied, stats.failed) == (2, 1)
+    # "b" read what "a" copied on a worker before
+    assert fake_backend.digests["second/copy:1"] == "sha256:1"
+    tracebacks = (tmp_path / "tb.txt").read_text()
+    assert "RemoteTaskError" in tracebacks
+    assert "failed to copy first/other:1" in tracebacks
+
+
+@pytest.mark.asyncio
+async def test__run_sync_tasks_with_work_queue_fails_tasks_of_failed_jobs(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    configuration = make_configuration([make_stage("a", "repo", ["1"])])
+    work_queue_file = tmp_path / "queue.sqlite"
+    stats = _RunStats()
+
+    async def _die() -> None:
+        # claims the job and dies without ever completing it
+        dead = WorkQueue(work_queue_file, poll_interval=0.01)
+        while dead.claim("dead", lease=-1) is None:
+            await asyncio.sleep(0.01)
+        # NOTE: the workers claiming decide how often a job is attempted
+        alive = WorkQueue(work_queue_file, max_attempts=1)
+        assert alive.claim("alive", lease=60) is None
+
+    await asyncio.wait_for(
+        asyncio.gather(
+            _coordinate(configuration, fake_backend, work_queue_file, tmp_path, stats),
+            _die(),
+        ),
+        timeout=10,
+    )
+
+    assert stats.failed == 1
+    assert "claimed 1 times" in (tmp_path / "tb.txt").read_text()
+
+
+@pytest.mark.asyncio
+async def test__run_sync_tasks_with_work_queue_publishes_all_ready_jobs(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    configuration = make_configuration(
+        [make_stage(f"{i}", f"repo{i}", ["1"]) for i in range(3)]
+    )
+    work_queue_file = tmp_path / "queue.sqlite"
+    stats = _RunStats()
+
+    async def _claim_all() -> None:
+        # NOTE: only completes jobs once all of them were published
+        work_queue = WorkQueue(work_queue_file)
+        claimed: list[int] = []
+        while len(claimed) < 3:
+            if (job := work_queue.claim("worker", lease=60)) is not None:
+                claimed.append(job[0])
+            await asyncio.sleep(0.01)
+        for job_id in claimed:
+            work_queue.complete(job_id, "worker", {"worker": "worker", "error": "x"})
+
+    await asyncio.wait_for(
+        asyncio.gather(
+            _coordinate(
+                configuration,
+                fake_backend,
+                work_queue_file,
+                tmp_path,
+                stats,
+                parallel_sync_tasks=1,
+            ),
+            _claim_all(),
+        ),
+        timeout=10,
+    )
+
+    assert stats.failed == 3
+
+
+@pytest.mark.asyncio
+async def test__consume_waits_for_the_run_after_a_finished_one(
+    environment: None, fake_backend: FakeBackend, tmp_path: Path
+):
+    configuration = make_configuration([make_stage("a", "repo", ["1"])])
+    work_queue_file = tmp_path / "queue.sqlite"
+    # left over from a previous run
+    previous = WorkQueue(work_queue_file)
+    previous.finish_run(previous.start_run())
+    work_queue = WorkQueue(work_queue_file, poll_interval=0.01)
+    stats = _RunStats()
+
+    # started before the coordinator
+    worker = _worker._consume(
+        configuration,
+        fake_backend,
+        work_queue,
+        RetryPolicy(),
+        worker="worker",
+        lease=60,
+        since=work_queue.get_finished_generation(),
+    )
+    await asyncio.wait_for(
+        asyncio.gather(
+            worker,
+            _coordinate(
+                configuration,
+                fake_backend,
+                work_queue_file,
+                tmp_path,
+                stats,
+                start_delay=0.1,
+            ),
+        ),
+        timeout=10,
+    )
+
+    assert stats.copied == 1
+    assert fake_backend.count("copy") == 1